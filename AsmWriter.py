@@ -0,0 +1,318 @@
+# A Hack assembly backend for the jack compiler.
+#
+# AsmWriter takes the same write_push/write_pop/write_call... calls as
+# VMWriter and buffers a function the same way, then translates it into
+# Hack assembly instead of writing VM text. Knowing the whole function,
+# it fuses the common sequences a generic VM translator handles command
+# by command: constant operands, comparisons followed by a branch,
+# push/pop pairs moving a value. Calls and returns jump to shared
+# routines written once by write_bootstrap().
+
+from VMwriter import VMWriter
+
+
+SEGMENT_BASES = {'local': 'LCL', 'argument': 'ARG', 'this': 'THIS', 'that': 'THAT'}
+BINARY = {'add': 'M=M+D', 'sub': 'M=M-D', 'and': 'M=M&D', 'or': 'M=M|D'}
+UNARY = {'neg': 'M=-M', 'not': 'M=!M'}
+JUMPS = {'eq': 'JEQ', 'gt': 'JGT', 'lt': 'JLT'}
+NEGATED = {'JEQ': 'JNE', 'JGT': 'JLE', 'JLT': 'JGE', 'JNE': 'JEQ'}
+
+# Push D onto the stack.
+PUSH_D = ['@SP', 'AM=M+1', 'A=A-1', 'M=D']
+
+# Pop the stack into D.
+POP_D = ['@SP', 'AM=M-1', 'D=M']
+
+# Highest segment index addressed by incrementing A rather than through D.
+MAX_OFFSET = 3
+
+CALL = '$$CALL'
+RETURN = '$$RETURN'
+HALT = '$$HALT'
+
+
+def write_bootstrap(output):
+    """
+    Write the code every program starts with: set up the stack,
+    call Sys.init, and the call and return routines the functions share.
+
+    :param output: A file object.
+    :return:
+    """
+
+    code = ['@256', 'D=A', '@SP', 'M=D']
+    code += _call('Sys.init', 0, HALT)
+    code += ['@' + HALT, '0;JMP']
+
+    # D = return address, R13 = number of arguments, R14 = callee.
+    code += ['(' + CALL + ')', '@SP', 'A=M', 'M=D']
+    for pointer in ('LCL', 'ARG', 'THIS', 'THAT'):
+        code += ['@' + pointer, 'D=M', '@SP', 'AM=M+1', 'M=D']
+    code += ['@SP', 'MD=M+1', '@LCL', 'M=D', '@5', 'D=D-A', '@R13', 'D=D-M', '@ARG', 'M=D',
+             '@R14', 'A=M', '0;JMP']
+
+    code += ['(' + RETURN + ')', '@5', 'D=A', '@LCL', 'A=M-D', 'D=M', '@R14', 'M=D']
+    code += POP_D + ['@ARG', 'A=M', 'M=D', '@ARG', 'D=M+1', '@SP', 'M=D']
+    for pointer in ('THAT', 'THIS', 'ARG', 'LCL'):
+        code += ['@LCL', 'AM=M-1', 'D=M', '@' + pointer, 'M=D']
+    code += ['@R14', 'A=M', '0;JMP']
+
+    for line in code:
+        output.write(line + '\n')
+
+    return
+
+
+def _call(name, n_args, return_label):
+    """
+    :return: List of strings, the code calling a function through the CALL routine.
+    """
+
+    if n_args <= 1:
+        code = ['@R13', 'M={0}'.format(n_args)]
+    else:
+        code = ['@{0}'.format(n_args), 'D=A', '@R13', 'M=D']
+    code += ['@' + name, 'D=A', '@R14', 'M=D', '@' + return_label, 'D=A',
+             '@' + CALL, '0;JMP', '(' + return_label + ')']
+
+    return code
+
+
+class AsmWriter(VMWriter):
+    """
+    Write Hack assembly for the VM commands of a class.
+    """
+
+    def __init__(self, path, passes=None, track_lines=True):
+        """
+        :param path: Name of the .asm file, or an open file object, e.g.
+                     shared by all the classes of a program.
+        :param passes: See VMWriter.
+        :param track_lines: See VMWriter.
+        """
+
+        super(AsmWriter, self).__init__(path, passes, track_lines)
+
+        # Number of Hack instructions written so far.
+        self.n_instructions = 0
+        self._function = None
+        self._class = None
+        self._labels = 0
+
+    def write_vm(self, vm_code):
+        """
+        Translate existing VM code, e.g. the OS classes.
+
+        :param vm_code: String.
+        :return:
+        """
+
+        for line in vm_code.splitlines():
+            line = line.split('//')[0].strip()
+            if not line:
+                continue
+            if line.startswith('function'):
+                self._flush_function()
+            self._write(' '.join(line.split()) + '\n')
+
+        return
+
+    def _emit(self, code):
+        """
+        Translate and write the code of a function.
+
+        :param code: FunctionCode.
+        :return:
+        """
+
+        for line in self.translate(code.text()):
+            self.vm_file.write(line + '\n')
+            if not line.startswith('('):
+                self.n_instructions += 1
+
+        return
+
+    def translate(self, code):
+        """
+        :param code: List of strings, the VM commands of a function.
+        :return: List of strings, the Hack assembly.
+        """
+
+        commands = [line.split() for line in code]
+        if commands[0][0] == 'function':
+            self._function = commands[0][1]
+            self._class = self._function.split('.')[0]
+            self._labels = 0
+
+        asm = []
+        i = 0
+        while i < len(commands):
+            command = commands[i]
+            op = command[0]
+            following = commands[i + 1:i + 4]
+
+            if op == 'push':
+                if following and following[0][0] == 'pop' and self._address(following[0]) is not None:
+                    # A move, the value never goes through the stack.
+                    asm += self._load(command) + self._address(following[0]) + ['M=D']
+                    i += 2
+                    continue
+                if command[1] == 'constant' and following:
+                    fused = self._constant_operand(int(command[2]), following)
+                    if fused is not None:
+                        asm += fused[0]
+                        i += 1 + fused[1]
+                        continue
+                asm += self._load(command) + PUSH_D
+            elif op == 'pop':
+                address = self._address(command)
+                if address is not None:
+                    asm += POP_D + address + ['M=D']
+                else:
+                    asm += ['@' + command[2], 'D=A', '@' + SEGMENT_BASES[command[1]], 'D=D+M',
+                            '@R13', 'M=D'] + POP_D + ['@R13', 'A=M', 'M=D']
+            elif op in BINARY:
+                asm += POP_D + ['A=A-1', BINARY[op]]
+            elif op in UNARY:
+                if op == 'not' and following and following[0][0] == 'if-goto':
+                    # Jump when the value is not -1, whatever it is.
+                    asm += POP_D + ['D=D+1', '@' + self._label(following[0][1]), 'D;JNE']
+                    i += 2
+                    continue
+                asm += ['@SP', 'A=M-1', UNARY[op]]
+            elif op in JUMPS:
+                branch = self._branch(JUMPS[op], following)
+                if branch is not None:
+                    asm += POP_D + ['@SP', 'AM=M-1', 'D=M-D'] + branch[0]
+                    i += 1 + branch[1]
+                    continue
+                done = self._new_label('cmp')
+                asm += POP_D + ['A=A-1', 'D=M-D', 'M=-1', '@' + done, 'D;' + JUMPS[op],
+                                '@SP', 'A=M-1', 'M=0', '(' + done + ')']
+            elif op == 'label':
+                asm.append('(' + self._label(command[1]) + ')')
+            elif op == 'goto':
+                asm += ['@' + self._label(command[1]), '0;JMP']
+            elif op == 'if-goto':
+                asm += POP_D + ['@' + self._label(command[1]), 'D;JNE']
+            elif op == 'call':
+                asm += _call(command[1], int(command[2]), self._new_label('ret'))
+            elif op == 'function':
+                asm.append('(' + command[1] + ')')
+                n_locals = int(command[2])
+                if n_locals:
+                    asm += ['@SP', 'A=M'] + ['M=0', 'A=A+1'] * n_locals + ['D=A', '@SP', 'M=D']
+            elif op == 'return':
+                asm += ['@' + RETURN, '0;JMP']
+            else:
+                raise ValueError('Unknown VM command {0}'.format(' '.join(command)))
+            i += 1
+
+        return asm
+
+    def _constant_operand(self, constant, following):
+        """
+        Fuse a pushed constant with the command using it.
+
+        :param constant: Int.
+        :param following: List of the split commands after the push.
+        :return: Tuple (code, number of following commands consumed), None
+                 if the constant can not be fused.
+        """
+
+        op = following[0][0]
+        if op in ('add', 'sub') and constant == 1:
+            return ['@SP', 'A=M-1', 'M=M+1' if op == 'add' else 'M=M-1'], 1
+        if op in ('add', 'sub', 'or') and constant == 0:
+            return [], 1
+        if op in BINARY:
+            return ['@{0}'.format(constant), 'D=A', '@SP', 'A=M-1', BINARY[op]], 1
+        if op == 'neg':
+            return ['@{0}'.format(constant), 'D=-A'] + PUSH_D, 1
+        if op in JUMPS:
+            branch = self._branch(JUMPS[op], following[1:])
+            if branch is None:
+                return None
+            if constant == 0:
+                return POP_D + branch[0], 1 + branch[1]
+            return ['@{0}'.format(constant), 'D=A', '@SP', 'AM=M-1', 'D=M-D'] + branch[0], 1 + branch[1]
+
+        return None
+
+    def _branch(self, jump, following):
+        """
+        Turn a comparison followed by a (negated) if-goto into a jump on D,
+        D holding the difference of the compared values.
+
+        :return: Tuple (code, number of following commands consumed), None
+                 if the comparison's value is used otherwise.
+        """
+
+        if following and following[0][0] == 'not':
+            jump = NEGATED[jump]
+            following = following[1:]
+            consumed = 2
+        else:
+            consumed = 1
+        if not following or following[0][0] != 'if-goto':
+            return None
+
+        return ['@' + self._label(following[0][1]), 'D;' + jump], consumed
+
+    def _load(self, command):
+        """
+        :return: List of strings, the code setting D to the value a push command pushes.
+        """
+
+        segment, index = command[1], int(command[2])
+        if segment == 'constant':
+            if index <= 1:
+                return ['D={0}'.format(index)]
+            return ['@{0}'.format(index), 'D=A']
+        if segment in SEGMENT_BASES:
+            base = '@' + SEGMENT_BASES[segment]
+            if index == 0:
+                return [base, 'A=M', 'D=M']
+            if index == 1:
+                return [base, 'A=M+1', 'D=M']
+            return ['@{0}'.format(index), 'D=A', base, 'A=D+M', 'D=M']
+
+        return self._address(command) + ['D=M']
+
+    def _address(self, command):
+        """
+        :return: List of strings, the code setting A to the address a push or
+                 pop command accesses without touching D, None if it needs D.
+        """
+
+        segment, index = command[1], int(command[2])
+        if segment in SEGMENT_BASES:
+            if index > MAX_OFFSET:
+                return None
+            base = '@' + SEGMENT_BASES[segment]
+            if index == 0:
+                return [base, 'A=M']
+            return [base, 'A=M+1'] + ['A=A+1'] * (index - 1)
+        if segment == 'temp':
+            return ['@{0}'.format(5 + index)]
+        if segment == 'pointer':
+            return ['@THAT' if index else '@THIS']
+        if segment == 'static':
+            return ['@{0}.{1}'.format(self._class, index)]
+        if segment == 'constant':
+            return None
+
+        raise ValueError('Unknown segment {0}'.format(segment))
+
+    def _label(self, label):
+        """
+        :return: String. The assembly symbol of a VM label of the current function.
+        """
+
+        return '{0}${1}'.format(self._function, label)
+
+    def _new_label(self, prefix):
+
+        self._labels += 1
+
+        return '{0}${1}.{2}'.format(self._function, prefix, self._labels)
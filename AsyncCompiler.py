@@ -0,0 +1,174 @@
+# Asyncio entry points of the jack compiler.
+#
+# Parsing and code generation are CPU bound and run in an executor (the
+# loop's default thread pool unless another one, e.g. a process pool, is
+# given), file reads and writes run in a separate I/O executor, so the event
+# loop is never blocked by a compilation.
+
+import asyncio
+import os
+
+from CompilationEngine import ParseError
+from JackCompiler import compile_source as _compile_source
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def _write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def _list_sources(path):
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path)
+                      if name.endswith('.jack'))
+    return [path] if path.endswith('.jack') else []
+
+
+class AsyncCompiler(object):
+    """
+    Compile jack classes from asyncio code.
+    """
+
+    def __init__(self, executor=None, io_executor=None, max_in_flight=8):
+        """
+        :param executor: concurrent.futures.Executor running the parsing and
+                         code generation, the loop's default executor if None.
+                         A ProcessPoolExecutor compiles classes in parallel.
+        :param io_executor: Executor running the file reads and writes, the
+                            loop's default executor if None.
+        :param max_in_flight: Int. Maximal number of classes being compiled
+                              at the same time, and of compiled classes a
+                              project stream buffers ahead of its consumer.
+        """
+
+        self.executor = executor
+        self.io_executor = io_executor
+        self.max_in_flight = max_in_flight
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def compile_source(self, source, class_name):
+        """
+        Compile the source code of a class.
+
+        :param source: String. The jack code of the class.
+        :param class_name: String.
+        :return: String. The VM code of the class.
+        :raise ParseError: on syntax errors.
+        """
+
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, _compile_source, source, class_name)
+
+    async def compile_file(self, file_path, output_dir=None):
+        """
+        Compile a single .jack file and write its .vm file.
+
+        :param file_path: String.
+        :param output_dir: String. Directory of the .vm file, the directory
+                           of the source if None.
+        :return: Dict. The result of the class: class_name, path, vm_path,
+                 status ('ok' or 'error'), vm_code, and diagnostics or
+                 message on errors.
+        """
+
+        loop = asyncio.get_running_loop()
+        class_name = os.path.basename(file_path)[:-5]
+        if output_dir is None:
+            output_dir = os.path.dirname(file_path)
+        vm_path = os.path.join(output_dir, class_name + '.vm')
+        result = {'class_name': class_name, 'path': file_path, 'vm_path': None,
+                  'status': 'ok', 'vm_code': None}
+
+        async with self._semaphore:
+            try:
+                source = await loop.run_in_executor(self.io_executor, _read, file_path)
+                vm_code = await loop.run_in_executor(self.executor, _compile_source,
+                                                     source, class_name)
+                await loop.run_in_executor(self.io_executor, _write, vm_path, vm_code)
+            except ParseError as e:
+                result['status'] = 'error'
+                result['diagnostics'] = e.diagnostics
+                result['message'] = str(e)
+                return result
+            except Exception as e:
+                result['status'] = 'error'
+                result['message'] = '{0}: {1}'.format(type(e).__name__, e)
+                return result
+
+        result['vm_code'] = vm_code
+        result['vm_path'] = vm_path
+
+        return result
+
+    async def compile_project(self, path, output_dir=None):
+        """
+        Compile a .jack file or all .jack files of a directory, yielding
+        the result of each class (see compile_file()) as soon as it is
+        ready. At most max_in_flight classes are compiled or waiting for
+        the consumer at any time, and closing or cancelling the stream
+        cancels the compilations still pending.
+
+        :param path: String. A file name or directory name.
+        :param output_dir: String. See compile_file().
+        """
+
+        loop = asyncio.get_running_loop()
+        sources = await loop.run_in_executor(self.io_executor, _list_sources, path)
+        if output_dir is not None:
+            await loop.run_in_executor(self.io_executor,
+                                       lambda: os.makedirs(output_dir, exist_ok=True))
+
+        slots = asyncio.Semaphore(self.max_in_flight)
+        results = asyncio.Queue()
+
+        async def compile_one(file_path):
+            await slots.acquire()
+            await results.put(await self.compile_file(file_path, output_dir))
+
+        tasks = [asyncio.ensure_future(compile_one(file_path)) for file_path in sources]
+        try:
+            for _ in tasks:
+                result = await results.get()
+                # The slot is freed once the consumer took the result.
+                slots.release()
+                yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def compile_project(path, output_dir=None, executor=None, max_in_flight=8):
+    """
+    Stream the results of compiling a file or a directory,
+    see AsyncCompiler.compile_project().
+    """
+
+    compiler = AsyncCompiler(executor, max_in_flight=max_in_flight)
+    async for result in compiler.compile_project(path, output_dir):
+        yield result
+
+
+if __name__ == '__main__':
+    import sys
+    from concurrent.futures import ProcessPoolExecutor
+
+    async def main(path):
+        failed = False
+        with ProcessPoolExecutor() as executor:
+            async for result in compile_project(path, executor=executor):
+                if result['status'] == 'ok':
+                    print(result['class_name'], 'ok', file=sys.stderr)
+                else:
+                    failed = True
+                    print(result['class_name'], result['message'], file=sys.stderr)
+        return failed
+
+    if asyncio.run(main(sys.argv[1])):
+        sys.exit(1)
@@ -0,0 +1,365 @@
+# Batch grading mode for the jack compiler.
+#
+# Compiles many independent projects (e.g. student submissions), each one
+# in its own worker process, so that a broken or pathological submission
+# can neither abort nor stall the whole batch. One JSON record per project
+# is streamed to the report as soon as the project is done.
+
+import json
+import os
+import sys
+import time
+import multiprocessing
+from multiprocessing.connection import wait
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, memory caps are simply not enforced there.
+    resource = None
+
+
+def find_projects(source):
+    """
+    List the projects to be graded.
+
+    :param source: String. Either a manifest file listing one project
+                   directory per line (blank lines and lines starting
+                   with '#' are ignored, relative paths are resolved
+                   against the manifest's directory), or a root directory
+                   whose sub-directories are the projects.
+    :return: List of (project_id, project_path) tuples. The ids are
+             unique relative paths, see _project_id().
+    """
+
+    if os.path.isfile(source):
+        base = os.path.dirname(os.path.abspath(source))
+        projects = []
+        taken = set()
+        with open(source) as f:
+            for line in f:
+                line = line.strip()
+                if line == '' or line.startswith('#'):
+                    continue
+                path = os.path.normpath(os.path.join(base, line))
+                projects.append((_project_id(line, taken), path))
+        return projects
+
+    if not os.path.isdir(source):
+        raise ValueError('No such manifest or directory: {0}'.format(source))
+
+    projects = []
+    for name in sorted(os.listdir(source)):
+        path = os.path.join(source, name)
+        if os.path.isdir(path):
+            projects.append((name, path))
+
+    return projects
+
+
+def _error_record(error, file_name=None):
+    """
+    Build the report record of an exception.
+    Syntax errors also tell where the (first) failure is, so that the
+    grader can point at it.
+
+    :param error: Exception. The exception that stopped the compilation.
+    :param file_name: String. The .jack file being compiled, if known.
+    :return: Dict. Keys 'type' and 'message', plus 'file', 'line' and
+             'column' when they are known.
+    """
+
+    record = {'type': type(error).__name__, 'message': str(error)}
+    if file_name is not None:
+        record['file'] = file_name
+    line = getattr(error, 'line', None)
+    if line is not None:
+        record['line'] = line
+        record['column'] = getattr(error, 'column', None)
+
+    return record
+
+
+def compile_project(project_path, output_dir):
+    """
+    Compile every .jack file of a project into output_dir.
+    A failing file does not stop the remaining files from being compiled.
+
+    :param project_path: String. Directory holding the .jack files.
+    :param output_dir: String. Directory the .xml and .vm files go to.
+    :return: Dict. The result record of the project, without timings
+             of the whole run.
+    """
+    from JackCompiler import _compile
+
+    os.makedirs(output_dir, exist_ok=True)
+    files = []
+    for name in sorted(os.listdir(project_path)):
+        if not name.endswith('.jack'):
+            continue
+        file_result = {'file': name, 'status': 'ok', 'vm_commands': 0}
+        start = time.perf_counter()
+        try:
+            compiler = _compile(os.path.join(project_path, name), output_dir)
+            file_result['vm_commands'] = compiler.writer.n_commands
+        except MemoryError:
+            raise
+        except Exception as e:
+            file_result['status'] = 'error'
+            file_result['error'] = _error_record(e, name)
+            diagnostics = getattr(e, 'diagnostics', None)
+            if diagnostics:
+                file_result['diagnostics'] = [d.to_dict() for d in diagnostics]
+        file_result['elapsed'] = round(time.perf_counter() - start, 6)
+        files.append(file_result)
+
+    errors = [f['error'] for f in files if f['status'] != 'ok']
+    result = {'status': 'error' if errors else 'ok',
+              'files': files,
+              'vm_commands': sum(f['vm_commands'] for f in files)}
+    if errors:
+        result['error'] = errors[0]
+    if not files:
+        result['status'] = 'empty'
+
+    return result
+
+
+def _worker(project_path, output_dir, memory_limit, conn):
+    """
+    Entry point of a worker process, sends the result record back
+    through conn.
+    """
+
+    # The compiler is chatty, keep the report stream clean.
+    sys.stdout = open(os.devnull, 'w')
+    if memory_limit is not None and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    try:
+        result = compile_project(project_path, output_dir)
+    except MemoryError:
+        result = {'status': 'memory', 'error': {'type': 'MemoryError',
+                                                'message': 'Memory limit exceeded'}}
+    except Exception as e:
+        result = {'status': 'crash', 'error': _error_record(e)}
+    conn.send(result)
+    conn.close()
+
+    return
+
+
+def _project_id(line, taken):
+    """
+    Make the id of a manifest entry, which is also the directory its
+    output goes to under the output root: the normalized path of the
+    entry without any drive, root or '..' segment, numbered if an
+    earlier entry already has it.
+
+    :param line: String. The project path as written in the manifest.
+    :param taken: Set of the (lower cased) ids given so far, updated.
+    :return: String.
+    """
+
+    path = os.path.splitdrive(os.path.normpath(line))[1].replace('\\', '/')
+    parts = [part for part in path.split('/') if part not in ('', '.', '..')]
+    base = '/'.join(parts) or 'project'
+
+    # Lower cased, so that ids differing only in case
+    # do not share a directory on case-insensitive file systems.
+    project_id = base
+    number = 1
+    while project_id.lower() in taken:
+        number += 1
+        project_id = '{0}-{1}'.format(base, number)
+    taken.add(project_id.lower())
+
+    return project_id
+
+
+class BatchGrader(object):
+    """
+    Compile a list of projects in a pool of worker processes,
+    one fresh process per project.
+    """
+
+    def __init__(self, output_root, jobs=None, timeout=30.0, memory_limit=None):
+        """
+        :param output_root: String. Root of the output tree, each project
+                            is written to output_root/<project id>.
+        :param jobs: Int. Number of projects compiled at the same time.
+        :param timeout: Float. Seconds a project may take before it is killed.
+        :param memory_limit: Int. Address space cap of a worker in bytes.
+        """
+
+        self.output_root = output_root
+        self.jobs = jobs or os.cpu_count() or 1
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        if 'fork' in multiprocessing.get_all_start_methods():
+            self._context = multiprocessing.get_context('fork')
+        else:
+            self._context = multiprocessing.get_context()
+
+    def grade(self, projects, report):
+        """
+        Grade the given projects, writing one JSON line per
+        project into report as soon as it finishes.
+
+        :param projects: List of (project_id, project_path) tuples.
+        :param report: File object the JSONL records are written to.
+        :return: Dict. Number of projects per status.
+        """
+
+        # Refuse the whole batch before compiling anything.
+        for project_id, _ in projects:
+            self._output_dir(project_id)
+
+        pending = list(enumerate(projects))
+        pending.reverse()
+        running = {}
+        summary = {}
+
+        while pending or running:
+            while pending and len(running) < self.jobs:
+                index, project = pending.pop()
+                worker = self._start(project)
+                running[worker['conn']] = (index, project, worker)
+
+            now = time.monotonic()
+            deadline = min(w['deadline'] for _, _, w in running.values())
+            waitables = list(running.keys())
+            waitables += [w['process'].sentinel for _, _, w in running.values()]
+            wait(waitables, max(0.0, deadline - now))
+
+            for conn in list(running.keys()):
+                index, project, worker = running[conn]
+                record = self._collect(worker)
+                if record is None:
+                    continue
+                del running[conn]
+                record['index'] = index
+                record['project'] = project[0]
+                record['path'] = project[1]
+                summary[record['status']] = summary.get(record['status'], 0) + 1
+                report.write(json.dumps(record, sort_keys=True) + '\n')
+                report.flush()
+
+        return summary
+
+    def _start(self, project):
+        """
+        Spawn the worker process of a project.
+        """
+
+        project_id, project_path = project
+        output_dir = self._output_dir(project_id)
+        receiver, sender = self._context.Pipe(duplex=False)
+        process = self._context.Process(target=_worker,
+                                        args=(project_path, output_dir,
+                                              self.memory_limit, sender))
+        process.daemon = True
+        start = time.monotonic()
+        process.start()
+        sender.close()
+
+        return {'conn': receiver, 'process': process, 'start': start,
+                'deadline': start + self.timeout}
+
+    def _output_dir(self, project_id):
+        """
+        :param project_id: String.
+        :return: String. The directory the output of the project goes to.
+        :raise ValueError: if it is not inside the output root, e.g.
+                           through a symbolic link.
+        """
+
+        root = os.path.realpath(self.output_root)
+        output_dir = os.path.realpath(os.path.join(root, project_id))
+        if output_dir == root or os.path.commonpath([root, output_dir]) != root:
+            raise ValueError('The output of project {0} would be written outside of {1}'.format(
+                project_id, self.output_root))
+
+        return output_dir
+
+    def _collect(self, worker):
+        """
+        Fetch the result record of a worker if it is done, killing it
+        if it went over its time budget.
+
+        :return: Dict or None if the worker is still busy.
+        """
+
+        conn = worker['conn']
+        process = worker['process']
+        record = None
+        if conn.poll():
+            try:
+                record = conn.recv()
+            except EOFError:
+                record = None
+            if record is None:
+                # The worker died without a word.
+                process.join()
+                record = self._dead_record(process)
+        elif not process.is_alive():
+            process.join()
+            record = self._dead_record(process)
+        elif time.monotonic() >= worker['deadline']:
+            process.kill()
+            process.join()
+            record = {'status': 'timeout',
+                      'error': {'type': 'Timeout',
+                                'message': 'Killed after {0} seconds'.format(self.timeout)}}
+        else:
+            return None
+
+        process.join()
+        conn.close()
+        record['elapsed'] = round(time.monotonic() - worker['start'], 6)
+
+        return record
+
+    @staticmethod
+    def _dead_record(process):
+
+        return {'status': 'crash',
+                'error': {'type': 'Crash',
+                          'message': 'Worker exited with code {0}'.format(process.exitcode)}}
+
+
+def grade(source, output_root, report=None, jobs=None, timeout=30.0, memory_limit=None):
+    """
+    Grade all projects found in a manifest or a root directory.
+
+    :param source: String. Manifest file or root directory, see find_projects().
+    :param output_root: String. Root of the output tree.
+    :param report: File object of the JSONL report, defaults to stdout.
+    :return: Dict. Number of projects per status.
+    """
+
+    if report is None:
+        report = sys.stdout
+    grader = BatchGrader(output_root, jobs, timeout, memory_limit)
+
+    return grader.grade(find_projects(source), report)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Compile many jack projects in isolation.')
+    parser.add_argument('source', help='manifest file or root directory of projects')
+    parser.add_argument('-o', '--output', required=True, help='root of the output tree')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes')
+    parser.add_argument('-t', '--timeout', type=float, default=30.0, help='seconds per project')
+    parser.add_argument('-m', '--memory', type=int, default=None, help='memory cap per project in MB')
+    parser.add_argument('-r', '--report', default=None, help='JSONL report file, defaults to stdout')
+    args = parser.parse_args()
+
+    memory = args.memory * 1024 * 1024 if args.memory else None
+    if args.report is None:
+        summary = grade(args.source, args.output, None, args.jobs, args.timeout, memory)
+    else:
+        with open(args.report, 'w') as report_file:
+            summary = grade(args.source, args.output, report_file, args.jobs, args.timeout, memory)
+    print(json.dumps(summary, sort_keys=True), file=sys.stderr)
@@ -0,0 +1,372 @@
+# A vectorized jack lexer for very large sources, built on NumPy.
+#
+# The source is loaded as a uint8 array. Characters are classified with a
+# lookup table, string constants and comments are found from the positions
+# of their delimiters, and token boundaries come out of masks over the
+# whole array at once. Tokens are kept as start, end and kind arrays;
+# lexemes are only turned into Python strings when tokens are written,
+# and keywords and symbols not even then.
+#
+# NumPy is optional: without it available() is False and Tokenizer keeps
+# to its scalar path. On sources the line based Tokenizer reads correctly
+# both give the same tokens; this lexer follows the jack lexical rules,
+# e.g. for /* */ comments within a line.
+
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from Tokenizer import Tokenizer
+
+
+KEYWORD, SYMBOL, INTEGER, STRING, IDENTIFIER = range(5)
+TAGS = ['keyword', 'symbol', 'integerConstant', 'stringConstant', 'identifier']
+
+# Character classes.
+_SPACE, _SYMBOL, _DIGIT, _WORD = range(4)
+
+_ESCAPED = {'<': '&lt;', '>': '&gt;', '&': '&amp;'}
+
+# Longest keyword, keywords are compared on that many bytes.
+_KEYWORD_WIDTH = 16
+
+
+def available():
+    """
+    :return: Bool. Whether NumPy, and so the bulk lexer, can be used.
+    """
+
+    return numpy is not None
+
+
+def _tables():
+    """
+    :return: Tuple (character classes, keyword keys sorted, their keywords).
+    """
+
+    classes = numpy.full(256, _WORD, dtype=numpy.uint8)
+    for c in ' \t\r\n\f\v':
+        classes[ord(c)] = _SPACE
+    for c in Tokenizer.SYMBOLS:
+        classes[ord(c)] = _SYMBOL
+    for c in Tokenizer.INTEGERS:
+        classes[ord(c)] = _DIGIT
+
+    keys = numpy.zeros((len(Tokenizer.KEYWORDS), _KEYWORD_WIDTH), dtype=numpy.uint8)
+    for i, keyword in enumerate(Tokenizer.KEYWORDS):
+        keys[i, :len(keyword)] = numpy.frombuffer(keyword.encode('ascii'), dtype=numpy.uint8)
+    keys = keys.view('S{0}'.format(_KEYWORD_WIDTH)).ravel()
+    order = numpy.argsort(keys)
+
+    return classes, keys[order], [Tokenizer.KEYWORDS[i] for i in order]
+
+
+class Tokens(object):
+    """
+    The tokens of a source, as arrays.
+    """
+
+    def __init__(self, data, starts, ends, kinds, keywords):
+        """
+        :param data: Bytes. The source.
+        :param starts: Array of the offsets of the first byte of every token.
+        :param ends: Array of the offsets right after every token.
+        :param kinds: Array of token kinds, KEYWORD to IDENTIFIER.
+        :param keywords: Array of the index in KEYWORDS of every keyword token.
+        """
+
+        self.data = data
+        self.starts = starts
+        self.ends = ends
+        self.kinds = kinds
+        self.keywords = keywords
+
+    def __len__(self):
+
+        return len(self.starts)
+
+    def lexeme(self, i):
+        """
+        :param i: Int. Index of a token.
+        :return: String. The token as written, without the quotes of strings.
+        """
+
+        start, end = int(self.starts[i]), int(self.ends[i])
+        if self.kinds[i] == STRING:
+            start, end = start + 1, end - 1
+
+        return self.data[start:end].decode('utf-8')
+
+    def positions(self):
+        """
+        :return: List of (line, column) of every token, both 1-based,
+                 columns counted in characters as Tokenizer does.
+        """
+
+        source = numpy.frombuffer(self.data, dtype=numpy.uint8)
+        line_ends = numpy.flatnonzero(source == ord('\n'))
+        lines = numpy.searchsorted(line_ends, self.starts)
+        line_starts = numpy.concatenate([[0], line_ends + 1])[lines]
+        columns = self.starts - line_starts + 1
+        if (source >= 128).any():
+            # Continuation bytes of utf-8 characters are not columns.
+            continuations = numpy.concatenate([[0], numpy.cumsum((source & 0xC0) == 0x80)])
+            columns -= continuations[self.starts] - continuations[line_starts]
+
+        return list(zip((lines + 1).tolist(), columns.tolist()))
+
+    def xml_lines(self):
+        """
+        :return: List of strings, the token lines Tokenizer writes.
+        """
+
+        source = numpy.frombuffer(self.data, dtype=numpy.uint8)
+        lines = numpy.empty(len(self.starts), dtype=object)
+
+        # Keywords and symbols are looked up, by keyword index and by byte.
+        keyword_lines = numpy.array(['    <keyword> {0} </keyword>\n'.format(keyword)
+                                     for keyword in Tokenizer.KEYWORDS], dtype=object)
+        symbol_lines = numpy.empty(256, dtype=object)
+        for c in Tokenizer.SYMBOLS:
+            symbol_lines[ord(c)] = '    <symbol> {0} </symbol>\n'.format(_ESCAPED.get(c, c))
+        keywords = self.kinds == KEYWORD
+        lines[keywords] = keyword_lines[self.keywords[keywords]]
+        symbols = self.kinds == SYMBOL
+        lines[symbols] = symbol_lines[source[self.starts[symbols]]]
+
+        # Only the other lexemes are materialized. Offsets are
+        # in bytes, they index the text if it is all ascii.
+        others = numpy.flatnonzero(~keywords & ~symbols)
+        if (source >= 128).any():
+            lines[others] = ['    <{0}> {1} </{0}>\n'.format(TAGS[self.kinds[i]], self.lexeme(i)) for i in others]
+        else:
+            text = self.data.decode('ascii')
+            strings = self.kinds[others] == STRING
+            starts = (self.starts[others] + strings).tolist()
+            ends = (self.ends[others] - strings).tolist()
+            tags = numpy.array(TAGS, dtype=object)[self.kinds[others]].tolist()
+            lines[others] = ['    <{0}> {1} </{0}>\n'.format(tag, text[start:end])
+                             for tag, start, end in zip(tags, starts, ends)]
+
+        return lines.tolist()
+
+
+def _regions(source, quotes, line_ends):
+    """
+    Find the string constants and the comments.
+
+    :param source: uint8 array.
+    :param quotes: Array of the offsets of the '"' characters.
+    :param line_ends: Array of the offsets of the line breaks.
+    :return: Tuple of arrays (string starts, string ends, comment starts, comment ends).
+    """
+
+    slash = source[:-1] == ord('/')
+    line_comments = numpy.flatnonzero(slash & (source[1:] == ord('/')))
+    block_comments = numpy.flatnonzero(slash & (source[1:] == ord('*')))
+    block_ends = numpy.flatnonzero((source[:-1] == ord('*')) & (source[1:] == ord('/'))) + 2
+
+    # Only the openers are looked at one by one, skipping
+    # those inside a string or comment found before.
+    openers = numpy.concatenate([quotes, line_comments, block_comments])
+    opener_kinds = numpy.concatenate([numpy.zeros(len(quotes), dtype=numpy.int8),
+                                      numpy.ones(len(line_comments), dtype=numpy.int8),
+                                      numpy.full(len(block_comments), 2, dtype=numpy.int8)])
+    order = numpy.argsort(openers, kind='stable')
+    size = len(source)
+
+    strings = ([], [])
+    comments = ([], [])
+    position = 0
+    for start, kind in zip(openers[order].tolist(), opener_kinds[order].tolist()):
+        if start < position:
+            continue
+        # The source ends with a line break, every line has an end.
+        line_end = int(line_ends[numpy.searchsorted(line_ends, start)])
+        if kind == 0:
+            i = numpy.searchsorted(quotes, start, side='right')
+            close = int(quotes[i]) if i < len(quotes) else size
+            if close < line_end:
+                strings[0].append(start)
+                strings[1].append(close + 1)
+                position = close + 1
+            else:
+                # Unterminated, dropped like Tokenizer does.
+                comments[0].append(start)
+                comments[1].append(line_end)
+                position = line_end
+        else:
+            if kind == 1:
+                end = line_end
+            else:
+                # '/*/' does not close, '/**/' does.
+                i = numpy.searchsorted(block_ends, start + 4)
+                end = int(block_ends[i]) if i < len(block_ends) else size
+            comments[0].append(start)
+            comments[1].append(end)
+            position = end
+
+    return tuple(numpy.array(offsets, dtype=numpy.int64) for offsets in strings + comments)
+
+
+def _mask(size, starts, ends):
+    """
+    :return: Bool array, True on the regions [starts[i], ends[i]).
+    """
+
+    delta = numpy.zeros(size + 1, dtype=numpy.int32)
+    delta[starts] += 1
+    delta[ends] -= 1
+
+    return numpy.cumsum(delta[:-1]) > 0
+
+
+def lex(data):
+    """
+    :param data: Bytes. A jack source.
+    :return: Tokens.
+    """
+
+    if numpy is None:
+        raise RuntimeError('The bulk lexer needs numpy')
+
+    classes, keyword_keys, keyword_order = _tables()
+    # A line break at the end spares the checks for the last line.
+    data = bytes(data)
+    source = numpy.frombuffer(data + b'\n', dtype=numpy.uint8)
+    size = len(source)
+    quotes = numpy.flatnonzero(source == ord('"'))
+    line_ends = numpy.flatnonzero(source == ord('\n'))
+
+    string_starts, string_ends, comment_starts, comment_ends = _regions(source, quotes, line_ends)
+    skipped = _mask(size, comment_starts, comment_ends) | _mask(size, string_starts, string_ends)
+
+    char_classes = classes[source]
+    word = ((char_classes == _DIGIT) | (char_classes == _WORD)) & ~skipped
+    before = numpy.concatenate([[False], word[:-1]])
+    after = numpy.concatenate([word[1:], [False]])
+    word_starts = numpy.flatnonzero(word & ~before)
+    word_ends = numpy.flatnonzero(word & ~after) + 1
+    symbols = numpy.flatnonzero((char_classes == _SYMBOL) & ~skipped)
+
+    starts = numpy.concatenate([word_starts, symbols, string_starts])
+    ends = numpy.concatenate([word_ends, symbols + 1, string_ends])
+    kinds = numpy.concatenate([
+        numpy.where(char_classes[word_starts] == _DIGIT, INTEGER, IDENTIFIER).astype(numpy.int8),
+        numpy.full(len(symbols), SYMBOL, dtype=numpy.int8),
+        numpy.full(len(string_starts), STRING, dtype=numpy.int8)])
+    order = numpy.argsort(starts, kind='stable')
+    starts, ends, kinds = starts[order], ends[order], kinds[order]
+
+    # Keywords: identifiers whose padded bytes are a keyword key.
+    keywords = numpy.zeros(len(starts), dtype=numpy.int8)
+    candidates = numpy.flatnonzero((kinds == IDENTIFIER) & (ends - starts <= _KEYWORD_WIDTH))
+    if len(candidates):
+        offsets = starts[candidates, None] + numpy.arange(_KEYWORD_WIDTH)
+        padded = numpy.where(offsets < ends[candidates, None], source[numpy.minimum(offsets, size - 1)], 0)
+        keys = numpy.ascontiguousarray(padded, dtype=numpy.uint8).view('S{0}'.format(_KEYWORD_WIDTH)).ravel()
+        found = numpy.minimum(numpy.searchsorted(keyword_keys, keys), len(keyword_keys) - 1)
+        hits = keyword_keys[found] == keys
+        kinds[candidates[hits]] = KEYWORD
+        index = dict((keyword, i) for i, keyword in enumerate(Tokenizer.KEYWORDS))
+        keyword_index = numpy.array([index[keyword] for keyword in keyword_order], dtype=numpy.int8)
+        keywords[candidates[hits]] = keyword_index[found[hits]]
+
+    return Tokens(data, starts, ends, kinds, keywords)
+
+
+def tokenize(data, output, positions=None):
+    """
+    Write the tokens of a source the way Tokenizer.tokenize_lines() does.
+
+    :param data: Bytes. A jack source.
+    :param output: File object, into which the tokens are written.
+    :param positions: List, receives the (line, column) of each token.
+    :return:
+    """
+
+    tokens = lex(data)
+    output.write('<tokens>\n')
+    output.write(''.join(tokens.xml_lines()))
+    output.write('</tokens>')
+    if positions is not None:
+        positions.extend(tokens.positions())
+
+    return
+
+
+def benchmark(paths, repeat=3):
+    """
+    Tokenize sources with Tokenizer and with the bulk lexer.
+
+    :param paths: List of strings, .jack files.
+    :param repeat: Int. The best of that many runs is kept.
+    :return: List of dicts, per file its size, both times and
+             whether both wrote the same tokens.
+    """
+    import io
+
+    rows = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+        lines = data.decode('utf-8').splitlines(True)
+
+        def scalar():
+            output = io.StringIO()
+            positions = []
+            Tokenizer.tokenize_lines(lines, output, positions)
+            return output.getvalue(), positions
+
+        def bulk():
+            output = io.StringIO()
+            positions = []
+            tokenize(data, output, positions)
+            return output.getvalue(), positions
+
+        row = {'file': path, 'bytes': len(data)}
+        for name, run in (('scalar', scalar), ('bulk', bulk)):
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                result = run()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            row[name] = best
+            row[name + '_result'] = result
+        row['same'] = row.pop('scalar_result') == row.pop('bulk_result')
+        rows.append(row)
+
+    return rows
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+    import sys
+
+    parser = argparse.ArgumentParser(description='Compare the bulk lexer with Tokenizer.')
+    parser.add_argument('paths', nargs='+', help='.jack files or directories')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='runs per file, the best is kept')
+    args = parser.parse_args()
+    if not available():
+        parser.error('numpy is not installed')
+
+    files = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.jack')))
+        else:
+            files.append(path)
+
+    rows = benchmark(files, args.repeat)
+    print('{0:40} {1:>10} {2:>9} {3:>9} {4:>8}  same'.format('file', 'bytes', 'scalar', 'bulk', 'speedup'))
+    for row in rows:
+        print('{0:40} {1:>10} {2:>8.3f}s {3:>8.3f}s {4:>7.1f}x  {5}'.format(
+            row['file'][-40:], row['bytes'], row['scalar'], row['bulk'], row['scalar'] / row['bulk'],
+            'yes' if row['same'] else 'NO'))
+    if not all(row['same'] for row in rows):
+        sys.exit(1)
@@ -1,9 +1,15 @@
 # This is the jack language compilation engine
 
 import re
+from xml.sax.saxutils import escape, quoteattr
+
 from SymbolTable import SymbolTable
 
 
+# Suffix of the parse tree written next to a token file.
+TREE_SUFFIX = '.tree.xml'
+
+
 def compile_file(file):
     """
     Compile a given file or a whole directory.
@@ -22,28 +28,177 @@ def compile_file(file):
     return
 
 
-def _compile_file(file_path):
+def _compile_file(file_path, output_path=None):
     """
-    Compile a single file
-    :param file_path: string
+    Compile a single token file into a parse tree, written while it is parsed.
+    :param file_path: string, a .xml file of tokens.
+    :param output_path: string, where to write the tree, by default
+                        the token file name ending in TREE_SUFFIX.
     :return:
+    :raise ValueError: if the tree would overwrite the token file.
     """
-    if not file_path.endswith('.xml'):
+    import os
+    if not file_path.endswith('.xml') or file_path.endswith(TREE_SUFFIX):
         return
+    if output_path is None:
+        output_path = file_path[:-len('.xml')] + TREE_SUFFIX
+    if os.path.exists(output_path) and os.path.samefile(file_path, output_path):
+        raise ValueError('The parse tree would overwrite the tokens of {0}'.format(file_path))
 
     with open(file_path) as f:
         tokens = f.readlines()
-        # Ignore the '<tokens>' signature
-        compiler = CompilationEngine(tokens[1:-1])
-        result = compiler.get_result()
 
-    # Write the result into .xml file
-    with open(file_path[0:file_path.find('.')] + '.xml', 'w') as output:
-        result = '\n'.join(result)
-        output.write(result)
+    with open(output_path, 'w') as output:
+        writer = XmlWriter(output)
+        # Ignore the '<tokens>' signature
+        compiler = CompilationEngine(tokens[1:-1], output=writer)
+        compiler.get_result()
+        writer.close()
     return
 
 
+class XmlWriter(object):
+    """
+    Write the compiled lines of a CompilationEngine as indented, escaped
+    XML while they are produced, instead of keeping them in a list.
+
+    Lines are held until the grammar rule they belong to closes. Symbol
+    table tags such as <VAR int 0> become <identifier> elements with
+    kind, type and index attributes.
+    """
+
+    def __init__(self, file):
+        """
+        :param file: File object open for writing.
+        """
+        self.file = file
+        self.n_lines = 0
+        self._depth = 0
+        self._pending = []
+        self._identifier_tags = {}
+
+    def __len__(self):
+
+        return self.n_lines
+
+    def append(self, line):
+        """
+        :param line: String. A rule tag or a token line of the engine.
+        :return:
+        """
+        line = line.strip()
+        self.n_lines += 1
+
+        if ' ' in line:
+            # A token.
+            end = line.index('>')
+            tag = line[1:end]
+            token = line[end + 2:-len(tag) - 4]
+            if ' ' in tag:
+                line = self._identifier_tag(tag) + ' ' + token + ' </identifier>'
+            elif tag == 'stringConstant':
+                # Other tokens cannot hold special characters,
+                # the tokenizer already escapes symbols.
+                line = '<{0}> {1} </{0}>'.format(tag, escape(token, {'"': '&quot;'}))
+            self._pending.append('  ' * self._depth + line + '\n')
+        elif line.startswith('</'):
+            self._depth -= 1
+            self._pending.append('  ' * self._depth + line + '\n')
+            self._write()
+        else:
+            self._pending.append('  ' * self._depth + line + '\n')
+            self._depth += 1
+
+        return
+
+    def _identifier_tag(self, tag):
+        """
+        :param tag: String. A symbol table tag, kind, type and index.
+        :return: String. The opening <identifier> tag.
+        """
+        identifier_tag = self._identifier_tags.get(tag)
+        if identifier_tag is None:
+            kind, var_type, index = tag.split(' ')
+            identifier_tag = self._identifier_tags[tag] = '<identifier kind={0} type={1} index={2}>'.format(
+                quoteattr(kind), quoteattr(var_type), quoteattr(index))
+
+        return identifier_tag
+
+    def _write(self):
+
+        self.file.write(''.join(self._pending))
+        self._pending = []
+
+        return
+
+    def close(self):
+        """
+        Write the lines still held.
+        :return:
+        """
+        self._write()
+
+        return
+
+
+class Diagnostic(object):
+    """
+    A syntax error found by the compilation engine.
+    """
+
+    def __init__(self, message, line=None, column=None, token=None):
+        """
+        :param message: String. What went wrong.
+        :param line: Int. 1-based line of the offending token, None if unknown.
+        :param column: Int. 1-based column of the offending token, None if unknown.
+        :param token: String. The offending token.
+        """
+        self.message = message
+        self.line = line
+        self.column = column
+        self.token = token
+
+    def to_dict(self):
+        """
+        :return: Dict. The diagnostic as plain data.
+        """
+        return {'message': self.message, 'line': self.line,
+                'column': self.column, 'token': self.token}
+
+    def __str__(self):
+        if self.line is None:
+            return self.message
+        return '{0}:{1}: {2}'.format(self.line, self.column, self.message)
+
+    def __repr__(self):
+        return 'Diagnostic({0!r})'.format(str(self))
+
+
+class ParseError(ValueError):
+    """
+    Raised on a syntax error, carrying every diagnostic found
+    in the compiled class.
+    """
+
+    def __init__(self, diagnostics):
+        """
+        :param diagnostics: List of Diagnostic, the first one is the message.
+        """
+        super(ParseError, self).__init__(diagnostics[0].message)
+        self.diagnostics = diagnostics
+
+    def __reduce__(self):
+        return ParseError, (self.diagnostics,)
+
+    @property
+    def line(self):
+        return self.diagnostics[0].line
+
+    @property
+    def column(self):
+        return self.diagnostics[0].column
+
+
 class CompilationEngine(object):
 
     SUBROUTINE_TYPE = ['function', 'method', 'constructor']
@@ -56,19 +211,55 @@ class CompilationEngine(object):
     IF_STATEMENTS = ['if', 'else']
     KEYWORD_CONST = ['true', 'false', 'null', 'this']
     TERM_TYPE = ['identifier', 'keyword', 'integerConstant', 'stringConstant']
+    DECLARATIONS = CLASS_VAR_TYPE + SUBROUTINE_TYPE
     _TAG_CLEANER = re.compile('<.*?>')
+    _OPEN_BRACE = '<symbol> { </symbol>'
+    _CLOSE_BRACE = '<symbol> } </symbol>'
+    _OPEN_PARENTHESIS = '<symbol> ( </symbol>'
+    _CLOSE_PARENTHESIS = '<symbol> ) </symbol>'
 
-    def __init__(self, input_tokens):
+    def __init__(self, input_tokens, positions=None, recover=False, skeleton=False,
+                 verbose=True, output=None):
         """
         :param input_tokens: A list of strings, each of which stands for a token
                             generated by a tokenizer
+        :param positions: A list of (line, column) of each token, used to
+                          locate syntax errors.
+        :param recover: Bool. If set, syntax errors are recorded in
+                        self.diagnostics and parsing resumes at the next
+                        statement or declaration instead of raising.
+        :param skeleton: Bool. If set, only the declarations are parsed.
+                         Subroutine bodies are skipped by matching their
+                         braces and can be parsed later, see parse_subroutine().
+        :param verbose: Bool. Whether to print every token eaten.
+        :param output: List, or an object with append() and len() such as
+                       XmlWriter, receiving the compiled lines. A new list
+                       by default.
         """
         self.token_list = input_tokens
+        self.positions = positions
+        self.recover = recover
+        self.skeleton = skeleton
+        self.verbose = verbose
+        self.diagnostics = []
+        self._end_reported = False
         self.num_tokens_left = len(input_tokens)
         self.current_token = 0
-        self.compilation_result = []
+        self.compilation_result = output if output is not None else []
         self.symbol_table = SymbolTable()
 
+        # Index in compilation_result of every token line
+        # to the (line, column) of the token.
+        self.result_positions = {}
+
+        # The declarations of the class, see outline().
+        self.class_name = None
+        self.class_vars = []
+        self.subroutines = []
+
+        # Subroutines parsed on demand, by name.
+        self._parsed_subroutines = {}
+
     def compile_class(self):
         """
         Compile a whole class. This method will be invoked
@@ -76,29 +267,48 @@ class CompilationEngine(object):
         """
      
         if self._get_the_token() != 'class':
-            raise ValueError('Missing keyword <class>')
+            raise self._error('Missing keyword <class>')
             
         self.compilation_result.append('<class>')
         
         # Compile class head.
         self._eat('class')
         if self._get_the_token_type() != 'identifier':
-            raise ValueError('An identifier must be followed by a class declaration')
+            raise self._error('An identifier must be followed by a class declaration')
+        self.class_name = self._get_the_token()
         self._eat(self._get_the_token())
         self._eat('{')
 
         # Compile the class body recursively
         while True:
             the_token = self._get_the_token()
+            declaration_start = self.current_token
+
+            try:
+                if the_token in self.CLASS_VAR_TYPE:
+                    self.compile_class_var_dec()
+
+                elif the_token in self.SUBROUTINE_TYPE:
+                    self.compile_subroutine_dec()
+
+                elif self.recover and not self._at_last_token():
+                    if the_token == '}' and self.diagnostics:
+                        # A brace left over by an earlier error.
+                        self._synchronize_declaration()
+                        continue
+                    raise self._error('Expected a class variable or subroutine declaration')
+
+                else:
+                    break
+            except ParseError as e:
+                if not self.recover:
+                    raise
+                self._report(e)
+                if self.current_token >= len(self.token_list):
+                    # Nothing is left to recover at.
+                    return self.compilation_result
+                self._synchronize_declaration(declaration_start)
 
-            if the_token in self.CLASS_VAR_TYPE:
-                self.compile_class_var_dec()
-
-            elif the_token in self.SUBROUTINE_TYPE:
-                self.compile_subroutine_dec()
-
-            else:
-                break
         self._eat('}')
         self.compilation_result.append('</class>')
 
@@ -120,7 +330,7 @@ class CompilationEngine(object):
             var_type = self._get_the_token()
             self._eat(self._get_the_token())
         else:
-            raise ValueError('Variable type should be specified')
+            raise self._error('Variable type should be specified')
         
         # Compile the variable(s) declared.
         while self._get_the_token() != ';':
@@ -130,14 +340,15 @@ class CompilationEngine(object):
 
                 # Define it in symbol table
                 self.symbol_table.define(var_name, var_type, var_kind)
+                self.class_vars.append((var_kind, var_type, var_name))
 
             else:
-                raise ValueError('Illegal variable name!')
+                raise self._error('Illegal variable name!')
             
             if self._get_the_token() == ',':
                 self._eat(',')
             elif self._get_the_token() != ';':
-                raise ValueError('Variable names must separated by comma')
+                raise self._error('Variable names must separated by comma')
         self._eat(';')
         
         self.compilation_result.append('</classVarDec>')
@@ -154,34 +365,48 @@ class CompilationEngine(object):
 
         self.compilation_result.append('<subroutineDec>')
 
-        is_method = self._get_the_token() == 'method'
+        start = self.current_token
+        kind = self._get_the_token()
+        is_method = kind == 'method'
         self._eat(self._get_the_token())
         self.symbol_table.drop_method_table(is_method)
         
         # Then token after the subroutine signature should be
         # the return type of the subroutine
         if (self._get_the_token() in self.PRIMITIVE_RETURN_TYPE) or (self._get_the_token_type() == 'identifier'):
+            return_type = self._get_the_token()
             self._eat(self._get_the_token())
         
         else:
-            raise ValueError('Illegal return type!')
+            raise self._error('Illegal return type!')
         
         if self._get_the_token_type() == 'identifier':
+            name = self._get_the_token()
             self._eat(self._get_the_token())
         else:
-            raise ValueError('Illegal function name!')
+            raise self._error('Illegal function name!')
         
         # Compile the subroutine's parameters
         # and the parenthesis.
         self._eat('(')
         self.compile_parameter_list()
         self._eat(')')
+        arguments = sorted(self.symbol_table._method_table_arg.items(), key=lambda item: item[1][2])
+        parameters = [(info[0], arg_name) for arg_name, info in arguments]
         
         # Compile the subroutine's body
         # and the wrapping curly brackets.
-        self.compile_subroutine_body()
+        body = self.current_token
+        if self.skeleton:
+            self.skip_subroutine_body()
+        else:
+            self.compile_subroutine_body()
         self.compilation_result.append('</subroutineDec>')
 
+        self.subroutines.append({'kind': kind, 'return_type': return_type, 'name': name,
+                                 'parameters': parameters, 'span': (start, self.current_token),
+                                 'body': (body, self.current_token)})
+
         return
         
     def compile_subroutine_body(self):
@@ -201,7 +426,7 @@ class CompilationEngine(object):
             self.compilation_result.append('</varDec>')
         
         if self._get_the_token() not in self.STATEMENTS_TYPES:
-            raise ValueError('There is no statement in this subroutine!')
+            raise self._error('There is no statement in this subroutine!')
         self.compile_statements()
         
         self._eat('}')
@@ -209,6 +434,70 @@ class CompilationEngine(object):
         
         return
 
+    def skip_subroutine_body(self):
+        """
+        Skip a subroutine's body, up to and including its closing
+        curly bracket, without parsing it.
+        """
+        if self._get_the_token() != '{':
+            raise self._error('No { to eat')
+
+        # Match the braces on the raw token lines, a brace
+        # inside a string constant does not match a symbol.
+        depth = 0
+        for i in range(self.current_token, len(self.token_list)):
+            token = self.token_list[i].strip()
+            if token == self._OPEN_BRACE:
+                depth += 1
+            elif token == self._CLOSE_BRACE:
+                depth -= 1
+                if not depth:
+                    break
+        else:
+            raise self._error('Unbalanced braces in subroutine body')
+
+        self.current_token = i + 1
+        self.num_tokens_left = len(self.token_list) - self.current_token
+
+        return
+
+    def parse_subroutine(self, name):
+        """
+        Parse a subroutine on demand, e.g. one whose body
+        a skeleton parse skipped. The result is cached.
+
+        :param name: String. Name of the subroutine.
+        :return: List of strings of compiled tokens of the subroutine declaration.
+        :raise KeyError: if the class has no such subroutine.
+        """
+        if name not in self._parsed_subroutines:
+            spans = dict((subroutine['name'], subroutine['span']) for subroutine in self.subroutines)
+            start, end = spans[name]
+            positions = self.positions[start:end] if self.positions is not None else None
+
+            # The subroutine sees the class variables of the class.
+            engine = CompilationEngine(self.token_list[start:end], positions,
+                                       verbose=self.verbose)
+            engine.symbol_table._class_table = dict(self.symbol_table._class_table)
+            engine.symbol_table._class_indices = dict(self.symbol_table._class_indices)
+            engine.compile_subroutine_dec()
+            self._parsed_subroutines[name] = engine.compilation_result
+
+        return self._parsed_subroutines[name]
+
+    def outline(self):
+        """
+        The declarations of the class compiled, e.g. by a skeleton parse.
+
+        :return: Dict of the class name, its class variables as tuples
+                 (kind, type, name) and its subroutines as dicts of kind,
+                 return_type, name, parameters as tuples (type, name), the
+                 token span of the declaration and that of its body.
+        """
+
+        return {'class': self.class_name, 'class_vars': list(self.class_vars),
+                'subroutines': list(self.subroutines)}
+
     def compile_parameter_list(self):
         """
         Compile a (list of) parameters.
@@ -224,18 +513,18 @@ class CompilationEngine(object):
                 var_type = self._get_the_token()
                 self._eat(self._get_the_token())
             else:
-                raise ValueError('Illegal parameter type.')
+                raise self._error('Illegal parameter type.')
 
             if self._get_the_token_type() == 'identifier':
                 var_name = self._get_the_token()
                 self._eat(self._get_the_token())
             else:
-                raise ValueError('Illegal parameter name!')
+                raise self._error('Illegal parameter name!')
             
             if self._get_the_token() == ',':
                 self._eat(',')
             elif self._get_the_token() != ')':
-                raise ValueError('Parameters must be separated by commas!')
+                raise self._error('Parameters must be separated by commas!')
 
             self.symbol_table.define(var_name, var_type, var_kind)
         
@@ -256,10 +545,10 @@ class CompilationEngine(object):
             var_type = self._get_the_token()
             self._eat(self._get_the_token())
         else:
-            raise ValueError('Illegal variable type!')
+            raise self._error('Illegal variable type!')
         while self._get_the_token() != ';':
             if self._get_the_token_type() != 'identifier':
-                raise ValueError('Illegal variable name!')
+                raise self._error('Illegal variable name!')
             else:
                 var_name = self._get_the_token()
                 self.symbol_table.define(var_name, var_type, var_kind)
@@ -276,18 +565,29 @@ class CompilationEngine(object):
         Compile a sequence of statements, not including the enclosing curly brackets.
         """
         self.compilation_result.append('<statements>')
-        while self._get_the_token() in self.STATEMENTS_TYPES:
+        while True:
             the_token = self._get_the_token()
-            if the_token == 'do':
-                self.compile_do()
-            if the_token == 'let':
-                self.compile_let()
-            if the_token == 'while':
-                self.compile_while()
-            if the_token == 'if':
-                self.compile_if()
-            if the_token == 'return':
-                self.compile_return()
+            try:
+                if the_token == 'do':
+                    self.compile_do()
+                elif the_token == 'let':
+                    self.compile_let()
+                elif the_token == 'while':
+                    self.compile_while()
+                elif the_token == 'if':
+                    self.compile_if()
+                elif the_token == 'return':
+                    self.compile_return()
+                elif (self.recover and the_token != '}' and
+                      the_token not in self.DECLARATIONS and not self._at_last_token()):
+                    raise self._error('Expected a statement')
+                else:
+                    break
+            except ParseError as e:
+                if not self.recover:
+                    raise
+                self._report(e)
+                self._synchronize_statement()
         self.compilation_result.append('</statements>')
             
         return
@@ -340,9 +640,7 @@ class CompilationEngine(object):
         """
         self.compilation_result.append('<whileStatement>')
         self._eat('while')
-        self._eat('(')
-        self.compile_expression()
-        self._eat(')')
+        self._compile_condition()
         self._eat('{')
         self.compile_statements()
         self._eat('}')
@@ -375,9 +673,7 @@ class CompilationEngine(object):
 
                 # 'if' clause has expression conditions
                 if clause == 'if':
-                    self._eat('(')
-                    self.compile_expression()
-                    self._eat(')')
+                    self._compile_condition()
 
                 self._eat('{')
                 self.compile_statements()
@@ -385,77 +681,147 @@ class CompilationEngine(object):
         self.compilation_result.append('</ifStatement>')
         return
 
+    def _compile_condition(self):
+        """
+        Compile the parenthesized condition of a while or if statement.
+        In recovery mode an error inside the condition skips to its
+        closing ')', so that the block after it is still parsed as
+        the block of the statement.
+        """
+        start = self.current_token
+        self._eat('(')
+        try:
+            self.compile_expression()
+            self._eat(')')
+        except ParseError as e:
+            if not self.recover:
+                raise
+            self._report(e)
+            self._synchronize_condition(start)
+
+        return
+
     def compile_expression(self):
         """
         Compile an expression.
         """
-        self.compilation_result.append('<expression>')
-        while True:
-            self.compile_term()
-            if self._get_the_token() in self.OPS:
-                self._eat(self._get_the_token())
-            else:
-                break
-
-        self.compilation_result.append('</expression>')
+        self._compile_expressions(self._EXPRESSION)
         return
 
     def compile_term(self):
         """
         Compile a term.
         """
-        the_token = self._get_the_token()
-        the_type = self._get_the_token_type()
-        self.compilation_result.append('<term>')
+        self._compile_expressions(self._TERM)
+        return
 
-        if (the_type in ['identifier', 'integerConstant', 'stringConstant'] or
-                the_token in self.KEYWORD_CONST):
+    def compile_expression_list(self):
+        """
+        Compile a list of expressions.
+        Typically in a subroutine call.
+        """
+        self._compile_expressions(self._EXPRESSION_LIST)
+        return
 
-            self._eat(the_token)
+    # Steps of _compile_expressions().
+    _EXPRESSION, _EXPRESSION_REST, _TERM, _TERM_END, _EXPRESSION_LIST, _EXPRESSION_LIST_REST, \
+        _LIST_COMMA = range(7)
+
+    def _compile_expressions(self, start):
+        """
+        Compile an expression, a term or an expression list without
+        recursion: what is left to do of every enclosing construct is
+        kept on an explicit stack of steps, so the nesting depth of
+        expressions is only limited by memory.
+
+        :param start: _EXPRESSION, _TERM or _EXPRESSION_LIST.
+        """
+        result = self.compilation_result
+        stack = [start]
+        while stack:
+            step = stack.pop()
+
+            if step == self._EXPRESSION:
+                result.append('<expression>')
+                stack.append(self._EXPRESSION_REST)
+                stack.append(self._TERM)
+
+            elif step == self._EXPRESSION_REST:
+                # Jack has no precedence, the terms are taken left to right.
+                if self._get_the_token() in self.OPS:
+                    self._eat(self._get_the_token())
+                    stack.append(self._EXPRESSION_REST)
+                    stack.append(self._TERM)
+                else:
+                    result.append('</expression>')
+
+            elif step == self._TERM:
+                the_token = self._get_the_token()
+                the_type = self._get_the_token_type()
+                result.append('<term>')
+                stack.append(self._TERM_END)
+
+                if (the_type in ['identifier', 'integerConstant', 'stringConstant'] or
+                        the_token in self.KEYWORD_CONST):
+
+                    self._eat(the_token)
+
+                    # May be addressing an array element
+                    if self._get_the_token() == '[':
+                        self._eat('[')
+                        stack.append(']')
+                        stack.append(self._EXPRESSION)
+
+                    # May be a subroutine call
+                    elif self._get_the_token() == '(':
+                        self._eat('(')
+                        stack.append(')')
+                        stack.append(self._EXPRESSION_LIST)
+                    elif self._get_the_token() == '.':
+                        self._eat('.')
+                        self._eat(self._get_the_token())
+                        self._eat('(')
+                        stack.append(')')
+                        stack.append(self._EXPRESSION_LIST)
+
+                elif the_token == '(':
+                    self._eat('(')
+                    stack.append(')')
+                    stack.append(self._EXPRESSION)
 
-            # May be addressing an array element
-            if self._get_the_token() == '[':
-                self._eat('[')
-                self.compile_expression()
-                self._eat(']')
+                elif the_token in self.UNARY_OP:
+                    self._eat(the_token)
+                    stack.append(self._TERM)
 
-            # May be a subroutine call
-            elif self._get_the_token() == '(':
-                self._eat('(')
-                self.compile_expression_list()
-                self._eat(')')
-            elif self._get_the_token() == '.':
-                self._eat('.')
-                self._eat(self._get_the_token())
-                self._eat('(')
-                self.compile_expression_list()
-                self._eat(')')
+                else:
+                    raise self._error('Expected a term')
 
-        elif the_token == '(':
-            self._eat('(')
-            self.compile_expression()
-            self._eat(')')
+            elif step == self._TERM_END:
+                result.append('</term>')
 
-        if the_token in self.UNARY_OP:
-            self._eat(the_token)
-            self.compile_term()
+            elif step == self._EXPRESSION_LIST:
+                result.append('<expressionList>')
+                stack.append(self._EXPRESSION_LIST_REST)
 
-        self.compilation_result.append('</term>')
-        return
+            elif step == self._EXPRESSION_LIST_REST:
+                if self._get_the_token() != ')':
+                    stack.append(self._EXPRESSION_LIST_REST)
+                    stack.append(self._LIST_COMMA)
+                    stack.append(self._EXPRESSION)
+                else:
+                    result.append('</expressionList>')
+
+            elif step == self._LIST_COMMA:
+                # The comma after an expression of a list, if any.
+                if self._get_the_token() == ',':
+                    self._eat(',')
+
+            else:
+                # A closing bracket or parenthesis.
+                self._eat(step)
 
-    def compile_expression_list(self):
-        """
-        Compile a list of expressions.
-        Typically in a subroutine call.
-        """
-        self.compilation_result.append('<expressionList>')
-        while self._get_the_token() != ')':
-            self.compile_expression()
-            if self._get_the_token() == ',':
-                self._eat(',')
-        self.compilation_result.append('</expressionList>')
         return
-        
+
     def _eat(self, token):
         """
         :param token: String
@@ -465,9 +831,10 @@ class CompilationEngine(object):
         Raise Value Error if the given token does not match
         the current token.
         """
-        print(self._get_the_token())
+        if self.verbose:
+            print(self._get_the_token())
         if self._get_the_token() != token:
-            raise ValueError('No {0} to eat'.format(token))
+            raise self._error('No {0} to eat'.format(token))
 
         # If the token is the identifier
         if self.symbol_table.isin(token):
@@ -479,6 +846,8 @@ class CompilationEngine(object):
         else:
                 raw_token = self.token_list[self.current_token]
                 self.compilation_result.append(raw_token.strip('\n'))
+        if self.positions is not None and self.current_token < len(self.positions):
+            self.result_positions[len(self.compilation_result) - 1] = self.positions[self.current_token]
         self.current_token += 1
         self.num_tokens_left -= 1
         return
@@ -490,7 +859,10 @@ class CompilationEngine(object):
                  The current token.
         """
 
-        raw_token = self.token_list[self.current_token].strip()
+        try:
+            raw_token = self.token_list[self.current_token].strip()
+        except IndexError:
+            raise self._error('Unexpected end of file')
         raw_token = raw_token.split()
         return raw_token[0].strip('<>')
     
@@ -499,17 +871,135 @@ class CompilationEngine(object):
         Get the current token.
         :return: The token with tag stripped.
         """
-        raw_token = self.token_list[self.current_token]
-        raw_token = re.sub(self._TAG_CLEANER, '', raw_token)
+        try:
+            raw_token = self.token_list[self.current_token]
+        except IndexError:
+            raise self._error('Unexpected end of file')
+        raw_token = self._TAG_CLEANER.sub('', raw_token)
 
         return raw_token.strip()
 
+    def _error(self, message):
+        """
+        Build the error of a syntax error at the current token.
+
+        :param message: String. What went wrong.
+        :return: ParseError.
+        """
+        index = min(self.current_token, len(self.token_list) - 1)
+        line = column = token = None
+        if index >= 0:
+            token = self._TAG_CLEANER.sub('', self.token_list[index]).strip()
+            if self.current_token > index:
+                token = None
+            if self.positions is not None and index < len(self.positions):
+                line, column = self.positions[index]
+        if token is not None:
+            message = '{0}, found {1}'.format(message.rstrip('!.'), token)
+
+        return ParseError([Diagnostic(message, line, column, token)])
+
+    def _at_last_token(self):
+        """
+        :return: Bool. Whether the parser is at or beyond the last token.
+        """
+        return self.current_token >= len(self.token_list) - 1
+
+    def _synchronize_statement(self):
+        """
+        Panic-mode recovery inside a statement sequence: skip tokens up to
+        and including the next ';', or up to the next '}', statement keyword
+        or declaration keyword.
+        """
+        start = self.current_token
+        while not self._at_last_token():
+            the_token = self._get_the_token()
+            if the_token == ';':
+                self.current_token += 1
+                break
+            if the_token == '}' or the_token in self.DECLARATIONS:
+                break
+            if the_token in self.STATEMENTS_TYPES and self.current_token != start:
+                break
+            self.current_token += 1
+        self.num_tokens_left = len(self.token_list) - self.current_token
+
+        return
+
+    def _synchronize_condition(self, start):
+        """
+        Recovery inside a condition: skip tokens up to and including the
+        ')' matching the '(' the condition starts at. Without one, stop
+        at the '{' of the block or at the end of the statement.
+        :param start: Int. Index of the '(' token of the condition.
+        """
+        depth = 0
+        end = start
+        for end in range(start, len(self.token_list)):
+            token = self.token_list[end].strip()
+            if token == self._OPEN_PARENTHESIS:
+                depth += 1
+            elif token == self._CLOSE_PARENTHESIS:
+                depth -= 1
+                if not depth:
+                    end += 1
+                    break
+            elif self._TAG_CLEANER.sub('', token).strip() in ['{', '}', ';']:
+                break
+        if end > self.current_token:
+            self.current_token = end
+        self.num_tokens_left = len(self.token_list) - self.current_token
+
+        return
+
+    def _report(self, error):
+        """
+        Keep the diagnostics of an error recovered from. Running out of
+        tokens ends every construct still open, it is reported once.
+        :param error: ParseError.
+        """
+        if self.current_token >= len(self.token_list):
+            if self._end_reported:
+                return
+            self._end_reported = True
+        self.diagnostics.extend(error.diagnostics)
+
+        return
+
+    def _synchronize_declaration(self, start=None):
+        """
+        Panic-mode recovery inside a class body: skip tokens up to the next
+        class variable or subroutine declaration, or up to the closing '}'
+        of the class.
+        :param start: Int. Index of the token the failing declaration
+                      starts at, by default the current token. Any later
+                      declaration keyword is stopped at, even the one the
+                      error was found at, e.g. after a missing '}'.
+        """
+        if start is None:
+            start = self.current_token
+        while not self._at_last_token():
+            if self._get_the_token() in self.DECLARATIONS and self.current_token > start:
+                break
+            self.current_token += 1
+        self.num_tokens_left = len(self.token_list) - self.current_token
+
+        return
+
     def get_result(self):
         """
         Return the compiled result.
         :return: List of strings of compiled tokens
         """
-        self.compile_class()
+        try:
+            self.compile_class()
+        except ParseError as e:
+            if not self.recover:
+                raise
+            self._report(e)
+
+        if self.diagnostics:
+            raise ParseError(self.diagnostics)
         return self.compilation_result
 
 
@@ -0,0 +1,267 @@
+# Static cost report of generated VM code.
+#
+# Every function is summarized by its VM command counts per opcode, the
+# estimated number of Hack instructions a standard VM translator turns it
+# into, its OS and user calls, the cost of building its string constants,
+# the nesting depth of its loops and the peak depth of its working stack.
+# With a source map, functions and the cost of every jack line are located
+# in the jack source.
+
+import json
+import os
+
+from SourceMap import read_map
+from VMOptimizer import stack_depth
+
+
+# Hack instructions emitted by a standard VM translator per command.
+# push/pop are keyed by segment, 'function' is charged per local.
+HACK_COST = {
+    'push constant': 7, 'push local': 10, 'push argument': 10, 'push this': 10,
+    'push that': 10, 'push temp': 7, 'push pointer': 7, 'push static': 7,
+    'pop local': 12, 'pop argument': 12, 'pop this': 12, 'pop that': 12,
+    'pop temp': 5, 'pop pointer': 5, 'pop static': 5,
+    'add': 5, 'sub': 5, 'and': 5, 'or': 5, 'neg': 3, 'not': 3,
+    'eq': 11, 'gt': 11, 'lt': 11,
+    'label': 0, 'goto': 2, 'if-goto': 4,
+    'call': 44, 'function': 0, 'function local': 7, 'return': 40,
+}
+
+OS_CLASSES = ['Math', 'String', 'Array', 'Output', 'Screen', 'Keyboard', 'Memory', 'Sys']
+
+COLUMNS = ['function', 'vm', 'hack', 'os_calls', 'user_calls', 'strings',
+           'string_chars', 'string_hack', 'loop_depth', 'stack_depth', 'source']
+
+
+def hack_cost(command):
+    """
+    :param command: List of strings, a split VM command.
+    :return: Int. Estimated number of Hack instructions.
+    """
+
+    op = command[0]
+    if op in ('push', 'pop'):
+        return HACK_COST[op + ' ' + command[1]]
+    if op == 'function':
+        return HACK_COST['function'] + HACK_COST['function local'] * int(command[2])
+    return HACK_COST[op]
+
+
+def split_functions(vm_code):
+    """
+    :param vm_code: String. VM code of one or more functions.
+    :return: List of lists of split commands, one per function.
+    """
+
+    functions = []
+    for line in vm_code.splitlines():
+        line = line.split('//')[0].strip()
+        if not line:
+            continue
+        command = line.split()
+        if command[0] == 'function' or not functions:
+            functions.append([])
+        functions[-1].append(command)
+
+    return functions
+
+
+def loop_depth(commands):
+    """
+    :param commands: List of split VM commands of a function.
+    :return: Int. Maximal nesting of loops, a loop being the commands
+             between a label and the last jump back to it.
+    """
+
+    labels = {}
+    for i, command in enumerate(commands):
+        if command[0] == 'label':
+            labels[command[1]] = i
+
+    loops = {}
+    for i, command in enumerate(commands):
+        if command[0] in ('goto', 'if-goto') and labels.get(command[1], i + 1) <= i:
+            loops[command[1]] = (labels[command[1]], i)
+
+    depth = [0] * (len(commands) + 1)
+    for start, end in loops.values():
+        depth[start] += 1
+        depth[end + 1] -= 1
+    deepest = 0
+    current = 0
+    for change in depth:
+        current += change
+        deepest = max(deepest, current)
+
+    return deepest
+
+
+def _string_constants(commands):
+    """
+    Find the string constants built the way JackCompiler.write_term does:
+    push constant n; call String.new 1; pop temp 1; n+1 times push temp 1;
+    n times push constant c; call String.appendChar 2; pop temp 1.
+
+    :return: Tuple (number of strings, number of characters, Hack cost).
+    """
+
+    strings = chars = cost = 0
+    for i, command in enumerate(commands):
+        if command != ['call', 'String.new', '1'] or i == 0:
+            continue
+        length = commands[i - 1]
+        if length[:2] != ['push', 'constant']:
+            continue
+        n = int(length[2])
+        pattern = ([['push', 'constant', length[2]], command, ['pop', 'temp', '1']] +
+                   [['push', 'temp', '1']] * (n + 1))
+        for _ in range(n):
+            pattern += [None, ['call', 'String.appendChar', '2'], ['pop', 'temp', '1']]
+        code = commands[i - 1:i - 1 + len(pattern)]
+        if len(code) != len(pattern):
+            continue
+        if all(expected is None or expected == actual for expected, actual in zip(pattern, code)):
+            strings += 1
+            chars += n
+            cost += sum(hack_cost(c) for c in code)
+
+    return strings, chars, cost
+
+
+def analyze_function(commands, source=None, lines=None):
+    """
+    :param commands: List of split VM commands of a function.
+    :param source: String. Name of the jack source of the function.
+    :param lines: List of ints, the source line of every command.
+    :return: Dict. The costs of the function, with the Hack cost of
+             every source line if the lines are given.
+    """
+
+    opcodes = {}
+    hack = 0
+    os_calls = user_calls = 0
+    line_costs = {}
+    for i, command in enumerate(commands):
+        opcodes[command[0]] = opcodes.get(command[0], 0) + 1
+        hack += hack_cost(command)
+        if lines is not None:
+            line_costs[lines[i]] = line_costs.get(lines[i], 0) + hack_cost(command)
+        if command[0] == 'call':
+            if command[1].split('.')[0] in OS_CLASSES:
+                os_calls += 1
+            else:
+                user_calls += 1
+
+    strings, chars, string_hack = _string_constants(commands)
+    name = commands[0][1] if commands[0][0] == 'function' else '<top level>'
+
+    row = {'function': name, 'vm': len(commands), 'hack': hack, 'opcodes': opcodes,
+           'os_calls': os_calls, 'user_calls': user_calls, 'strings': strings,
+           'string_chars': chars, 'string_hack': string_hack,
+           'loop_depth': loop_depth(commands), 'stack_depth': stack_depth(commands), 'source': '-'}
+    if lines:
+        row['source'] = '{0}:{1}'.format(source, min(lines))
+        row['lines'] = line_costs
+
+    return row
+
+
+class CostReport(object):
+    """
+    Collect the costs of the functions of one or more VM files.
+    """
+
+    def __init__(self):
+
+        self.functions = []
+
+    def add_vm(self, vm_code, source_map=None):
+        """
+        :param vm_code: String. VM code of one or more functions.
+        :param source_map: Tuple (source, lines) of the code, see SourceMap.read_map().
+        :return:
+        """
+
+        source = lines = None
+        if source_map is not None:
+            source, lines = source_map
+        start = 0
+        for commands in split_functions(vm_code):
+            function_lines = None
+            if lines is not None and start + len(commands) <= len(lines):
+                function_lines = lines[start:start + len(commands)]
+            self.functions.append(analyze_function(commands, source, function_lines))
+            start += len(commands)
+
+        return
+
+    def add_file(self, path):
+        """
+        :param path: String. A .vm file, or a directory of them.
+        :return:
+        """
+
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith('.vm'):
+                    self.add_file(os.path.join(path, name))
+            return
+
+        with open(path) as f:
+            self.add_vm(f.read(), read_map(path))
+
+        return
+
+    def rows(self, sort='hack'):
+        """
+        :param sort: String. Column to sort by, numbers in descending order.
+        :return: List of dicts, one per function.
+        """
+
+        if sort not in COLUMNS:
+            raise ValueError('Unknown column {0}'.format(sort))
+
+        return sorted(self.functions, key=lambda row: row[sort],
+                      reverse=sort not in ('function', 'source'))
+
+    def format_table(self, sort='hack'):
+        """
+        :param sort: String. See rows().
+        :return: String. The report as a text table, with a total line.
+        """
+
+        rows = self.rows(sort)
+        total = {'function': 'total', 'source': ''}
+        for column in COLUMNS[1:-1]:
+            values = [row[column] for row in rows]
+            total[column] = max(values or [0]) if column in ('loop_depth', 'stack_depth') else sum(values)
+
+        cells = [COLUMNS] + [[str(row[column]) for column in COLUMNS] for row in rows + [total]]
+        widths = [max(len(line[i]) for line in cells) for i in range(len(COLUMNS))]
+        lines = []
+        for line in cells:
+            lines.append('  '.join([line[0].ljust(widths[0])] +
+                                   [cell.rjust(width) for cell, width in zip(line[1:], widths[1:])]))
+
+        return '\n'.join(lines)
+
+    def to_json(self, sort='hack'):
+        """
+        :return: String. The report as a JSON list of functions.
+        """
+
+        return json.dumps(self.rows(sort), indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Report the static cost of VM code.')
+    parser.add_argument('paths', nargs='+', help='.vm files or directories')
+    parser.add_argument('--sort', default='hack', choices=COLUMNS, help='column to sort by')
+    parser.add_argument('--json', action='store_true', help='print JSON instead of a table')
+    args = parser.parse_args()
+
+    report = CostReport()
+    for vm_path in args.paths:
+        report.add_file(vm_path)
+    print(report.to_json(args.sort) if args.json else report.format_table(args.sort))
@@ -0,0 +1,447 @@
+# A persistent cross-reference index of a jack project.
+#
+# Classes, subroutines, symbols, call sites and variable references are
+# extracted from the parse result of CompilationEngine and stored in a
+# SQLite database, which is brought up to date file by file: only the
+# files whose content changed since the last update are parsed again.
+# Questions like "who calls Ball.move" are then answered by the database.
+
+import io
+import os
+import sqlite3
+
+from CompilationEngine import CompilationEngine, ParseError
+from IncrementalCompiler import fingerprint
+from Tokenizer import Tokenizer
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY, path TEXT UNIQUE, mtime REAL, size INTEGER,
+    digest TEXT, status TEXT, message TEXT);
+CREATE TABLE IF NOT EXISTS classes (
+    file_id INTEGER, name TEXT, line INTEGER);
+CREATE TABLE IF NOT EXISTS subroutines (
+    file_id INTEGER, class TEXT, name TEXT, kind TEXT, return_type TEXT,
+    n_args INTEGER, line INTEGER);
+CREATE TABLE IF NOT EXISTS symbols (
+    file_id INTEGER, class TEXT, subroutine TEXT, name TEXT, kind TEXT,
+    type TEXT, idx INTEGER, line INTEGER, col INTEGER);
+CREATE TABLE IF NOT EXISTS calls (
+    file_id INTEGER, class TEXT, subroutine TEXT, callee TEXT,
+    line INTEGER, col INTEGER);
+CREATE TABLE IF NOT EXISTS refs (
+    file_id INTEGER, class TEXT, subroutine TEXT, name TEXT, kind TEXT,
+    type TEXT, idx INTEGER, access TEXT, line INTEGER, col INTEGER);
+CREATE INDEX IF NOT EXISTS classes_name ON classes (name);
+CREATE INDEX IF NOT EXISTS subroutines_name ON subroutines (class, name);
+CREATE INDEX IF NOT EXISTS symbols_name ON symbols (name);
+CREATE INDEX IF NOT EXISTS calls_callee ON calls (callee);
+CREATE INDEX IF NOT EXISTS calls_caller ON calls (class, subroutine);
+CREATE INDEX IF NOT EXISTS refs_name ON refs (class, name, kind);
+"""
+
+TABLES = ['classes', 'subroutines', 'symbols', 'calls', 'refs']
+
+# Kinds of the symbol table, as tagged by CompilationEngine.
+KINDS = {'static': 'static', 'field': 'field', 'ARG': 'argument', 'VAR': 'local'}
+
+DECLARATIONS = ['<classVarDec>', '<parameterList>', '<varDec>']
+
+
+def _split_line(line):
+    """
+    :param line: String. A line of the parse result.
+    :return: Tuple (tag, token), the tag split into words.
+    """
+
+    line = line.strip()
+    end = line.index('>')
+    tag = line[1:end].split()
+    token = line[end + 1:line.rfind('<')].strip() if not line.startswith('</') else ''
+
+    return tag, token
+
+
+def extract(result, positions):
+    """
+    Collect the cross-reference records of a parsed class.
+
+    :param result: List of strings, the parse result of CompilationEngine.
+    :param positions: Dict of index in result to (line, column), see
+                      CompilationEngine.result_positions.
+    :return: Dict of table name to list of row tuples, without the file id.
+    """
+
+    records = dict((table, []) for table in TABLES)
+    class_name = subroutine = None
+    subroutine_type = None
+    counts = {}
+    declaration = None
+    header = None
+    let_target = False
+    recent = []
+
+    for i, line in enumerate(result):
+        tag, token = _split_line(line)
+        position = positions.get(i, (None, None))
+        stripped = line.strip()
+
+        if not token and len(tag) == 1:
+            # A structural tag.
+            if stripped in DECLARATIONS:
+                declaration = []
+            elif stripped in ('</classVarDec>', '</parameterList>', '</varDec>'):
+                _declare(records, stripped[2:-1], declaration, class_name, subroutine,
+                         subroutine_type, counts)
+                declaration = None
+            elif stripped == '<subroutineDec>':
+                header = []
+                subroutine = None
+                recent = []
+            continue
+
+        if declaration is not None:
+            declaration.append((tag, token, position))
+            continue
+
+        if class_name is None:
+            if tag[0] == 'identifier':
+                class_name = token
+                records['classes'].append((class_name, position[0]))
+            continue
+
+        if header is not None:
+            # kind, return type and name of a subroutine.
+            header.append((token, position))
+            if len(header) == 3:
+                subroutine_type = header[0][0]
+                subroutine = header[2][0]
+                counts['ARG'] = 1 if subroutine_type == 'method' else 0
+                counts['VAR'] = 0
+                records['subroutines'].append([class_name, subroutine, subroutine_type,
+                                               header[1][0], 0, header[2][1][0]])
+                header = None
+            continue
+
+        if tag[0] == 'keyword' and token == 'let':
+            let_target = True
+        elif tag[0] in KINDS and len(tag) == 3 and result[i + 1].strip() != '<symbol> ( </symbol>':
+            # A subroutine named like a variable is tagged as the variable.
+            access = 'read'
+            if let_target:
+                access = 'index' if result[i + 1].strip() == '<symbol> [ </symbol>' else 'write'
+            records['refs'].append((class_name, subroutine, token, KINDS[tag[0]], tag[1],
+                                    int(tag[2]), access, position[0], position[1]))
+            let_target = False
+        elif (tag[0] == 'symbol' and token == '(' and recent and
+              (recent[-1][0][0] == 'identifier' or recent[-1][0][0] in KINDS)):
+            name = recent[-1][1]
+            callee = '.'.join([class_name, name])
+            start = recent[-1][2]
+            if len(recent) >= 3 and recent[-2][1] == '.':
+                qualifier = recent[-3]
+                start = qualifier[2]
+                if qualifier[0][0] == 'identifier':
+                    callee = '.'.join([qualifier[1], name])
+                else:
+                    callee = '.'.join([qualifier[0][1], name])
+            records['calls'].append((class_name, subroutine, callee, start[0], start[1]))
+
+        recent = (recent + [(tag, token, position)])[-3:]
+
+    for row in records['subroutines']:
+        row[4] = counts.get(('n_args', row[1]), 0)
+    records['subroutines'] = [tuple(row) for row in records['subroutines']]
+
+    return records
+
+
+def _declare(records, declaration_type, tokens, class_name, subroutine, subroutine_type, counts):
+    """
+    Record the symbols of a declaration.
+    """
+
+    if declaration_type == 'parameterList':
+        # Pairs of type and name, separated by commas.
+        names = [item for item in tokens if item[1] != ',']
+        for j in range(0, len(names) - 1, 2):
+            _define(records, class_name, subroutine, names[j + 1], 'ARG', names[j][1], counts)
+        counts[('n_args', subroutine)] = len(names) // 2
+        return
+
+    # static|field|var, the type, then names separated by commas.
+    kind = tokens[0][1] if declaration_type == 'classVarDec' else 'VAR'
+    var_type = tokens[1][1]
+    for item in tokens[2:]:
+        if item[1] not in (',', ';'):
+            _define(records, class_name, subroutine if kind == 'VAR' else None, item, kind,
+                    var_type, counts)
+
+    return
+
+
+def _define(records, class_name, subroutine, item, kind, var_type, counts):
+
+    index = counts.get(kind, 0)
+    counts[kind] = index + 1
+    records['symbols'].append((class_name, subroutine, item[1], KINDS[kind], var_type, index,
+                               item[2][0], item[2][1]))
+
+    return
+
+
+def parse_source(source):
+    """
+    :param source: String. The jack code of a class.
+    :return: Dict, the records of the class, see extract().
+    :raise ParseError: on syntax errors.
+    """
+
+    tokens = io.StringIO()
+    positions = []
+    Tokenizer.tokenize_lines(source.splitlines(True), tokens, positions)
+    tokens = tokens.getvalue().splitlines(True)
+
+    engine = CompilationEngine(tokens[1:-1], positions, recover=True, verbose=False)
+    result = engine.get_result()
+
+    return extract(result, engine.result_positions)
+
+
+class CrossReference(object):
+    """
+    The cross-reference index of a project, kept in a SQLite database.
+    """
+
+    def __init__(self, db_path):
+        """
+        :param db_path: String. The database file, ':memory:' for a transient one.
+        """
+
+        self.db = sqlite3.connect(db_path)
+        self.db.executescript(SCHEMA)
+        self.stats = {'parsed': 0, 'unchanged': 0, 'removed': 0, 'errors': 0}
+
+    def close(self):
+
+        self.db.close()
+
+        return
+
+    def update(self, path):
+        """
+        Bring the index up to date with the .jack files of a directory,
+        or a single file. Files that vanished are dropped from the index.
+
+        :param path: String.
+        :return: Dict. The number of files parsed, unchanged, removed and with errors.
+        """
+
+        if os.path.isdir(path):
+            paths = sorted(os.path.join(path, name) for name in os.listdir(path)
+                           if name.endswith('.jack'))
+        else:
+            paths = [path]
+        paths = [os.path.abspath(file_path) for file_path in paths]
+
+        with self.db:
+            for file_path in paths:
+                self.update_file(file_path)
+            if os.path.isdir(path):
+                root = os.path.join(os.path.abspath(path), '')
+                for file_id, file_path in self.db.execute('SELECT id, path FROM files').fetchall():
+                    if file_path.startswith(root) and file_path not in paths:
+                        self._forget(file_id)
+                        self.db.execute('DELETE FROM files WHERE id = ?', (file_id,))
+                        self.stats['removed'] += 1
+
+        return self.stats
+
+    def update_file(self, file_path):
+        """
+        Index a file again if it changed since it was indexed.
+
+        :param file_path: String. Absolute path of a .jack file.
+        :return: Bool. Whether the file was parsed.
+        """
+
+        info = os.stat(file_path)
+        row = self.db.execute('SELECT id, mtime, size, digest FROM files WHERE path = ?',
+                              (file_path,)).fetchone()
+        if row is not None and (row[1], row[2]) == (info.st_mtime, info.st_size):
+            self.stats['unchanged'] += 1
+            return False
+
+        with open(file_path) as f:
+            source = f.read()
+        digest = fingerprint(source)
+        if row is not None and row[3] == digest:
+            # Touched but not changed.
+            self.db.execute('UPDATE files SET mtime = ?, size = ? WHERE id = ?',
+                            (info.st_mtime, info.st_size, row[0]))
+            self.stats['unchanged'] += 1
+            return False
+
+        if row is None:
+            file_id = self.db.execute('INSERT INTO files (path) VALUES (?)', (file_path,)).lastrowid
+        else:
+            file_id = row[0]
+            self._forget(file_id)
+
+        status, message = 'ok', None
+        try:
+            records = parse_source(source)
+        except ParseError as e:
+            status, message = 'error', str(e)
+            records = {}
+            self.stats['errors'] += 1
+        for table, rows in records.items():
+            if rows:
+                marks = ', '.join(['?'] * (len(rows[0]) + 1))
+                self.db.executemany('INSERT INTO {0} VALUES ({1})'.format(table, marks),
+                                    [(file_id,) + tuple(row) for row in rows])
+        self.db.execute('UPDATE files SET mtime = ?, size = ?, digest = ?, status = ?, '
+                        'message = ? WHERE id = ?',
+                        (info.st_mtime, info.st_size, digest, status, message, file_id))
+        self.stats['parsed'] += 1
+
+        return True
+
+    def _forget(self, file_id):
+
+        for table in TABLES:
+            self.db.execute('DELETE FROM {0} WHERE file_id = ?'.format(table), (file_id,))
+
+        return
+
+    def _query(self, sql, args):
+        """
+        :return: List of dicts, the rows of the query.
+        """
+
+        cursor = self.db.execute(sql, args)
+        names = [column[0] for column in cursor.description]
+
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def callers(self, function):
+        """
+        :param function: String. Class.subroutine.
+        :return: List of dicts, the call sites of the function.
+        """
+
+        return self._query('SELECT f.path, c.class, c.subroutine, c.line, c.col FROM calls c '
+                           'JOIN files f ON f.id = c.file_id WHERE c.callee = ? '
+                           'ORDER BY f.path, c.line, c.col', (function,))
+
+    def callees(self, function):
+        """
+        :param function: String. Class.subroutine.
+        :return: List of dicts, the calls made by the function.
+        """
+
+        class_name, name = function.split('.')
+        return self._query('SELECT c.callee, f.path, c.line, c.col FROM calls c '
+                           'JOIN files f ON f.id = c.file_id WHERE c.class = ? AND c.subroutine = ? '
+                           'ORDER BY c.line, c.col', (class_name, name))
+
+    def references(self, class_name, name, kind=None, access=None, subroutine=None):
+        """
+        :param class_name: String. Class the variable is used in.
+        :param name: String. Name of the variable.
+        :param kind: String. static, field, argument or local, any if None.
+        :param access: String. read, write (assigned) or index (an element
+                       assigned), any if None.
+        :param subroutine: String. Only in this subroutine if given.
+        :return: List of dicts, the references.
+        """
+
+        sql = ('SELECT f.path, r.class, r.subroutine, r.name, r.kind, r.type, r.access, '
+               'r.line, r.col FROM refs r JOIN files f ON f.id = r.file_id '
+               'WHERE r.class = ? AND r.name = ?')
+        args = [class_name, name]
+        for column, value in (('kind', kind), ('access', access), ('subroutine', subroutine)):
+            if value is not None:
+                sql += ' AND r.{0} = ?'.format(column)
+                args.append(value)
+
+        return self._query(sql + ' ORDER BY r.line, r.col', args)
+
+    def writes(self, class_name, field):
+        """
+        :return: List of dicts, the places a field of a class is assigned.
+        """
+
+        return self.references(class_name, field, 'field', 'write')
+
+    def definitions(self, name):
+        """
+        :param name: String. A class, Class.subroutine or a variable name.
+        :return: List of dicts, what the name is declared as and where.
+        """
+
+        if '.' in name:
+            class_name, subroutine = name.split('.')
+            return self._query('SELECT f.path, s.class, s.name, s.kind, s.return_type, '
+                               's.n_args, s.line FROM subroutines s JOIN files f '
+                               'ON f.id = s.file_id WHERE s.class = ? AND s.name = ?',
+                               (class_name, subroutine))
+
+        rows = self._query('SELECT f.path, c.name, \'class\' AS kind, c.line FROM classes c '
+                           'JOIN files f ON f.id = c.file_id WHERE c.name = ?', (name,))
+        return rows + self._query('SELECT f.path, s.class, s.subroutine, s.name, s.kind, s.type, '
+                                  's.idx, s.line, s.col FROM symbols s JOIN files f '
+                                  'ON f.id = s.file_id WHERE s.name = ? ORDER BY f.path, s.line',
+                                  (name,))
+
+    def errors(self):
+        """
+        :return: List of dicts, the indexed files with syntax errors.
+        """
+
+        return self._query('SELECT path, message FROM files WHERE status = \'error\'', ())
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description='Cross-reference index of a jack project.')
+    parser.add_argument('project', help='a directory of .jack files')
+    parser.add_argument('--db', default=None,
+                        help='database file, .jackxref.sqlite in the project by default')
+    parser.add_argument('--no-update', action='store_true',
+                        help='query the index as it is, without looking for changed files')
+    parser.add_argument('query', nargs='?', default='update',
+                        choices=['update', 'callers', 'callees', 'refs', 'writes', 'defs',
+                                 'errors'])
+    parser.add_argument('name', nargs='?', help='Class.subroutine, Class.variable or a name')
+    args = parser.parse_args()
+
+    index = CrossReference(args.db or os.path.join(args.project, '.jackxref.sqlite'))
+    if not args.no_update:
+        index.update(args.project)
+    if args.query == 'update':
+        print(json.dumps(index.stats))
+    elif args.query == 'errors':
+        print(json.dumps(index.errors(), indent=2))
+    elif args.name is None:
+        parser.error('the {0} query needs a name'.format(args.query))
+    elif (args.name.count('.') > 1 or '' in args.name.split('.') or
+          (args.query != 'defs' and '.' not in args.name)):
+        parser.error('the {0} query needs {1}, not {2}'.format(
+            args.query, 'a name or Class.name' if args.query == 'defs' else 'a Class.name',
+            args.name))
+    elif args.query == 'callers':
+        print(json.dumps(index.callers(args.name), indent=2))
+    elif args.query == 'callees':
+        print(json.dumps(index.callees(args.name), indent=2))
+    elif args.query == 'defs':
+        print(json.dumps(index.definitions(args.name), indent=2))
+    else:
+        class_name, name = args.name.split('.')
+        if args.query == 'writes':
+            print(json.dumps(index.writes(class_name, name), indent=2))
+        else:
+            print(json.dumps(index.references(class_name, name), indent=2))
+    index.close()
@@ -0,0 +1,352 @@
+# Incremental compilation of jack classes at subroutine granularity.
+#
+# The token stream of a class is split into its class variable declarations
+# and its subroutines. Each part is fingerprinted and its parse result and
+# generated VM code are cached, so that re-compiling a class after editing
+# one subroutine only re-parses and re-generates that subroutine.
+
+import hashlib
+import io
+import os
+import pickle
+import sys
+
+from CompilationEngine import CompilationEngine, ParseError
+from JackCompiler import JackCompiler, _compile
+from Tokenizer import Tokenizer
+
+
+class ClassSplitError(ValueError):
+    """
+    Raised when the token stream can not be split into declarations,
+    the class is then compiled (and its errors reported) as a whole.
+    """
+    pass
+
+
+def split_class(tokens):
+    """
+    Split the tokens of a class into its declarations.
+
+    :param tokens: List of token lines, without the <tokens> wrapper.
+    :return: Tuple (class_name, class_var_spans, subroutine_spans), each
+             span is a (start, end) pair of token indices, end excluded.
+    """
+
+    def token_at(i):
+        return CompilationEngine._TAG_CLEANER.sub('', tokens[i]).strip()
+
+    def is_symbol(i, symbol):
+        return tokens[i].lstrip().startswith('<symbol>') and token_at(i) == symbol
+
+    if len(tokens) < 4 or token_at(0) != 'class' or not is_symbol(2, '{') or not is_symbol(len(tokens) - 1, '}'):
+        raise ClassSplitError('Not a well formed class')
+
+    class_vars = []
+    subroutines = []
+    end = len(tokens) - 1
+    i = 3
+    while i < end:
+        the_token = token_at(i)
+        start = i
+        if the_token in CompilationEngine.CLASS_VAR_TYPE:
+            while i < end and not is_symbol(i, ';'):
+                i += 1
+            if i == end:
+                raise ClassSplitError('Unterminated class variable declaration')
+            class_vars.append((start, i + 1))
+            i += 1
+        elif the_token in CompilationEngine.SUBROUTINE_TYPE:
+            # Skip the signature, then match the braces of the body.
+            while i < end and not is_symbol(i, '{'):
+                i += 1
+            depth = 0
+            while i < end:
+                if is_symbol(i, '{'):
+                    depth += 1
+                elif is_symbol(i, '}'):
+                    depth -= 1
+                    if depth == 0:
+                        break
+                i += 1
+            if i == end:
+                raise ClassSplitError('Unbalanced braces in subroutine')
+            subroutines.append((start, i + 1))
+            i += 1
+        else:
+            raise ClassSplitError('Unexpected token {0} in class body'.format(the_token))
+
+    return token_at(1), class_vars, subroutines
+
+
+def fingerprint(*parts):
+    """
+    :param parts: Strings or lists of strings.
+    :return: String. A digest identifying the given parts.
+    """
+
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, list):
+            part = ''.join(part)
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+
+    return digest.hexdigest()
+
+
+def _compiler_version():
+    """
+    :return: String. A digest of the compiler's own code, so that caches
+             written by another version of the compiler are not used.
+    """
+
+    import CompilationEngine
+    import JackCompiler
+    import SourceMap
+    import SymbolTable
+    import Tokenizer
+    import VMCode
+    import VMOptimizer
+    import VMwriter
+
+    # Every module the emitted code, its source lines or the cache depend on.
+    modules = [CompilationEngine, JackCompiler, SourceMap, SymbolTable, Tokenizer,
+               VMCode, VMOptimizer, VMwriter, sys.modules[__name__]]
+    sources = []
+    for module in modules:
+        with open(module.__file__) as f:
+            sources.append(f.read())
+
+    return fingerprint(*sources)
+
+
+class IncrementalCompiler(object):
+    """
+    Compile jack classes, re-using the parse result and the VM code
+    of every subroutine whose tokens did not change.
+    """
+
+    def __init__(self, cache_dir=None, intrinsics=True, optimize=False):
+        """
+        :param cache_dir: String. Directory the caches are persisted into,
+                          None to keep them in memory only.
+        :param intrinsics: Bool. See JackCompiler.compile().
+        :param optimize: Bool. See JackCompiler.compile().
+        """
+
+        self.cache_dir = cache_dir
+        self.intrinsics = intrinsics
+        self.optimize = optimize
+        self._version = fingerprint(_compiler_version(), str(intrinsics), str(optimize))
+        self._caches = {}
+        self.stats = {'reparsed': 0, 'reused': 0, 'class_vars_reparsed': 0}
+
+    def compile_file(self, file_path, output_dir=None):
+        """
+        Compile a single .jack file.
+
+        :param file_path: String.
+        :param output_dir: String. Directory the .xml and .vm files are
+                           written into, defaults to the layout of JackCompiler.compile().
+        :return: String. The VM code of the class.
+        """
+
+        class_name = os.path.basename(file_path)[:-5]
+        token_path = None
+        vm_path = class_name + '.vm'
+        if output_dir is not None:
+            token_path = os.path.join(output_dir, class_name + '.xml')
+            vm_path = os.path.join(output_dir, class_name + '.vm')
+
+        positions = []
+        token_path = Tokenizer.tokenize(file_path, token_path, positions)
+        with open(token_path) as f:
+            tokens = f.readlines()[1:-1]
+
+        try:
+            vm_code = self.compile_tokens(tokens, positions, class_name)
+        except ClassSplitError:
+            # Let the regular pipeline deal with (and report) the class.
+            _compile(file_path, output_dir, self.intrinsics, self.optimize)
+            with open(vm_path) as f:
+                return f.read()
+
+        with open(vm_path, 'w') as f:
+            f.write(vm_code)
+
+        return vm_code
+
+    def compile_tokens(self, tokens, positions, class_name):
+        """
+        Compile the tokens of a class.
+
+        :param tokens: List of token lines, without the <tokens> wrapper.
+        :param positions: List of (line, column) of the tokens, or None.
+        :param class_name: String.
+        :return: String. The VM code of the class.
+        """
+
+        name, class_var_spans, subroutine_spans = split_class(tokens)
+        if name != class_name:
+            raise ClassSplitError('Class {0} is declared in the file of {1}'.format(name, class_name))
+        cache = self._load_cache(class_name)
+        new_cache = {'class_vars': {}, 'subroutines': {}}
+
+        # Class variables, only parsed when their declarations change.
+        class_var_tokens = [line for start, end in class_var_spans for line in tokens[start:end]]
+        class_var_key = fingerprint(self._version, name, class_var_tokens)
+        class_vars = cache['class_vars'].get(class_var_key)
+        if class_vars is None:
+            class_vars = self._parse_class_vars(tokens, positions, class_var_spans)
+            self.stats['class_vars_reparsed'] += 1
+        new_cache['class_vars'][class_var_key] = class_vars
+        class_table, class_indices = class_vars
+        size = class_indices['field']
+
+        diagnostics = []
+        vm_code = []
+        for start, end in subroutine_spans:
+            key = fingerprint(class_var_key, class_name, tokens[start:end])
+            entry = cache['subroutines'].get(key)
+            if entry is None:
+                span_positions = positions[start:end] if positions is not None else None
+                try:
+                    entry = self._compile_subroutine(tokens[start:end], span_positions,
+                                                     class_name, class_vars, size,
+                                                     self.intrinsics, self.optimize)
+                except ParseError as e:
+                    diagnostics.extend(e.diagnostics)
+                    continue
+                self.stats['reparsed'] += 1
+            else:
+                self.stats['reused'] += 1
+            new_cache['subroutines'][key] = entry
+            vm_code.append(entry[1])
+
+        # Only keep what the current version of the class uses.
+        self._caches[class_name] = new_cache
+        self._save_cache(class_name)
+        if diagnostics:
+            raise ParseError(diagnostics)
+
+        return ''.join(vm_code)
+
+    @staticmethod
+    def _parse_class_vars(tokens, positions, spans):
+        """
+        Parse the class variable declarations.
+
+        :return: Tuple (class_table, class_indices) of the symbol table.
+        """
+
+        engine = None
+        diagnostics = []
+        for start, end in spans:
+            span_positions = positions[start:end] if positions is not None else None
+            previous = engine
+            engine = CompilationEngine(tokens[start:end], span_positions)
+            if previous is not None:
+                engine.symbol_table = previous.symbol_table
+            try:
+                engine.compile_class_var_dec()
+            except ParseError as e:
+                diagnostics.extend(e.diagnostics)
+        if diagnostics:
+            raise ParseError(diagnostics)
+        if engine is None:
+            engine = CompilationEngine([])
+
+        table = engine.symbol_table
+        return dict(table._class_table), dict(table._class_indices)
+
+    @staticmethod
+    def _compile_subroutine(tokens, positions, class_name, class_vars, size, intrinsics, optimize):
+        """
+        Parse and generate a single subroutine.
+
+        :return: Tuple (parse result, VM code).
+        """
+
+        engine = CompilationEngine(tokens, positions, recover=True)
+        engine.symbol_table._class_table = dict(class_vars[0])
+        engine.symbol_table._class_indices = dict(class_vars[1])
+        try:
+            engine.compile_subroutine_dec()
+        except ParseError as e:
+            engine.diagnostics.extend(e.diagnostics)
+        if engine.diagnostics:
+            raise ParseError(engine.diagnostics)
+        result = engine.compilation_result
+
+        output = io.StringIO()
+        compiler = JackCompiler(result, class_name, size, output, intrinsics, optimize)
+        compiler.write_subroutine_dec()
+        compiler.writer.close()
+
+        return result, output.getvalue()
+
+    def _cache_path(self, class_name):
+
+        return os.path.join(self.cache_dir, class_name + '.cache')
+
+    def _load_cache(self, class_name):
+        """
+        Fetch the cache of a class, from memory or from the cache directory.
+        """
+
+        cache = self._caches.get(class_name)
+        if cache is None and self.cache_dir is not None:
+            try:
+                with open(self._cache_path(class_name), 'rb') as f:
+                    cache = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                cache = None
+        if cache is None:
+            cache = {'class_vars': {}, 'subroutines': {}}
+        self._caches[class_name] = cache
+
+        return cache
+
+    def _save_cache(self, class_name):
+
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._cache_path(class_name)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(self._caches[class_name], f, pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+        return
+
+
+def compile(file, output_dir=None, cache_dir='.jackcache', compiler=None):
+    """
+    Incrementally compile a given file or a whole directory.
+    :param file: String. A file name or directory name.
+    :param output_dir: String. See JackCompiler.compile().
+    :param cache_dir: String. Directory the caches are persisted into.
+    :param compiler: IncrementalCompiler to use, a new one if None.
+    :return: The IncrementalCompiler used.
+    """
+
+    if compiler is None:
+        compiler = IncrementalCompiler(cache_dir)
+    if os.path.isdir(file):
+        for name in os.listdir(file):
+            compile(os.path.join(file, name), output_dir, cache_dir, compiler)
+    elif file.endswith('.jack'):
+        compiler.compile_file(file, output_dir)
+
+    return compiler
+
+
+if __name__ == '__main__':
+    import sys
+    file_name = sys.argv[1]
+    cache = sys.argv[2] if len(sys.argv) > 2 else '.jackcache'
+    stats = compile(file_name, cache_dir=cache).stats
+    print('Subroutines re-parsed: {reparsed}, re-used: {reused}, '
+          'class variable sections re-parsed: {class_vars_reparsed}'.format(**stats),
+          file=sys.stderr)
@@ -1,9 +1,10 @@
 import re
 
 from VMwriter import VMWriter
+from VMOptimizer import default_passes, report
 from SymbolTable import SymbolTable
 from Tokenizer import Tokenizer
-from CompilationEngine import CompilationEngine
+from CompilationEngine import CompilationEngine, ParseError, XmlWriter
 
 def compile_file(file):
     """
@@ -51,6 +52,8 @@ class JackCompiler(object):
     VAR_MAP = {'static': 'static', 'field': 'this', 'ARG': 'argument', 'VAR': 'local'}
     OPS_MAP = {'+': 'add', '-': 'sub', '&amp;': 'and', '|': 'or', '&lt;': 'lt', '&gt;': 'gt', '=': 'eq'}
     U_OPS_MAP = {'-': 'neg', '~': 'not'}
+    # Commands leaving -1 or 0, which if-goto can test without a 'not'.
+    COMPARISONS = ['eq', 'lt', 'gt']
     CONSTANTS = ['<integerConstant>', '<stringConstant>', '<keyword>']
     KEY_WORD_CONST_MAP = {'true': -1, 'false': 0 , 'null': 0}
     INSTANCE_FUNCS = ['constructor', 'method']
@@ -103,20 +106,49 @@ class JackCompiler(object):
 
     ALL_STATEMENTS = [DO_START, LET_START, RETURN_START, WHILE_START, IF_START]
 
-    def __init__(self, parsed_codes, class_name, size):
+    # OS routines expanded inline, with the number of arguments they take.
+    INTRINSICS = {'Memory.peek': 1, 'Memory.poke': 2, 'Math.abs': 1, 'Math.min': 2, 'Math.max': 2}
+
+    # Rough number of Hack instructions a call costs on top of the callee's
+    # body with the standard VM translator: call, function and return.
+    CALL_OVERHEAD = 100
+
+    def __init__(self, parsed_codes, class_name, size, output_path=None, intrinsics=True,
+                 optimize=False, writer_class=VMWriter, positions=None, verbose=True):
 
         self.parsed_codes = parsed_codes
+
+        # Whether to print the parse result walked over.
+        self.verbose = verbose
+
+        # Dict of index in parsed_codes to (line, column) of the token,
+        # the writer records the line of the last token eaten. Without
+        # them no source lines are tracked.
+        self.positions = positions
         self.progress = 0
         self.class_name = class_name
-        self.writer = VMWriter(class_name + '.vm')
+        if output_path is None:
+            output_path = class_name + '.vm'
+
+        # The VMOptimizer passes run over every function.
+        self.passes = default_passes() if optimize else []
+        self.writer = writer_class(output_path, self.passes, track_lines=positions is not None)
         self.labels = 0
+        self.func_name = None
         self.size = size
         self.function_table = {}
 
-    def write_class(self):
+        # Whether to expand the INTRINSICS inline,
+        # and how many calls were expanded so far.
+        self.intrinsics = intrinsics
+        self.intrinsics_expanded = {}
+
+    def write_class(self, jobs=1):
         """
         Write the VM code of a class
 
+        :param jobs: Int. Number of worker processes generating the
+                     code of the subroutines, see write_subroutines_parallel().
         :return:
         """
 
@@ -127,11 +159,14 @@ class JackCompiler(object):
 
         while self._get_the_tag() != self.FUNC_START:
             self._advance_hard()
+        if jobs > 1:
+            self.write_subroutines_parallel(jobs)
         while self._get_the_tag() == self.FUNC_START:
             self.write_subroutine_dec()
 
         self._eat('}')
         self._advance_hard()
+        self.writer.close()
 
         return
 
@@ -156,6 +191,11 @@ class JackCompiler(object):
         # for the convenience of in-class call.
         self.function_table[func_name] = subroutine_type
 
+        # Labels are numbered per subroutine, so the code of a
+        # subroutine does not depend on the ones before it.
+        self.func_name = func_name
+        self.labels = 0
+
         # func_name = '.'.join([self.class_name, func_name])
 
         # Deal with parameter list, get the number of
@@ -172,6 +212,50 @@ class JackCompiler(object):
 
         return
 
+    def write_subroutines_parallel(self, jobs):
+        """
+        Write the VM code of all the subroutines of the class, generated
+        in worker processes. A subroutine does not depend on the others,
+        its labels are numbered on their own, so the code is written in
+        source order exactly as write_subroutine_dec() would write it.
+
+        :param jobs: Int. Number of worker processes.
+        :return:
+        """
+        import multiprocessing
+
+        units = []
+        while self._get_the_tag() == self.FUNC_START:
+            start = self.progress
+            end = self.parsed_codes.index(self.FUNC_DEC_END, start) + 1
+            positions = None
+            if self.positions is not None:
+                positions = dict((i - start, self.positions[i]) for i in range(start, end)
+                                 if i in self.positions)
+            units.append((self.parsed_codes[start:end], positions, self.class_name,
+                          self.size, self.intrinsics, bool(self.passes)))
+            self.progress = end
+        if not units:
+            return
+
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+        else:
+            context = multiprocessing.get_context()
+        chunk_size = max(1, len(units) // (jobs * 4))
+        with context.Pool(jobs) as pool:
+            for code, lines, expanded, stats in pool.imap(_write_subroutine, units, chunk_size):
+                self.writer.write_function_code(code, lines)
+                for name, count in expanded.items():
+                    self.intrinsics_expanded[name] = self.intrinsics_expanded.get(name, 0) + count
+                for the_pass, (pass_stats, details) in zip(self.passes, stats):
+                    for key, value in pass_stats.items():
+                        the_pass.stats[key] += value
+                    if details:
+                        the_pass.details.extend(details)
+
+        return
+
     def write_local_var_dec(self):
         """
         Deal with the local variable
@@ -216,12 +300,17 @@ class JackCompiler(object):
             raise ValueError('No subroutine body to process!')
         self._advance(self.FUNC_BODY_START)
         self._eat('{')
+        declaration_line = self.writer.line
 
         # Deal with the function local variable and name space.
         # Allocate the memory and align to the base address.
         subroutine_type = self.function_table[func_name]
         n_vars = self.write_local_var_dec()
         func_name = '.'.join([self.class_name, func_name])
+
+        # The function and its prologue belong to the declaration
+        # rather than to the last of its local variables.
+        self.writer.line = declaration_line
         self.writer.write_function(func_name, n_vars)
 
         # VM code needed for object manipulation.
@@ -327,10 +416,17 @@ class JackCompiler(object):
         if is_method:
             n_args += 1
         self._eat(')')
-        self.writer.write_call(func_name, n_args)
+
+        value_pushed = None
+        if not is_method:
+            value_pushed = self._write_intrinsic(func_name, n_args, True)
+        if value_pushed is None:
+            self.writer.write_call(func_name, n_args)
+            value_pushed = True
 
         # Drop the return value.
-        self.writer.write_pop('temp', 1)
+        if value_pushed:
+            self.writer.write_pop('temp', 1)
         self._eat(';')
         self._advance(self.DO_END)
         return
@@ -361,7 +457,15 @@ class JackCompiler(object):
 
     def write_while(self):
         """
-        Write the VM code for while statements
+        Write the VM code for while statements.
+        A loop whose condition is a comparison is rotated, its
+        condition is tested at the bottom:
+
+            goto test; label body; <body>; label test; <condition>; if-goto body
+
+        so that an iteration costs a single jump and no 'not'. if-goto
+        jumps on any nonzero value while jack conditions are true when
+        -1, so other conditions keep the test at the top.
         :return:
         """
 
@@ -369,28 +473,51 @@ class JackCompiler(object):
         label_1 = '_'.join([self.class_name, self._get_label()])
         label_2 = '_'.join([self.class_name, self._get_label()])
 
-        self.writer.write_label(label_1)
-
         self._advance(self.WHILE_START)
         self._eat('while')
+        line = self.writer.line
         self._eat('(')
+        mark = self.writer.mark()
         self.write_expression()
+        condition = self.writer.cut(mark)
         self._eat(')')
-        self.writer.write_arithmetic('not')
-        self.writer.write_if(label_2)
+
+        rotated = condition.command(len(condition) - 1) in self.COMPARISONS
+        if rotated:
+            self.writer.write_goto(label_2)
+            self.writer.write_label(label_1)
+        else:
+            self.writer.write_label(label_1)
+            self.writer.paste(condition)
+            self.writer.write_arithmetic('not')
+            self.writer.write_if(label_2)
 
         self._eat('{')
         self.write_statements()
         self._eat('}')
         self._advance(self.WHILE_END)
-        self.writer.write_goto(label_1)
-        self.writer.write_label(label_2)
+        if rotated:
+            self.writer.line = line
+            self.writer.write_label(label_2)
+            self.writer.paste(condition)
+            self.writer.write_if(label_1)
+        else:
+            self.writer.write_goto(label_1)
+            self.writer.write_label(label_2)
 
         return
 
     def write_if(self):
         """
-        Write the VM code for the if clause
+        Write the VM code for the if clause.
+        A condition ending with 'not' branches on its operand instead,
+        and with an else clause a comparison jumps to the then clause,
+        which is moved after the else clause:
+
+            <condition>; if-goto then; <else>; goto end; label then; <then>; label end
+
+        so that no 'not' is needed in either case. Other conditions
+        may be neither 0 nor -1 and keep the 'not; if-goto' test.
 
         :return:
         """
@@ -406,20 +533,41 @@ class JackCompiler(object):
         self.write_expression()
         self._eat(')')
 
-        self.writer.write_arithmetic('not')
-        self.writer.write_if(label_1)
+        negated = self.writer.last_command() == 'not'
+        comparison = self.writer.last_command() in self.COMPARISONS
+        if negated:
+            self.writer.cut(self.writer.mark() - 1)
+
+        mark = self.writer.mark()
         self._eat('{')
         self.write_statements()
         self._eat('}')
-        self.writer.write_goto(label_2)
+        then_code = self.writer.cut(mark)
 
-        self.writer.write_label(label_1)
-        if self._get_the_token() == 'else':
+        if self._get_the_token() == 'else' and comparison:
+            self.writer.write_if(label_1)
             self._eat('else')
             self._eat('{')
             self.write_statements()
             self._eat('}')
-        self.writer.write_label(label_2)
+            self.writer.write_goto(label_2)
+            self.writer.write_label(label_1)
+            self.writer.paste(then_code)
+            self.writer.write_label(label_2)
+        else:
+            if not negated:
+                self.writer.write_arithmetic('not')
+            self.writer.write_if(label_1)
+            self.writer.paste(then_code)
+            self.writer.write_goto(label_2)
+
+            self.writer.write_label(label_1)
+            if self._get_the_token() == 'else':
+                self._eat('else')
+                self._eat('{')
+                self.write_statements()
+                self._eat('}')
+            self.writer.write_label(label_2)
 
         self._advance(self.IF_END)
         return
@@ -475,75 +623,180 @@ class JackCompiler(object):
         :return:
         """
 
-        # Advance over the expression header.
-        self._advance(self.EXPRESSION_START)
-
-        # Compile the expression element by element(term or op)
-        # the op is written if and if only if 2 terms are written.
-        terms_written = 0
-        the_op = None
-        while self._get_the_tag() != self.EXPRESSION_END:
-            if self._get_the_token() in self.OPS:
-                the_op = self._get_the_token()
-                self._eat(the_op)
-            elif self._get_the_tag() == self.TERM_START:
-                self.write_term()
-                terms_written += 1
+        self._write_expressions(self._EXPRESSION)
 
-            if terms_written == 2:
-                print(the_op)
-                if the_op in self.OPS_MAP.keys():
-                    self.writer.write_arithmetic(self.OPS_MAP[the_op])
-                elif the_op == '*':
-                    self.writer.write_call('Math.multiply', 2)
-                elif the_op == '/':
-                    self.writer.write_call('Math.divide', 2)
+        return
 
-                terms_written = 1
+    def write_term(self):
+        """
+        Write the VM code of a term.
+        :return:
+        """
 
-        self._advance(self.EXPRESSION_END)
+        self._write_expressions(self._TERM)
 
         return
 
-    def write_term(self):
+    def write_expression_list(self):
+        """
+        Write the vm code of an expression list with a function call.
+        :return: The number of expressions.
+        """
+
+        return self._write_expressions(self._EXPRESSION_LIST)
+
+    # Steps of _write_expressions(), the steps finishing a
+    # construct are tuples of the step and what it needs.
+    _EXPRESSION, _EXPRESSION_REST, _TERM, _EXPRESSION_LIST, _EXPRESSION_LIST_REST, \
+        _PARENTHESIS_END, _UNARY_END, _CALL_END, _METHOD_END, _ARRAY_END = range(10)
+
+    def _write_expressions(self, start):
+        """
+        Write an expression, a term or an expression list without
+        recursion: what is left to do of every enclosing construct is
+        kept on an explicit stack of steps, so the nesting depth of
+        expressions is only limited by memory.
+
+        :param start: _EXPRESSION, _TERM or _EXPRESSION_LIST.
+        :return: The number of expressions of the last expression list written.
+        """
+
+        writer = self.writer
+        n_args = 0
+        stack = [(start,)]
+        while stack:
+            step = stack.pop()
+            kind = step[0]
+
+            if kind == self._EXPRESSION:
+                # Advance over the expression header.
+                self._advance(self.EXPRESSION_START)
+                stack.append([self._EXPRESSION_REST, 0, None])
+
+            elif kind == self._EXPRESSION_REST:
+                # Compile the expression element by element(term or op)
+                # the op is written if and if only if 2 terms are written,
+                # step holds the number of terms pending and the op.
+                if step[1] == 2:
+                    the_op = step[2]
+                    if self.verbose:
+                        print(the_op)
+                    if the_op in self.OPS_MAP.keys():
+                        writer.write_arithmetic(self.OPS_MAP[the_op])
+                    elif the_op == '*':
+                        writer.write_call('Math.multiply', 2)
+                    elif the_op == '/':
+                        writer.write_call('Math.divide', 2)
+                    step[1] = 1
+
+                if self._get_the_tag() == self.EXPRESSION_END:
+                    self._advance(self.EXPRESSION_END)
+                    continue
+                stack.append(step)
+                if self._get_the_token() in self.OPS:
+                    step[2] = self._get_the_token()
+                    self._eat(step[2])
+                elif self._get_the_tag() == self.TERM_START:
+                    step[1] += 1
+                    stack.append((self._TERM,))
+
+            elif kind == self._TERM:
+                self._write_term_head(stack)
+
+            elif kind == self._EXPRESSION_LIST:
+                self._advance(self.EXPRESSION_LIST_START)
+                stack.append([self._EXPRESSION_LIST_REST, 0])
+
+            elif kind == self._EXPRESSION_LIST_REST:
+                if self._get_the_tag() == self.EXPRESSION_LIST_END:
+                    self._advance(self.EXPRESSION_LIST_END)
+                    n_args = step[1]
+                    continue
+                stack.append(step)
+                if self._get_the_tag() == self.EXPRESSION_START:
+                    step[1] += 1
+                    stack.append((self._EXPRESSION,))
+                else:
+                    self._advance_hard()
+
+            elif kind == self._PARENTHESIS_END:
+                self._eat(')')
+                self._advance(self.TERM_END)
+
+            elif kind == self._UNARY_END:
+                writer.write_arithmetic(self.U_OPS_MAP[step[1]])
+                self._advance(self.TERM_END)
+
+            elif kind == self._CALL_END:
+                func_name = step[1]
+                self._eat(')')
+                if self._write_intrinsic(func_name, n_args) is None:
+                    writer.write_call(func_name, n_args)
+                self._advance(self.TERM_END)
+
+            elif kind == self._METHOD_END:
+                self._eat(')')
+                writer.write_call(step[1], n_args + 1)
+                self._advance(self.TERM_END)
+
+            elif kind == self._ARRAY_END:
+                self._eat(']')
+                writer.write_push(step[1], step[2])
+                writer.write_arithmetic('add')
+                writer.write_pop('pointer', 1)
+                writer.write_push('that', 0)
+                self._advance(self.TERM_END)
+
+        return n_args
+
+    def _write_term_head(self, stack):
+        """
+        Write a term up to its first sub-expression, if any, pushing the
+        steps writing the sub-expression and finishing the term on the stack.
+
+        :param stack: The steps of _write_expressions().
+        :return:
+        """
+
+        writer = self.writer
         self._advance(self.TERM_START)
         the_tag = self._get_the_tag()
         if the_tag in self.CONSTANTS:
             the_token = self._get_the_token()
             if the_token == 'this':
-                self.writer.write_push('pointer', 0)
+                writer.write_push('pointer', 0)
             elif the_token == 'that':
-                self.writer.write_push('pointer', 1)
+                writer.write_push('pointer', 1)
             elif the_tag == '<stringConstant>':
                 string_length = len(the_token)
-                self.writer.write_push('constant', string_length)
-                self.writer.write_call('String.new', 1)
+                writer.write_push('constant', string_length)
+                writer.write_call('String.new', 1)
 
                 # Construct the string in a loop.
                 # For sake of convenience, copy
                 # the new initialized string as many
                 # times as we need to construct it.
-                self.writer.write_pop('temp', 1)
+                writer.write_pop('temp', 1)
                 for _ in range(string_length + 1):
-                    self.writer.write_push('temp', 1)
+                    writer.write_push('temp', 1)
                 for i in range(string_length):
                     char = ord(the_token[i])
-                    self.writer.write_push('constant', char)
-                    self.writer.write_call('String.appendChar', 2)
-                    self.writer.write_pop('temp', 1)
+                    writer.write_push('constant', char)
+                    writer.write_call('String.appendChar', 2)
+                    writer.write_pop('temp', 1)
             elif the_tag == '<keyword>':
                 if the_token == 'true':
-                    self.writer.write_push('constant', 1)
-                    self.writer.write_arithmetic('neg')
+                    writer.write_push('constant', 1)
+                    writer.write_arithmetic('neg')
                 else:
-                    self.writer.write_push('constant', 0)
+                    writer.write_push('constant', 0)
 
             else:
                 if the_token[0] in self.U_OPS_MAP.keys():
-                    self.writer.write_push('constant', the_token[1:])
-                    self.writer.write_arithmetic(the_token[0])
+                    writer.write_push('constant', the_token[1:])
+                    writer.write_arithmetic(the_token[0])
                 else:
-                    self.writer.write_push('constant', the_token)
+                    writer.write_push('constant', the_token)
             self._eat(the_token)
 
         # A static function call.
@@ -556,21 +809,23 @@ class JackCompiler(object):
             func_name = '.'.join([class_name, func_name])
 
             self._eat('(')
-            num_args = self.write_expression_list()
-            self._eat(')')
-            self.writer.write_call(func_name, num_args)
+            stack.append((self._CALL_END, func_name))
+            stack.append((self._EXPRESSION_LIST,))
+            return
 
         elif self._get_the_token() == '(':
             self._eat('(')
-            self.write_expression()
-            self._eat(')')
+            stack.append((self._PARENTHESIS_END,))
+            stack.append((self._EXPRESSION,))
+            return
 
         # An unary op
         elif self._get_the_token() in self.UNARY_OP:
             unary_op = self._get_the_token()
             self._eat(unary_op)
-            self.write_term()
-            self.writer.write_arithmetic(self.U_OPS_MAP[unary_op])
+            stack.append((self._UNARY_END, unary_op))
+            stack.append((self._TERM,))
+            return
 
         # An object operation
         else:
@@ -588,49 +843,83 @@ class JackCompiler(object):
                 method_name = '.'.join([var_tag[1], method_name])
 
                 # Push the object's pointer
-                self.writer.write_push(segment, index)
+                writer.write_push(segment, index)
 
                 self._eat('(')
-                nargs = self.write_expression_list() + 1
-                self._eat(')')
-                self.writer.write_call(method_name, nargs)
+                stack.append((self._METHOD_END, method_name))
+                stack.append((self._EXPRESSION_LIST,))
+                return
 
             # An array addressing
             elif self._get_the_token() == '[':
                 self._eat('[')
-                self.write_expression()
-                self._eat(']')
-
-                self.writer.write_push(segment, index)
-                self.writer.write_arithmetic('add')
-                self.writer.write_pop('pointer', 1)
-                self.writer.write_push('that', 0)
+                stack.append((self._ARRAY_END, segment, index))
+                stack.append((self._EXPRESSION,))
+                return
 
             # Just a variable
             else:
-                self.writer.write_push(segment, index)
+                writer.write_push(segment, index)
 
         self._advance(self.TERM_END)
 
         return
 
-    def write_expression_list(self):
+    def _write_intrinsic(self, func_name, n_args, discard=False):
         """
-        Write the vm code of an expression list with a function call.
-        :return:
+        Expand a call of an OS routine listed in INTRINSICS inline.
+        The arguments are already on the stack, temp 5 and 6
+        are used as scratch registers.
+
+        :param func_name: String. Full name of the called function.
+        :param n_args: Int. Number of arguments pushed.
+        :param discard: Bool. Whether the returned value is dropped anyway.
+        :return: None if the call was not expanded, otherwise
+                 whether a value was left on the stack.
         """
 
-        self._advance(self.EXPRESSION_LIST_START)
-        n_args = 0
-        while self._get_the_tag() != self.EXPRESSION_LIST_END:
-            # print(self._get_the_tag() + 'Fuck')
-            if self._get_the_tag() == self.EXPRESSION_START:
-                n_args += 1
-                self.write_expression()
-            else:
-                self._advance_hard()
-        self._advance(self.EXPRESSION_LIST_END)
-        return n_args
+        if not self.intrinsics or self.INTRINSICS.get(func_name) != n_args:
+            return None
+
+        if func_name == 'Memory.peek':
+            self.writer.write_pop('pointer', 1)
+            self.writer.write_push('that', 0)
+        elif func_name == 'Memory.poke':
+            self.writer.write_pop('temp', 5)
+            self.writer.write_pop('pointer', 1)
+            self.writer.write_push('temp', 5)
+            self.writer.write_pop('that', 0)
+            if not discard:
+                self.writer.write_push('constant', 0)
+        elif func_name == 'Math.abs':
+            # Negate unless positive, -0 is 0 anyway.
+            label = '_'.join([self.class_name, self._get_label()])
+            self.writer.write_pop('temp', 5)
+            self.writer.write_push('temp', 5)
+            self.writer.write_push('temp', 5)
+            self.writer.write_push('constant', 0)
+            self.writer.write_arithmetic('gt')
+            self.writer.write_if(label)
+            self.writer.write_arithmetic('neg')
+            self.writer.write_label(label)
+        else:
+            # Keep the first argument if it strictly wins,
+            # otherwise replace it with the second one.
+            label = '_'.join([self.class_name, self._get_label()])
+            self.writer.write_pop('temp', 6)
+            self.writer.write_pop('temp', 5)
+            self.writer.write_push('temp', 5)
+            self.writer.write_push('temp', 5)
+            self.writer.write_push('temp', 6)
+            self.writer.write_arithmetic('lt' if func_name == 'Math.min' else 'gt')
+            self.writer.write_if(label)
+            self.writer.write_pop('temp', 5)
+            self.writer.write_push('temp', 6)
+            self.writer.write_label(label)
+
+        self.intrinsics_expanded[func_name] = self.intrinsics_expanded.get(func_name, 0) + 1
+
+        return func_name != 'Memory.poke' or not discard
 
     def _advance(self, tag):
         """
@@ -648,7 +937,8 @@ class JackCompiler(object):
         if self._get_the_tag() != tag:
             raise ValueError('No such tag {tag} to advance over'.format(tag=tag))
 
-        print(self._get_the_tag())
+        if self.verbose:
+            print(self._get_the_tag())
         self.progress += 1
 
         return
@@ -659,7 +949,9 @@ class JackCompiler(object):
         This method can't do advancing over a pure tag.
         :return:
         """
-        print(self.parsed_codes[self.progress])
+        if self.verbose:
+            print(self.parsed_codes[self.progress])
+        self._locate()
 
         # if self._get_the_token() == '':
         #     raise ValueError('Hard advancing cannot advance over a pure tag ', self._get_the_tag())
@@ -687,22 +979,35 @@ class JackCompiler(object):
         if self._get_the_token() != token:
             raise ValueError('No {0} to eat, current token is {1}'.format(token, self._get_the_token()))
 
-        print(self._get_the_token())
+        if self.verbose:
+            print(self._get_the_token())
         if len(self.parsed_codes) <= self.progress:
             raise IndexError('No codes to compile anymore')
 
+        self._locate()
         self.progress += 1
 
         return
 
+    def _locate(self):
+        """
+        Tell the writer the source line of the current token.
+        :return:
+        """
+
+        if self.positions is not None and self.progress in self.positions:
+            self.writer.line = self.positions[self.progress][0]
+
+        return
+
     def _get_the_token(self):
         current_line = self.parsed_codes[self.progress].strip()
-        return re.sub(self.TAG_FINDER, '', current_line).strip()
+        return self.TAG_FINDER.sub('', current_line).strip()
 
     def _get_the_tag(self):
 
         current_line = self.parsed_codes[self.progress].strip()
-        tag = re.match(self.TAG_FINDER, current_line).group(0)
+        tag = self.TAG_FINDER.match(current_line).group(0)
         if tag.split()[0] in self.VARIABLES:
             return 'variable'
 
@@ -711,7 +1016,7 @@ class JackCompiler(object):
     def _parse_var_tag(self):
 
         current_line = self.parsed_codes[self.progress].strip()
-        tag = re.match(self.TAG_FINDER, current_line).group(0).strip('<>').split()
+        tag = self.TAG_FINDER.match(current_line).group(0).strip('<>').split()
 
         return tag
 
@@ -719,54 +1024,351 @@ class JackCompiler(object):
 
         self.labels += 1
 
-        return str(self.labels)
+        return '_'.join([self.func_name, str(self.labels)])
+
+
+def _write_subroutine(unit):
+    """
+    Generate the code of a single subroutine, in a worker process.
+
+    :param unit: Tuple (parse result of the subroutine declaration, its
+                 positions, class name, size, intrinsics, optimize).
+    :return: Tuple (VM commands, their source lines, intrinsics expanded,
+             (stats, details) of every optimization pass).
+    """
+    import io
+
+    parsed_codes, positions, class_name, size, intrinsics, optimize = unit
+    output = io.StringIO()
+    compiler = JackCompiler(parsed_codes, class_name, size, output, intrinsics, optimize,
+                            positions=positions, verbose=False)
+    compiler.write_subroutine_dec()
+    compiler.writer.close()
+    stats = [(the_pass.stats, getattr(the_pass, 'details', None)) for the_pass in compiler.passes]
+
+    return (output.getvalue().splitlines(), compiler.writer.source_lines,
+            compiler.intrinsics_expanded, stats)
 
 
-def compile(file):
+def compile(file, output_dir=None, intrinsics=True, optimize=False, cost_report=None,
+            source_map=False, jobs=1, verbose=True):
     """
     Compile a given file or a whole directory.
+    Syntax errors do not stop the compilation of the remaining
+    files, all of them are reported on stderr.
     :param : string
                  A file name or directory name.
-    :return:
+    :param output_dir: string
+                 Directory the .xml and .vm files are written into,
+                 defaults to the next-to-source/current directory layout.
+    :param intrinsics: bool
+                 Whether to expand calls of JackCompiler.INTRINSICS inline.
+    :param optimize: bool
+                 Whether to run the VMOptimizer passes.
+    :param cost_report: CostReport
+                 If given, the generated code is added to it.
+    :param source_map: bool
+                 Whether to write a .vm.map file mapping every VM command
+                 of a .vm file to its jack source line, see SourceMap.
+    :param jobs: int
+                 Number of worker processes generating the subroutines
+                 of a class, the output does not depend on it.
+    :param verbose: bool
+                 Whether to print the tokens and the progress of the compilation.
+    :return: List of (file name, Diagnostic) of all syntax errors found.
     """
     import os
+    import sys
+    diagnostics = []
     if os.path.isdir(file):
         for name in os.listdir(file):
             file_path = os.path.join(file, name)
-            compile(file_path)
+            diagnostics += compile(file_path, output_dir, intrinsics, optimize, cost_report,
+                                   source_map, jobs, verbose)
     else:
-        _compile(file)
+        try:
+            _compile(file, output_dir, intrinsics, optimize, cost_report, source_map, jobs, verbose)
+        except ParseError as e:
+            for diagnostic in e.diagnostics:
+                print('{0}:{1}'.format(file, diagnostic), file=sys.stderr)
+                diagnostics.append((file, diagnostic))
 
-    return
+    return diagnostics
 
-def _compile(file_path):
+def _compile(file_path, output_dir=None, intrinsics=True, optimize=False, cost_report=None,
+             source_map=False, jobs=1, verbose=True):
+    """
+    Compile a single .jack file.
+    :param file_path: string
+    :param output_dir: string, see compile().
+    :param intrinsics: bool, see compile().
+    :param optimize: bool, see compile().
+    :param cost_report: CostReport, see compile().
+    :param source_map: bool, see compile().
+    :param jobs: int, see compile().
+    :param verbose: bool, see compile().
+    :return: The JackCompiler used, None if the file is not a .jack file.
+    """
     if not file_path.endswith('.jack'):
         return
 
 
     # Tokenize the code
     import os
-    print('Processing file', os.path.basename(file_path), '=============================================')
-
-    Tokenizer.tokenize(file_path)
-    token_path = file_path.replace('jack', 'xml')
+    if verbose:
+        print('Processing file', os.path.basename(file_path), '=============================================')
+
+    class_name = os.path.basename(file_path)[:-5]
+    token_path = None
+    vm_path = class_name + '.vm'
+    if output_dir is not None:
+        token_path = os.path.join(output_dir, class_name + '.xml')
+        vm_path = os.path.join(output_dir, class_name + '.vm')
+    positions = []
+    token_path = Tokenizer.tokenize(file_path, token_path, positions)
     with open(token_path) as f:
         tokens = f.readlines()
 
-    # Syntax analysis
-    compiler = CompilationEngine(tokens[1:-1])
+    # Syntax analysis, collecting every syntax error of the file.
+    compiler = CompilationEngine(tokens[1:-1], positions, recover=True, verbose=verbose)
     result = compiler.get_result()
 
     # Compile to VM code
-    print('Processing file', os.path.basename(token_path))
+    if verbose:
+        print('Processing file', os.path.basename(token_path))
     num_fields = compiler.symbol_table.var_count('field')
-    compiler = JackCompiler(result, os.path.basename(token_path)[:-4], num_fields)
+    positions = compiler.result_positions if source_map else None
+    compiler = JackCompiler(result, class_name, num_fields, vm_path, intrinsics, optimize,
+                            positions=positions, verbose=verbose)
+    compiler.write_class(jobs)
+    if source_map:
+        from SourceMap import write_map
+        write_map(vm_path, os.path.basename(file_path), compiler.writer.source_lines)
+
+    if verbose and compiler.intrinsics_expanded:
+        n_calls = sum(compiler.intrinsics_expanded.values())
+        print('Intrinsics expanded in {0}: {1} ({2} calls removed, ~{3} Hack instructions '
+              'of call overhead saved per executed call)'.format(
+                  class_name,
+                  ', '.join('{0} x{1}'.format(name, count)
+                            for name, count in sorted(compiler.intrinsics_expanded.items())),
+                  n_calls, JackCompiler.CALL_OVERHEAD))
+    if verbose and compiler.passes:
+        print('Optimizations in {0}:\n{1}'.format(class_name, report(compiler.passes)))
+    if cost_report is not None:
+        cost_report.add_file(vm_path)
+
+    return compiler
+
+
+# The *_source functions below work on strings only: they never touch the
+# disk, print nothing and share no state, so they can be called from any
+# number of threads at once.
+
+def tokenize_source(source):
+    """
+    Tokenize the source code of a class held in memory.
+    :param source: string, the jack code of the class.
+    :return: string, the token XML, as Tokenizer.tokenize() writes it.
+    """
+    import io
+
+    tokens = io.StringIO()
+    Tokenizer.tokenize_lines(source.splitlines(True), tokens)
+
+    return tokens.getvalue()
+
+
+def parse_source(source):
+    """
+    Parse the source code of a class held in memory.
+    :param source: string, the jack code of the class.
+    :return: string, the parse tree in XML, as CompilationEngine.compile_file() writes it.
+    :raise ParseError: on syntax errors, with all of them.
+    """
+    import io
+
+    output = io.StringIO()
+    writer = XmlWriter(output)
+    for line in _parse_source(source).compilation_result:
+        writer.append(line)
+    writer.close()
+
+    return output.getvalue()
+
+
+def check_source(source):
+    """
+    Look for the syntax errors of a class held in memory.
+    :param source: string, the jack code of the class.
+    :return: list of Diagnostic, empty if there are none.
+    """
+
+    try:
+        _parse_source(source)
+    except ParseError as e:
+        return e.diagnostics
+
+    return []
+
+
+def compile_source(source, class_name, intrinsics=True, optimize=False):
+    """
+    Compile the source code of a class held in memory.
+    :param source: string, the jack code of the class.
+    :param class_name: string, name of the class.
+    :param intrinsics: bool, see compile().
+    :param optimize: bool, see compile().
+    :return: string, the VM code of the class.
+    :raise ParseError: on syntax errors, with all of them.
+    """
+    import io
+
+    output = io.StringIO()
+    _compile_source(source, class_name, output, intrinsics, optimize)
+
+    return output.getvalue()
+
+
+def _parse_source(source):
+    """
+    :return: The CompilationEngine, after parsing the class.
+    """
+    import io
+
+    tokens = io.StringIO()
+    positions = []
+    Tokenizer.tokenize_lines(source.splitlines(True), tokens, positions)
+    tokens = tokens.getvalue().splitlines(True)
+
+    engine = CompilationEngine(tokens[1:-1], positions, recover=True, verbose=False)
+    engine.get_result()
+
+    return engine
+
+
+def _compile_source(source, class_name, output, intrinsics=True, optimize=False,
+                    writer_class=VMWriter):
+    """
+    Compile the source code of a class without touching the disk.
+    :param output: file object the code is written into.
+    :param writer_class: VMWriter or a subclass, e.g. AsmWriter.
+    :return: The JackCompiler used.
+    """
+
+    engine = _parse_source(source)
+    num_fields = engine.symbol_table.var_count('field')
+    compiler = JackCompiler(engine.compilation_result, class_name, num_fields, output,
+                            intrinsics, optimize, writer_class, verbose=False)
     compiler.write_class()
 
-    return
+    return compiler
+
+
+def compile_asm(file, output_dir=None, intrinsics=True, optimize=False):
+    """
+    Compile a given file or a whole directory straight into a single Hack
+    assembly program, named after it, with bootstrap code. No .xml or .vm
+    file is written. The .vm files of the directory that do not come from
+    one of its .jack files, e.g. the OS classes, are translated along.
+    :param : string
+                 A file name or directory name.
+    :param output_dir: string
+                 Directory the .asm file is written into, the current one if None.
+    :param intrinsics: bool, see compile().
+    :param optimize: bool, see compile().
+    :return: List of (file name, Diagnostic) of all syntax errors found,
+             the .asm file is only written if there are none.
+    """
+    import io
+    import os
+    import sys
+    from AsmWriter import AsmWriter, write_bootstrap
+
+    if os.path.isdir(file):
+        directory = file
+        names = sorted(os.listdir(file))
+    else:
+        directory, name = os.path.split(file)
+        names = [name]
+    program = os.path.splitext(os.path.basename(os.path.abspath(file)))[0]
+    classes = [name[:-5] for name in names if name.endswith('.jack')]
+
+    output = io.StringIO()
+    write_bootstrap(output)
+    diagnostics = []
+    n_instructions = 0
+    for name in names:
+        file_path = os.path.join(directory, name)
+        if name.endswith('.jack'):
+            with open(file_path) as f:
+                source = f.read()
+            try:
+                compiler = _compile_source(source, name[:-5], output, intrinsics, optimize,
+                                           AsmWriter)
+            except ParseError as e:
+                for diagnostic in e.diagnostics:
+                    print('{0}:{1}'.format(file_path, diagnostic), file=sys.stderr)
+                    diagnostics.append((file_path, diagnostic))
+                continue
+            n_instructions += compiler.writer.n_instructions
+        elif name.endswith('.vm') and name[:-3] not in classes:
+            writer = AsmWriter(output)
+            with open(file_path) as f:
+                writer.write_vm(f.read())
+            writer.close()
+            n_instructions += writer.n_instructions
+
+    if not diagnostics:
+        asm_path = os.path.join(output_dir or '', program + '.asm')
+        with open(asm_path, 'w') as f:
+            f.write(output.getvalue())
+        print('Wrote {0}: {1} Hack instructions besides the bootstrap'.format(
+            asm_path, n_instructions))
+
+    return diagnostics
 
 
 if __name__ == '__main__':
     import sys
-    file_name = sys.argv[1]
-    compile(file_name)
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description='Compile jack code to VM code.')
+    parser.add_argument('file', help='a .jack file or a directory')
+    parser.add_argument('--no-intrinsics', action='store_true',
+                        help='emit real calls for the OS routines normally expanded inline')
+    parser.add_argument('-O', '--optimize', action='store_true',
+                        help='run the optimization passes over the generated code')
+    parser.add_argument('--cost-report', action='store_true',
+                        help='print the static cost of every generated function')
+    parser.add_argument('--cost-sort', default='hack',
+                        help='column the cost report is sorted by')
+    parser.add_argument('--cost-json', default=None,
+                        help='also write the cost report as JSON into this file')
+    parser.add_argument('--source-map', action='store_true',
+                        help='write a .vm.map file of the jack source line of every VM command')
+    parser.add_argument('--emit', default='vm', choices=['vm', 'asm'],
+                        help='write .vm files, or a single Hack .asm program')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of processes generating the subroutines of a class')
+    args = parser.parse_args()
+    if args.emit == 'asm' and (args.cost_report or args.cost_json):
+        parser.error('the cost report is only available with --emit vm')
+    if args.emit == 'asm':
+        if compile_asm(args.file, intrinsics=not args.no_intrinsics, optimize=args.optimize):
+            sys.exit(1)
+        sys.exit(0)
+
+    costs = None
+    if args.cost_report or args.cost_json:
+        from CostReport import CostReport
+        costs = CostReport()
+    failed = compile(args.file, intrinsics=not args.no_intrinsics, optimize=args.optimize,
+                     cost_report=costs, source_map=args.source_map, jobs=args.jobs,
+                     verbose=not args.cost_report)
+    if args.cost_report:
+        print(costs.format_table(args.cost_sort))
+    if args.cost_json:
+        with open(args.cost_json, 'w') as f:
+            f.write(costs.to_json(args.cost_sort))
+    if failed:
+        sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,106 @@
+# Outlines of jack classes: their class variables and subroutine
+# signatures, from a skeleton parse that skips the subroutine bodies.
+#
+# The engine of each class is kept, so the body of any subroutine can
+# still be parsed on demand with Outline.parse_subroutine().
+
+import io
+import os
+
+import BulkLexer
+from CompilationEngine import CompilationEngine
+from Tokenizer import Tokenizer
+
+
+def parse_skeleton(source, bulk=True):
+    """
+    :param source: String. The jack code of a class.
+    :param bulk: Bool. Whether to lex with BulkLexer, ignored if NumPy is
+                 missing. Its token lines go to the engine as they are,
+                 instead of being written as XML and split again.
+    :return: CompilationEngine, after a skeleton parse of the class.
+    :raise ParseError: on syntax errors in the declarations.
+    """
+
+    if bulk and BulkLexer.available():
+        tokens = BulkLexer.lex(source.encode('utf-8'))
+        token_lines, positions = tokens.xml_lines(), tokens.positions()
+    else:
+        tokens = io.StringIO()
+        positions = []
+        Tokenizer.tokenize_lines(source.splitlines(True), tokens, positions)
+        token_lines = tokens.getvalue().splitlines(True)[1:-1]
+
+    engine = CompilationEngine(token_lines, positions, skeleton=True, verbose=False)
+    engine.get_result()
+
+    return engine
+
+
+class Outline(object):
+    """
+    The outlines of the classes of a project.
+    """
+
+    def __init__(self, path, bulk=True):
+        """
+        :param path: String. A .jack file or a directory of them.
+        :param bulk: Bool. See parse_skeleton().
+        """
+
+        if os.path.isdir(path):
+            files = sorted(os.path.join(path, name) for name in os.listdir(path)
+                           if name.endswith('.jack'))
+        else:
+            files = [path]
+
+        # Skeleton parsed engine of each class, by class name.
+        self.engines = {}
+        for file_path in files:
+            with open(file_path) as f:
+                engine = parse_skeleton(f.read(), bulk)
+            self.engines[engine.class_name] = engine
+
+    def classes(self):
+        """
+        :return: List of dicts, the outline of every class, see CompilationEngine.outline().
+        """
+
+        return [self.engines[name].outline() for name in sorted(self.engines)]
+
+    def parse_subroutine(self, class_name, name):
+        """
+        Parse the body of a subroutine, the result is cached.
+
+        :return: List of strings of compiled tokens of the subroutine declaration.
+        :raise KeyError: if there is no such class or subroutine.
+        """
+
+        return self.engines[class_name].parse_subroutine(name)
+
+    def format(self):
+        """
+        :return: String. The outlines, one declaration per line.
+        """
+
+        lines = []
+        for outline in self.classes():
+            lines.append('class {0}'.format(outline['class']))
+            for kind, var_type, name in outline['class_vars']:
+                lines.append('    {0} {1} {2}'.format(kind, var_type, name))
+            for subroutine in outline['subroutines']:
+                parameters = ', '.join(' '.join(parameter) for parameter in subroutine['parameters'])
+                lines.append('    {0} {1} {2}({3})'.format(subroutine['kind'], subroutine['return_type'],
+                                                         subroutine['name'], parameters))
+
+        return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Print the declarations of jack classes.')
+    parser.add_argument('path', help='a .jack file or a directory of them')
+    args = parser.parse_args()
+
+    print(Outline(args.path).format())
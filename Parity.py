@@ -0,0 +1,431 @@
+# Differential parity harness between the legacy pipeline and the fast paths.
+#
+# The legacy pipeline is the file based one: JackCompiler.compile() writes
+# the tokens and the VM code, CompilationEngine.compile_file() the parse
+# tree of the tokens. Every other path producing the same artifacts, e.g.
+# the in-memory API or the parallel code generation, is run over the same
+# corpus, bundled samples and generated programs, and compared with it
+# stage by stage: token XML, parse XML and VM code. Labels are renumbered
+# in order of appearance before comparing VM code, as their numbering is
+# not part of the meaning of the code.
+
+import contextlib
+import io
+import os
+import random
+import re
+import tempfile
+import time
+
+from CompilationEngine import CompilationEngine, ParseError, XmlWriter, TREE_SUFFIX
+from CompilationEngine import compile_file as parse_files
+from IncrementalCompiler import IncrementalCompiler
+from JackCompiler import JackCompiler, tokenize_source, parse_source, compile_source
+from JackCompiler import compile as compile_files
+from Tokenizer import Tokenizer
+
+
+STAGES = ['tokens', 'xml', 'vm']
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'samples')
+
+_LABEL = re.compile(r'^(label|goto|if-goto) (\S+)$')
+
+
+def legacy(source, class_name):
+    """
+    Compile a class through the file entry points: JackCompiler.compile()
+    writes the tokens and the VM code, CompilationEngine.compile_file()
+    the parse tree of the tokens.
+
+    :param source: String. The jack code of the class.
+    :param class_name: String.
+    :return: Dict of stage to output.
+    """
+
+    outputs = {}
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, class_name + '.jack')
+        output_dir = os.path.join(directory, 'out')
+        os.mkdir(output_dir)
+        with open(file_path, 'w') as f:
+            f.write(source)
+
+        # Syntax errors are reported on stderr as well.
+        with contextlib.redirect_stderr(io.StringIO()):
+            diagnostics = compile_files(file_path, output_dir, verbose=False)
+        with open(os.path.join(output_dir, class_name + '.xml')) as f:
+            outputs['tokens'] = f.read()
+        if diagnostics:
+            outputs['xml'] = outputs['vm'] = _error(ParseError([d for _, d in diagnostics]))
+            return outputs
+
+        parse_files(output_dir)
+        with open(os.path.join(output_dir, class_name + TREE_SUFFIX)) as f:
+            outputs['xml'] = f.read()
+        with open(os.path.join(output_dir, class_name + '.vm')) as f:
+            outputs['vm'] = f.read()
+
+    return outputs
+
+
+def in_memory(source, class_name):
+    """
+    The filesystem-free API of JackCompiler.
+    """
+
+    outputs = {'tokens': tokenize_source(source)}
+    try:
+        outputs['xml'] = parse_source(source)
+        outputs['vm'] = compile_source(source, class_name)
+    except ParseError as e:
+        outputs['xml'] = outputs['vm'] = _error(e)
+
+    return outputs
+
+
+def parallel(source, class_name):
+    """
+    The subroutines generated in worker processes.
+    """
+
+    try:
+        engine = _parse(source)
+        output = io.StringIO()
+        compiler = JackCompiler(engine.compilation_result, class_name,
+                                engine.symbol_table.var_count('field'), output,
+                                positions=engine.result_positions, verbose=False)
+        compiler.write_class(jobs=2)
+    except ParseError as e:
+        return {'vm': _error(e)}
+
+    return {'vm': output.getvalue()}
+
+
+def lazy(source, class_name):
+    """
+    A skeleton parse, completed by parsing every subroutine on demand.
+    """
+
+    tokens, positions = _tokenize(source)
+    engine = CompilationEngine(tokens, positions, recover=True, skeleton=True, verbose=False)
+    output = io.StringIO()
+    result = XmlWriter(output)
+    try:
+        skeleton = engine.get_result()
+        subroutines = iter(engine.subroutines)
+        in_subroutine = False
+        for line in skeleton:
+            if line == '<subroutineDec>':
+                for subroutine_line in engine.parse_subroutine(next(subroutines)['name']):
+                    result.append(subroutine_line)
+                in_subroutine = True
+            elif line == '</subroutineDec>':
+                in_subroutine = False
+            elif not in_subroutine:
+                result.append(line)
+        result.close()
+    except ParseError as e:
+        return {'xml': _error(e)}
+
+    return {'xml': output.getvalue()}
+
+
+def incremental(source, class_name):
+    """
+    The incremental compiler, starting from an empty cache.
+    """
+
+    tokens, positions = _tokenize(source)
+    try:
+        return {'vm': IncrementalCompiler().compile_tokens(tokens, positions, class_name)}
+    except ParseError as e:
+        return {'vm': _error(e)}
+
+
+# The paths compared with the legacy one, with the stages they produce.
+PATHS = {
+    'memory': (in_memory, ['tokens', 'xml', 'vm']),
+    'parallel': (parallel, ['vm']),
+    'lazy': (lazy, ['xml']),
+    'incremental': (incremental, ['vm']),
+}
+
+
+def _tokenize(source):
+    """
+    :return: Tuple (token lines without the <tokens> wrapper, positions).
+    """
+
+    tokens = io.StringIO()
+    positions = []
+    Tokenizer.tokenize_lines(source.splitlines(True), tokens, positions)
+
+    return tokens.getvalue().splitlines(True)[1:-1], positions
+
+
+def _parse(source):
+
+    tokens, positions = _tokenize(source)
+    engine = CompilationEngine(tokens, positions, recover=True, verbose=False)
+    engine.get_result()
+
+    return engine
+
+
+def _error(e):
+
+    return 'error {0}: {1}'.format(type(e).__name__, e)
+
+
+def normalize_labels(vm_code):
+    """
+    :param vm_code: String.
+    :return: String. The code with the labels of every function renamed
+             L0, L1... in order of first appearance.
+    """
+
+    lines = []
+    labels = {}
+    for line in vm_code.splitlines():
+        if line.startswith('function'):
+            labels = {}
+        match = _LABEL.match(line)
+        if match:
+            label = labels.setdefault(match.group(2), 'L{0}'.format(len(labels)))
+            line = '{0} {1}'.format(match.group(1), label)
+        lines.append(line)
+
+    return '\n'.join(lines)
+
+
+def first_difference(expected, actual):
+    """
+    :return: Tuple (line number, expected line, actual line) of the first
+             line the outputs differ in, None if they are the same.
+    """
+
+    expected = expected.splitlines()
+    actual = actual.splitlines()
+    for i in range(max(len(expected), len(actual))):
+        a = expected[i] if i < len(expected) else '<end>'
+        b = actual[i] if i < len(actual) else '<end>'
+        if a != b:
+            return i + 1, a, b
+
+    return None
+
+
+def generate_class(rng, class_name, n_subroutines=8):
+    """
+    Generate a random, syntactically valid class.
+
+    :param rng: random.Random.
+    :param class_name: String.
+    :param n_subroutines: Int.
+    :return: String. The jack code.
+    """
+
+    variables = ['a', 'b', 'x', 'y', 's', 'f']
+    constants = ['0', '1', '7', '255', '32767', 'true', 'false', 'null']
+    ops = ['+', '-', '*', '/', '&', '|', '<', '>', '=']
+
+    def expression(depth=0):
+        if depth > 3 or rng.random() < 0.35:
+            return term(depth)
+        return '{0} {1} {2}'.format(term(depth), rng.choice(ops), expression(depth + 1))
+
+    def term(depth):
+        choice = rng.random()
+        if depth < 3 and choice < 0.15:
+            return '({0})'.format(expression(depth + 1))
+        if depth < 3 and choice < 0.25:
+            return rng.choice(['-', '~']) + term(depth + 1)
+        if choice < 0.3:
+            return 'arr[{0}]'.format(expression(depth + 1))
+        if choice < 0.35:
+            return 'Math.{0}({1}, {2})'.format(rng.choice(['min', 'max']), expression(depth + 1),
+                                               expression(depth + 1))
+        if choice < 0.4:
+            return '{0}.f0({1}, {2})'.format(class_name, expression(depth + 1), term(depth + 1))
+        if choice < 0.42:
+            return '"text{0}"'.format(rng.randint(0, 99))
+        if choice < 0.7:
+            return rng.choice(variables)
+        return rng.choice(constants)
+
+    def statements(depth):
+        code = []
+        for _ in range(rng.randint(1, 4)):
+            kind = rng.random()
+            if depth < 2 and kind < 0.15:
+                code.append('while ({0}) {{ {1} }}'.format(expression(), statements(depth + 1)))
+            elif depth < 2 and kind < 0.3:
+                code.append('if ({0}) {{ {1} }}'.format(expression(), statements(depth + 1)))
+                if rng.random() < 0.5:
+                    code[-1] += ' else {{ {0} }}'.format(statements(depth + 1))
+            elif kind < 0.4:
+                code.append('let arr[{0}] = {1};'.format(expression(), expression()))
+            elif kind < 0.5:
+                code.append('do Output.printInt({0});'.format(expression()))
+            elif kind < 0.55:
+                code.append('do Memory.poke({0}, {1});'.format(expression(), expression()))
+            else:
+                code.append('let {0} = {1};'.format(rng.choice(variables), expression()))
+        return ' '.join(code)
+
+    lines = ['class {0} {{'.format(class_name), '    static int s;', '    field int f;']
+    for i in range(n_subroutines):
+        kind = 'function' if i == 0 else rng.choice(['function', 'method'])
+        lines.append('    {0} int f{1}(int a, int b) {{'.format(kind, i))
+        lines.append('        var int x, y;')
+        lines.append('        var Array arr;')
+        lines.append('        let arr = Array.new(8);')
+        lines.append('        ' + statements(0))
+        lines.append('        return {0};'.format(expression()))
+        lines.append('    }')
+    lines.append('}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def load_corpus(paths, n_generated=0, seed=0):
+    """
+    :param paths: List of .jack files and directories, searched recursively.
+    :param n_generated: Int. Number of generated classes added.
+    :param seed: Int. Seed of the generator.
+    :return: List of (name, class name, source).
+    """
+
+    corpus = []
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(root, name) for root, _, names in os.walk(path)
+                           for name in names if name.endswith('.jack'))
+        else:
+            files = [path]
+        for file_path in files:
+            with open(file_path) as f:
+                corpus.append((file_path, os.path.basename(file_path)[:-5], f.read()))
+
+    rng = random.Random(seed)
+    for i in range(n_generated):
+        class_name = 'Gen{0}'.format(i)
+        corpus.append(('<generated {0}>'.format(i), class_name, generate_class(rng, class_name)))
+
+    return corpus
+
+
+class Parity(object):
+    """
+    Compare the paths with the legacy pipeline over a corpus.
+    """
+
+    def __init__(self, paths=None):
+        """
+        :param paths: List of names of PATHS, all of them if None.
+        """
+
+        self.paths = paths if paths is not None else sorted(PATHS)
+
+        # Seconds spent per path, the legacy one included.
+        self.timings = dict.fromkeys(['legacy'] + self.paths, 0.0)
+
+        # List of (path, stage, name, first difference).
+        self.mismatches = []
+        self.n_classes = 0
+
+    def check(self, name, class_name, source):
+        """
+        Run all the paths over a class and compare their outputs.
+
+        :param name: String. Where the class comes from, for the report.
+        :param class_name: String.
+        :param source: String. The jack code.
+        :return:
+        """
+
+        self.n_classes += 1
+        # The legacy pipeline reports its progress on stdout.
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = self._run('legacy', legacy, source, class_name, STAGES)
+            for path in self.paths:
+                function, stages = PATHS[path]
+                outputs = self._run(path, function, source, class_name, stages)
+                for stage in stages:
+                    a, b = expected[stage], outputs[stage]
+                    if stage == 'vm':
+                        a, b = normalize_labels(a), normalize_labels(b)
+                    difference = first_difference(a, b)
+                    if difference is not None:
+                        self.mismatches.append((path, stage, name, difference))
+
+        return
+
+    def _run(self, path, function, source, class_name, stages):
+        """
+        :return: Dict of stage to output, a crash is the output of all the stages.
+        """
+
+        start = time.perf_counter()
+        try:
+            outputs = function(source, class_name)
+        except Exception as e:
+            outputs = dict.fromkeys(stages, _error(e))
+        self.timings[path] += time.perf_counter() - start
+
+        return outputs
+
+    def format_report(self):
+        """
+        :return: String. A line per path with its mismatches per stage and
+                 its time against the legacy pipeline, then every mismatch.
+        """
+
+        lines = ['{0} classes, {1} mismatches'.format(self.n_classes, len(self.mismatches)), '']
+        lines.append('{0:<12} {1:>7} {2:>7} {3:>7} {4:>10} {5:>8}'.format(
+            'path', *(STAGES + ['seconds', 'speedup'])))
+        lines.append('{0:<12} {1:>7} {2:>7} {3:>7} {4:>10.3f}'.format(
+            'legacy', '', '', '', self.timings['legacy']))
+        for path in self.paths:
+            stages = PATHS[path][1]
+            counts = []
+            for stage in STAGES:
+                if stage not in stages:
+                    counts.append('-')
+                else:
+                    counts.append(sum(1 for mismatch in self.mismatches
+                                      if mismatch[:2] == (path, stage)))
+            speedup = self.timings['legacy'] / self.timings[path] if self.timings[path] else 0
+            lines.append('{0:<12} {1:>7} {2:>7} {3:>7} {4:>10.3f} {5:>7.1f}x'.format(
+                path, *(counts + [self.timings[path], speedup])))
+
+        if self.mismatches:
+            lines.append('')
+        for path, stage, name, (line, expected, actual) in self.mismatches:
+            lines.append('{0} {1} {2}:{3}: expected {4!r}, got {5!r}'.format(
+                path, stage, name, line, expected, actual))
+
+        return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Compare the fast paths with the legacy pipeline.')
+    parser.add_argument('corpus', nargs='*', default=[SAMPLES],
+                        help='.jack files or directories, the bundled samples by default')
+    parser.add_argument('-g', '--generated', type=int, default=20,
+                        help='number of generated classes added to the corpus')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generated classes')
+    parser.add_argument('--paths', default=','.join(sorted(PATHS)),
+                        help='comma separated paths to compare, of ' + ', '.join(sorted(PATHS)))
+    args = parser.parse_args()
+
+    parity = Parity(args.paths.split(','))
+    for name, class_name, source in load_corpus(args.corpus, args.generated, args.seed):
+        parity.check(name, class_name, source)
+    print(parity.format_report())
+    if parity.mismatches:
+        sys.exit(1)
@@ -0,0 +1,724 @@
+# A Python backend for the jack compiler, to run jack programs fast in tests.
+#
+# PyTranspiler walks the same parse result as JackCompiler but writes
+# Python source: one function per subroutine, jack arguments and locals as
+# Python locals, objects and arrays as lists indexed like the this and that
+# segments, strings as __slots__ records. PyRuntime compiles the classes
+# with compile() and links them against Python stubs of the OS classes.
+#
+# Values are 16-bit: +, -, * and / wrap around like on the Hack platform.
+# References are Python objects rather than addresses, so pointer
+# arithmetic is not supported and Memory.peek/poke address a RAM of
+# their own.
+
+import functools
+import io
+import os
+from array import array
+
+from JackCompiler import JackCompiler
+from CompilationEngine import CompilationEngine
+from Tokenizer import Tokenizer
+
+
+INT_TYPES = ['int', 'char', 'boolean']
+COMPARISONS = {'&lt;': '<', '&gt;': '>', '=': '=='}
+
+# Wrap a Python expression into a 16-bit value.
+WRAP = '(({0}) + 32768 & 65535) - 32768'
+
+
+class JackError(Exception):
+    """
+    Raised when a transpiled program calls Sys.error or fails.
+    """
+    pass
+
+
+class _Halt(Exception):
+    pass
+
+
+def mangle(name):
+    """
+    :param name: String. A jack function name, Class.function.
+    :return: String. The Python name of the function, unique since
+             the underscores of the jack name are escaped.
+    """
+
+    return name.replace('_', '_u').replace('.', '__')
+
+
+def statics_name(class_name):
+    """
+    :return: String. The Python name of the list of the statics of a class.
+    """
+
+    return mangle(class_name) + '__static'
+
+
+class PyTranspiler(JackCompiler):
+    """
+    Transpile a jack class from its parse result into Python source.
+
+    Expressions are tuples (code, kind, test, pure): the Python code of
+    the value, 'int', 'ref' or 'any' whether it is known to be a number,
+    the Python code of its truth if it is a comparison (None otherwise),
+    and whether evaluating it calls no function.
+    """
+
+    def __init__(self, parsed_codes, class_name, size, n_statics):
+
+        super(PyTranspiler, self).__init__(parsed_codes, class_name, size, io.StringIO(),
+                                           intrinsics=False, verbose=False)
+        self.n_statics = n_statics
+        self.n_args = 0
+        self.lines = []
+        self.indent = 0
+        self.temps = 0
+
+    def transpile(self):
+        """
+        :return: String. The Python source of the class.
+        """
+
+        self._line('{0} = [0] * {1}'.format(statics_name(self.class_name), self.n_statics))
+        self._line('')
+        self.write_class()
+
+        return '\n'.join(self.lines) + '\n'
+
+    def write_parameter_list(self):
+
+        self.n_args = super(PyTranspiler, self).write_parameter_list()
+
+        return self.n_args
+
+    def write_subroutine_body(self, func_name):
+
+        self._advance(self.FUNC_BODY_START)
+        self._eat('{')
+
+        subroutine_type = self.function_table[func_name]
+        n_vars = self.write_local_var_dec()
+        if subroutine_type == 'method':
+            params = ['this'] + ['a{0}'.format(i + 1) for i in range(self.n_args)]
+        else:
+            params = ['a{0}'.format(i) for i in range(self.n_args)]
+        self._line('def {0}({1}):'.format(mangle('.'.join([self.class_name, func_name])),
+                                          ', '.join(params)))
+        self.indent += 1
+        if n_vars:
+            self._line(' = '.join(['l{0}'.format(i) for i in range(n_vars)] + ['0']))
+        if subroutine_type == 'constructor':
+            self._line('this = [0] * {0}'.format(self.size))
+        self.indent -= 1
+        self._block()
+        self._line('')
+
+        self._eat('}')
+        self._advance(self.FUNC_BODY_END)
+
+        return
+
+    def write_do(self):
+
+        self._advance(self.DO_START)
+        self._eat('do')
+
+        the_name = self._get_the_token()
+        if self._get_the_tag() == self.IDENTIFIER:
+            self._eat(the_name)
+            if self._get_the_token() == '.':
+                self._eat('.')
+                func_name = self._get_the_token()
+                self._eat(func_name)
+                call = self._call('.'.join([the_name, func_name]))
+            else:
+                call = self._call('.'.join([self.class_name, the_name]), 'this')
+        else:
+            var_tag = self._parse_var_tag()
+            self._eat(the_name)
+            self._eat('.')
+            method_name = self._get_the_token()
+            self._eat(method_name)
+            call = self._call('.'.join([var_tag[1], method_name]), self._variable(var_tag))
+
+        self._line(call)
+        self._eat(';')
+        self._advance(self.DO_END)
+
+        return
+
+    def write_return(self):
+
+        self._advance(self.RETURN_START)
+        self._eat('return')
+        if self._get_the_tag() == self.EXPRESSION_START:
+            self._line('return ' + self.write_expression()[0])
+        else:
+            # Like the VM code, which pushes 1.
+            self._line('return 1')
+        self._eat(';')
+        self._advance(self.RETURN_END)
+
+        return
+
+    def write_while(self):
+
+        self._advance(self.WHILE_START)
+        self._eat('while')
+        self._eat('(')
+        self._line('while {0}:'.format(self._test(self.write_expression())))
+        self._eat(')')
+        self._eat('{')
+        self._block()
+        self._eat('}')
+        self._advance(self.WHILE_END)
+
+        return
+
+    def write_if(self):
+
+        self._advance(self.IF_START)
+        self._eat('if')
+        self._eat('(')
+        self._line('if {0}:'.format(self._test(self.write_expression())))
+        self._eat(')')
+        self._eat('{')
+        self._block()
+        self._eat('}')
+        if self._get_the_token() == 'else':
+            self._eat('else')
+            self._line('else:')
+            self._eat('{')
+            self._block()
+            self._eat('}')
+        self._advance(self.IF_END)
+
+        return
+
+    def write_let(self):
+
+        self._advance(self.LET_START)
+        self._eat('let')
+
+        target = self._variable(self._parse_var_tag())
+        self._eat(self._get_the_token())
+
+        index = None
+        if self._get_the_token() == '[':
+            self._eat('[')
+            index = self.write_expression()
+            self._eat(']')
+
+        self._eat('=')
+        value = self.write_expression()
+
+        if index is None:
+            self._line('{0} = {1}'.format(target, value[0]))
+        elif index[3] and value[3]:
+            self._line('{0}[{1}] = {2}'.format(target, index[0], value[0]))
+        else:
+            # Python evaluates the value first, jack the index.
+            temp = self._temp()
+            self._line('{0} = {1}'.format(temp, index[0]))
+            self._line('{0}[{1}] = {2}'.format(target, temp, value[0]))
+
+        self._eat(';')
+        self._advance(self.LET_END)
+
+        return
+
+    def write_expression(self):
+        """
+        :return: Tuple, the expression, see the class documentation.
+        """
+
+        self._advance(self.EXPRESSION_START)
+
+        # Jack has no precedence, operators apply from left to right.
+        value = None
+        the_op = None
+        while self._get_the_tag() != self.EXPRESSION_END:
+            if self._get_the_token() in self.OPS:
+                the_op = self._get_the_token()
+                self._eat(the_op)
+            else:
+                term = self.write_term()
+                value = term if value is None else self._binary(the_op, value, term)
+
+        self._advance(self.EXPRESSION_END)
+
+        return value
+
+    def write_term(self):
+        """
+        :return: Tuple, the term as an expression.
+        """
+
+        self._advance(self.TERM_START)
+        the_tag = self._get_the_tag()
+        if the_tag in self.CONSTANTS:
+            the_token = self._get_the_token()
+            if the_token == 'this':
+                term = ('this', 'ref', None, True)
+            elif the_tag == '<stringConstant>':
+                term = ('_string({0!r})'.format(the_token), 'ref', None, True)
+            elif the_tag == '<keyword>':
+                term = ('-1' if the_token == 'true' else '0', 'int', None, True)
+            elif the_token[0] == '-':
+                term = ('(' + WRAP.format('-' + the_token[1:]) + ')', 'int', None, True)
+            elif the_token[0] == '~':
+                term = ('(~{0})'.format(the_token[1:]), 'int', None, True)
+            else:
+                term = (the_token, 'int', None, True)
+            self._eat(the_token)
+
+        # A static function call.
+        elif the_tag == self.IDENTIFIER:
+            class_name = self._get_the_token()
+            self._eat(class_name)
+            self._eat('.')
+            func_name = self._get_the_token()
+            self._eat(func_name)
+            term = (self._call('.'.join([class_name, func_name])), 'any', None, False)
+
+        elif self._get_the_token() == '(':
+            self._eat('(')
+            term = self.write_expression()
+            self._eat(')')
+
+        elif self._get_the_token() in self.UNARY_OP:
+            unary_op = self._get_the_token()
+            self._eat(unary_op)
+            operand = self.write_term()
+            if unary_op == '-':
+                term = ('(' + WRAP.format('-' + operand[0]) + ')', 'int', None, operand[3])
+            elif operand[2] is not None:
+                # Not of a comparison, -1 or 0.
+                term = ('(0 if {0} else -1)'.format(operand[2]), 'int',
+                        'not ({0})'.format(operand[2]), operand[3])
+            else:
+                term = ('(~{0})'.format(operand[0]), 'int', None, operand[3])
+
+        else:
+            var_name = self._get_the_token()
+            var_tag = self._parse_var_tag()
+            variable = self._variable(var_tag)
+            self._eat(var_name)
+
+            if self._get_the_token() == '.':
+                self._eat('.')
+                method_name = self._get_the_token()
+                self._eat(method_name)
+                term = (self._call('.'.join([var_tag[1], method_name]), variable),
+                        'any', None, False)
+
+            elif self._get_the_token() == '[':
+                self._eat('[')
+                index = self.write_expression()
+                self._eat(']')
+                term = ('{0}[{1}]'.format(variable, index[0]), 'any', None, index[3])
+
+            else:
+                kind = 'int' if var_tag[1] in INT_TYPES else 'ref'
+                term = (variable, kind, None, True)
+
+        self._advance(self.TERM_END)
+
+        return term
+
+    def write_expression_list(self):
+        """
+        :return: List of expressions.
+        """
+
+        self._advance(self.EXPRESSION_LIST_START)
+        expressions = []
+        while self._get_the_tag() != self.EXPRESSION_LIST_END:
+            if self._get_the_tag() == self.EXPRESSION_START:
+                expressions.append(self.write_expression())
+            else:
+                self._advance_hard()
+        self._advance(self.EXPRESSION_LIST_END)
+
+        return expressions
+
+    def _binary(self, the_op, left, right):
+        """
+        :return: Tuple, the expression applying a binary operator.
+        """
+
+        pure = left[3] and right[3]
+        if the_op in ('+', '-', '*'):
+            code = '{0} {1} {2}'.format(left[0], the_op, right[0])
+            return '(' + WRAP.format(code) + ')', 'int', None, pure
+        if the_op == '/':
+            return '_divide({0}, {1})'.format(left[0], right[0]), 'int', None, False
+        if the_op in ('&amp;', '|'):
+            op = '&' if the_op == '&amp;' else '|'
+            test = None
+            if left[2] is not None and right[2] is not None and right[3]:
+                test = '({0}) {1} ({2})'.format(left[2], 'and' if op == '&' else 'or', right[2])
+            return '({0} {1} {2})'.format(left[0], op, right[0]), 'int', test, pure
+
+        op = COMPARISONS[the_op]
+        if op == '==' and 'int' not in (left[1], right[1]):
+            # Objects are equal if they are the same one.
+            test = '_eq({0}, {1})'.format(left[0], right[0])
+        else:
+            test = '{0} {1} {2}'.format(left[0], op, right[0])
+
+        return '(-1 if {0} else 0)'.format(test), 'int', test, pure
+
+    def _test(self, expression):
+        """
+        :return: String. The Python condition of a jack condition. Like
+                 the VM's 'not; if-goto', only -1 is true, unless the
+                 condition is a comparison.
+        """
+
+        if expression[2] is not None:
+            return expression[2]
+
+        return '{0} == -1'.format(expression[0])
+
+    def _call(self, func_name, this=None):
+        """
+        Parse the arguments of a call.
+
+        :param func_name: String. Full name of the called function.
+        :param this: String. The object a method is called on.
+        :return: String. The Python call.
+        """
+
+        self._eat('(')
+        args = [expression[0] for expression in self.write_expression_list()]
+        self._eat(')')
+        if this is not None:
+            args.insert(0, this)
+
+        return '{0}({1})'.format(mangle(func_name), ', '.join(args))
+
+    def _variable(self, var_tag):
+        """
+        :param var_tag: List, kind, type and index of a variable.
+        :return: String. The Python code of the variable.
+        """
+
+        kind, index = var_tag[0], var_tag[2]
+        if kind == 'VAR':
+            return 'l' + index
+        if kind == 'ARG':
+            return 'a' + index
+        if kind == 'field':
+            return 'this[{0}]'.format(index)
+
+        return '{0}[{1}]'.format(statics_name(self.class_name), index)
+
+    def _block(self):
+        """
+        Write the statements of a block, pass if there are none.
+        """
+
+        self.indent += 1
+        n_lines = len(self.lines)
+        self.write_statements()
+        if len(self.lines) == n_lines:
+            self._line('pass')
+        self.indent -= 1
+
+        return
+
+    def _temp(self):
+
+        self.temps += 1
+
+        return '_t{0}'.format(self.temps)
+
+    def _line(self, code):
+
+        self.lines.append('    ' * self.indent + code if code else '')
+
+        return
+
+
+def transpile_source(source, class_name):
+    """
+    :param source: String. The jack code of a class.
+    :param class_name: String.
+    :return: String. The Python source of the class.
+    """
+
+    tokens = io.StringIO()
+    positions = []
+    Tokenizer.tokenize_lines(source.splitlines(True), tokens, positions)
+    tokens = tokens.getvalue().splitlines(True)
+
+    engine = CompilationEngine(tokens[1:-1], positions, recover=True, verbose=False)
+    result = engine.get_result()
+    table = engine.symbol_table
+
+    return PyTranspiler(result, class_name, table.var_count('field'),
+                        table.var_count('static')).transpile()
+
+
+class JackString(object):
+    """
+    A jack String.
+    """
+
+    __slots__ = ('chars', 'capacity')
+
+    def __init__(self, capacity, chars=None):
+
+        self.capacity = capacity
+        self.chars = chars if chars is not None else []
+
+
+def _string(text):
+
+    return JackString(len(text), [ord(c) for c in text])
+
+
+def _eq(a, b):
+
+    return a is b or (a.__class__ is int and a == b)
+
+
+def _divide(x, y):
+
+    if y == 0:
+        raise JackError('Sys.error 3: division by zero')
+    q = abs(x) // abs(y)
+
+    return ((q if (x < 0) == (y < 0) else -q) + 32768 & 65535) - 32768
+
+
+class PyRuntime(object):
+    """
+    Link transpiled jack classes against the OS stubs and run them.
+    """
+
+    def __init__(self):
+
+        self.output = []
+        self.input = []
+        self.ram = array('h', bytes(2 * 32768))
+        self.sources = {}
+        self.namespace = {'_string': _string, '_eq': _eq, '_divide': _divide}
+        for name, function in OS.items():
+            self.namespace[mangle(name)] = functools.partial(function, self)
+
+    def load_source(self, source, class_name):
+        """
+        Transpile a jack class and link it into the program.
+
+        :param source: String. The jack code of the class.
+        :param class_name: String.
+        :return:
+        """
+
+        python_source = transpile_source(source, class_name)
+        self.sources[class_name] = python_source
+        exec(compile(python_source, '<jack {0}>'.format(class_name), 'exec'), self.namespace)
+
+        return
+
+    def load_file(self, path):
+        """
+        :param path: String. A .jack file or a directory of them.
+        :return:
+        """
+
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith('.jack'):
+                    self.load_file(os.path.join(path, name))
+            return
+
+        with open(path) as f:
+            self.load_source(f.read(), os.path.basename(path)[:-5])
+
+        return
+
+    def run(self, entry=None):
+        """
+        Run the program until its entry function returns or Sys.halt is called.
+
+        :param entry: String. Function to start with, Sys.init if a jack
+                      class defines it, Main.main otherwise.
+        :return: The value returned by the entry function, None if halted.
+        """
+
+        if entry is None:
+            entry = 'Sys.init' if 'Sys' in self.sources else 'Main.main'
+        function = self.namespace.get(mangle(entry))
+        if function is None:
+            raise JackError('No entry function {0}'.format(entry))
+        try:
+            return function()
+        except _Halt:
+            return None
+        except RecursionError:
+            raise JackError('Stack overflow')
+
+    def new_string(self, text):
+
+        return _string(text)
+
+    def output_text(self):
+        """
+        :return: String. What the program printed.
+        """
+
+        return ''.join(self.output)
+
+
+# The OS stubs, taking the runtime first.
+
+def _sqrt(rt, x):
+    if x < 0:
+        raise JackError('Sys.error 4: square root of a negative number')
+    y = 0
+    while (y + 1) * (y + 1) <= x:
+        y += 1
+    return y
+
+
+def _append_char(rt, s, c):
+    if len(s.chars) >= s.capacity:
+        raise JackError('Sys.error 17: string is full')
+    s.chars.append(c)
+    return s
+
+
+def _erase_last_char(rt, s):
+    if s.chars:
+        s.chars.pop()
+    return 0
+
+
+def _int_value(rt, s):
+    digits = ''
+    for i, c in enumerate(s.chars):
+        if 48 <= c <= 57 or (i == 0 and c == 45):
+            digits += chr(c)
+        else:
+            break
+    return int(digits) if digits not in ('', '-') else 0
+
+
+def _set_int(rt, s, value):
+    text = str(value)
+    if len(text) > s.capacity:
+        raise JackError('Sys.error 19: string too short')
+    s.chars[:] = [ord(c) for c in text]
+    return 0
+
+
+def _print_char(rt, c):
+    if c == 128:
+        rt.output.append('\n')
+    elif c == 129:
+        if rt.output:
+            rt.output.pop()
+    else:
+        rt.output.append(chr(c))
+    return 0
+
+
+def _read_line(rt, message):
+    rt.output.append(''.join(map(chr, message.chars)))
+    line = rt.input.pop(0) if rt.input else ''
+    rt.output.append(line + '\n')
+    return line
+
+
+def _poke(rt, address, value):
+    rt.ram[address] = value
+    return 0
+
+
+def _halt(rt):
+    raise _Halt()
+
+
+def _error(rt, code):
+    raise JackError('Sys.error {0}'.format(code))
+
+
+def _stub(rt, *args):
+    return 0
+
+
+OS = {
+    'Math.init': _stub,
+    'Math.multiply': lambda rt, x, y: (x * y + 32768 & 65535) - 32768,
+    'Math.divide': lambda rt, x, y: _divide(x, y),
+    'Math.sqrt': _sqrt,
+    'Math.abs': lambda rt, x: (abs(x) + 32768 & 65535) - 32768,
+    'Math.min': lambda rt, x, y: min(x, y),
+    'Math.max': lambda rt, x, y: max(x, y),
+    'Memory.init': _stub,
+    'Memory.peek': lambda rt, address: rt.ram[address],
+    'Memory.poke': _poke,
+    'Memory.alloc': lambda rt, size: [0] * size,
+    'Memory.deAlloc': _stub,
+    'Array.new': lambda rt, size: [0] * size,
+    'Array.dispose': _stub,
+    'String.new': lambda rt, capacity: JackString(capacity),
+    'String.dispose': _stub,
+    'String.length': lambda rt, s: len(s.chars),
+    'String.charAt': lambda rt, s, i: s.chars[i],
+    'String.setCharAt': lambda rt, s, i, c: s.chars.__setitem__(i, c),
+    'String.appendChar': _append_char,
+    'String.eraseLastChar': _erase_last_char,
+    'String.intValue': _int_value,
+    'String.setInt': _set_int,
+    'String.newLine': lambda rt: 128,
+    'String.backSpace': lambda rt: 129,
+    'String.doubleQuote': lambda rt: 34,
+    'Output.init': _stub,
+    'Output.moveCursor': _stub,
+    'Output.printChar': _print_char,
+    'Output.printString': lambda rt, s: rt.output.append(''.join(map(chr, s.chars))),
+    'Output.printInt': lambda rt, i: rt.output.append(str(i)),
+    'Output.println': lambda rt: rt.output.append('\n'),
+    'Output.backSpace': lambda rt: _print_char(rt, 129),
+    'Screen.init': _stub,
+    'Screen.clearScreen': _stub,
+    'Screen.setColor': _stub,
+    'Screen.drawPixel': _stub,
+    'Screen.drawLine': _stub,
+    'Screen.drawRectangle': _stub,
+    'Screen.drawCircle': _stub,
+    'Keyboard.init': _stub,
+    'Keyboard.keyPressed': _stub,
+    'Keyboard.readChar': lambda rt: ord((rt.input.pop(0) or '\n')[0]) if rt.input else 128,
+    'Keyboard.readLine': lambda rt, message: _string(_read_line(rt, message)),
+    'Keyboard.readInt': lambda rt, message: int(_read_line(rt, message) or 0),
+    'Sys.init': _stub,
+    'Sys.halt': _halt,
+    'Sys.error': _error,
+    'Sys.wait': _stub,
+}
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Transpile jack code to Python and run it.')
+    parser.add_argument('path', help='a .jack file or a directory')
+    parser.add_argument('--entry', default=None, help='function to start with')
+    parser.add_argument('--emit', action='store_true', help='print the Python source instead')
+    args = parser.parse_args()
+
+    runtime = PyRuntime()
+    runtime.load_file(args.path)
+    if args.emit:
+        for python_source in runtime.sources.values():
+            print(python_source)
+    else:
+        runtime.run(args.entry)
+        print(runtime.output_text())
@@ -0,0 +1,106 @@
+# Source maps from generated VM code back to jack source lines.
+#
+# A .vm.map file sits next to its .vm file and holds, as JSON, the name of
+# the jack source and the source line of every VM command of the .vm file,
+# in order. The lines are stored as runs: 'delta:count' means the next
+# count commands come from the line delta lines after the previous run's.
+
+import difflib
+import json
+import os
+
+
+VERSION = 1
+
+
+def encode(lines):
+    """
+    :param lines: List of ints, the source line of every command.
+    :return: String. The delta-encoded runs.
+    """
+
+    runs = []
+    previous = 0
+    i = 0
+    while i < len(lines):
+        count = 1
+        while i + count < len(lines) and lines[i + count] == lines[i]:
+            count += 1
+        runs.append('{0}:{1}'.format(lines[i] - previous, count))
+        previous = lines[i]
+        i += count
+
+    return ','.join(runs)
+
+
+def decode(mappings):
+    """
+    :param mappings: String, see encode().
+    :return: List of ints, the source line of every command.
+    """
+
+    lines = []
+    line = 0
+    for run in mappings.split(',') if mappings else []:
+        delta, count = run.split(':')
+        line += int(delta)
+        lines.extend([line] * int(count))
+
+    return lines
+
+
+def realign(before, after, lines):
+    """
+    Carry the source lines of commands through an optimization.
+    Kept commands keep their line, rewritten ones take the line of the
+    command they replace, inserted ones the line of the command before.
+
+    :param before: List of strings, the commands given to the optimizer.
+    :param after: List of strings, the commands it returned.
+    :param lines: List of ints, the source lines of before.
+    :return: List of ints, the source lines of after.
+    """
+
+    new_lines = []
+    matcher = difflib.SequenceMatcher(None, before, after, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal' or (tag == 'replace' and i2 - i1 == j2 - j1):
+            new_lines.extend(lines[i1:i2])
+        elif tag in ('replace', 'insert'):
+            line = lines[i1] if tag == 'replace' else (new_lines[-1] if new_lines else lines[0])
+            new_lines.extend([line] * (j2 - j1))
+
+    return new_lines
+
+
+def write_map(path, source, lines):
+    """
+    :param path: String. Name of the .vm file the map is written for.
+    :param source: String. Name of the jack source.
+    :param lines: List of ints, the source line of every command.
+    :return: String. Name of the map file.
+    """
+
+    map_path = path + '.map'
+    with open(map_path, 'w') as f:
+        json.dump({'version': VERSION, 'file': os.path.basename(path),
+                   'source': source, 'mappings': encode(lines)}, f)
+
+    return map_path
+
+
+def read_map(path):
+    """
+    :param path: String. Name of a .vm file.
+    :return: Tuple (source, lines) of its map, None if it has none.
+    """
+
+    try:
+        with open(path + '.map') as f:
+            source_map = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if source_map.get('version') != VERSION:
+        return None
+
+    return source_map['source'], decode(source_map['mappings'])
@@ -13,46 +13,90 @@ class Tokenizer(object):
 
 
     @staticmethod
-    def tokenize(file_name):
+    def tokenize(file_name, output_path=None, positions=None, bulk=False):
         """
         Tokenize a single file.
         @param: file_name: file to be tokenized.
+        @param: output_path: where the tokens are written, defaults to
+                             the .xml file next to the source.
+        @param: positions: List, if given the (line, column) of every
+                           written token is appended to it, both 1-based.
+        @param: bulk: Bool, whether to use the vectorized BulkLexer, for
+                      very large sources. Ignored if NumPy is missing.
+        @return: String, the path of the written tokens.
         """
+        import os
+        import BulkLexer
+
+        if output_path is None:
+            output_path = os.path.splitext(file_name)[0] + '.xml'
+
+        if bulk and BulkLexer.available():
+            with open(file_name, 'rb') as f:
+                data = f.read()
+            with open(output_path, 'w') as output:
+                BulkLexer.tokenize(data, output, positions)
+            return output_path
+
         with open(file_name, 'r') as f:
             code_flow = f.readlines()
-        
+
+        with open(output_path, 'w') as output:
+            Tokenizer.tokenize_lines(code_flow, output, positions)
+
+        return output_path
+
+    @staticmethod
+    def tokenize_lines(code_flow, output, positions=None):
+        """
+        Tokenize the lines of a source file.
+        @param code_flow: List of strings, the lines of the source.
+        @param output: File object, into which the tokens are written.
+        @param positions: List, see tokenize().
+        """
         # Start tokenizing the code line by line.
-        with open(file_name[0:file_name.find('.')] + '.xml', 'w') as output:
-            output.write('<tokens>\n')
-            for line in code_flow:
-                # Ommit annotations
-                line = line.strip()
-                if line.startswith('//') or line.startswith('/**') or line.startswith('*'):
-                    continue
-                # Ommit inline annotations
-                an_pos = line.find('//')
-                if an_pos > 0:
-                    line = line[:an_pos]
-                
-                Tokenizer.tokenize_line(line.strip(), output)
-            output.write('</tokens>')
+        output.write('<tokens>\n')
+        for line_number, line in enumerate(code_flow, 1):
+            # Ommit annotations
+            offset = len(line) - len(line.lstrip())
+            line = line.strip()
+            if line.startswith('//') or line.startswith('/**') or line.startswith('*'):
+                continue
+            # Ommit inline annotations
+            an_pos = line.find('//')
+            if an_pos > 0:
+                line = line[:an_pos]
+
+            Tokenizer.tokenize_line(line.strip(), output, positions, line_number, offset)
+        output.write('</tokens>')
+
+        return
 
     @staticmethod
-    def tokenize_line(line, output):
+    def tokenize_line(line, output, positions=None, line_number=0, offset=0):
         """
         Tokenize a line of code
         @param line: String, a line of code.
         @param output: File object, into which 
                        tokenized codes are written.
+        @param positions: List, receives the (line, column) of each token.
+        @param line_number: Int, line number of the line in its file.
+        @param offset: Int, number of characters stripped off the line's head.
         """
+        def emit(code, start):
+            output.write(code)
+            if positions is not None:
+                positions.append((line_number, offset + start + 1))
+
         current_token = ''
+        token_start = 0
         string_mod = False
         constant_mod = False
-        for c in line:
+        for i, c in enumerate(line):
             if string_mod:
                 if c == '\"':
                     string_mod = False
-                    output.write('    <stringConstant> ' + current_token[1:] + ' </stringConstant>\n')
+                    emit('    <stringConstant> ' + current_token[1:] + ' </stringConstant>\n', token_start)
                     current_token = ''
                 else:
                     current_token += c
@@ -62,47 +106,59 @@ class Tokenizer(object):
                     current_token += c
                 else:
                     constant_mod = False
-                    output.write('    <integerConstant> ' + current_token + ' </integerConstant>\n')
+                    emit('    <integerConstant> ' + current_token + ' </integerConstant>\n', token_start)
                     current_token = ''
                     if c in Tokenizer.SYMBOLS:
-                        output.write('    <symbol> ' + c + ' </symbol>\n')
+                        emit('    <symbol> ' + c + ' </symbol>\n', i)
                     else:
                         continue
                     
             elif c in Tokenizer.SYMBOLS:
                 if current_token != '':
                     if current_token in Tokenizer.KEYWORDS:
-                        output.write('    <keyword> ' + current_token + ' </keyword>\n')
+                        emit('    <keyword> ' + current_token + ' </keyword>\n', token_start)
                     else:
-                        output.write('    <identifier> ' + current_token + ' </identifier>\n')
+                        emit('    <identifier> ' + current_token + ' </identifier>\n', token_start)
                     current_token = ''
                 if c == '>':
-                    output.write('    <symbol> ' + '&gt;' + ' </symbol>\n')
+                    emit('    <symbol> ' + '&gt;' + ' </symbol>\n', i)
                 elif c == '<':
-                    output.write('    <symbol> ' + '&lt;' + ' </symbol>\n')
+                    emit('    <symbol> ' + '&lt;' + ' </symbol>\n', i)
                 elif c == '&':
-                    output.write('    <symbol> ' + '&amp;' + ' </symbol>\n')
+                    emit('    <symbol> ' + '&amp;' + ' </symbol>\n', i)
                 else:
-                    output.write('    <symbol> ' + c + ' </symbol>\n')
+                    emit('    <symbol> ' + c + ' </symbol>\n', i)
                 current_token = ''
             elif c == ' ':
                 if current_token in Tokenizer.KEYWORDS:
-                    output.write('    <keyword> ' + current_token + ' </keyword>\n')
+                    emit('    <keyword> ' + current_token + ' </keyword>\n', token_start)
                 elif current_token != '':
-                    output.write('    <identifier> ' + current_token + ' </identifier>\n')
+                    emit('    <identifier> ' + current_token + ' </identifier>\n', token_start)
                 
                 current_token = ''
             elif c == '\"':
                   string_mod = True
+                  token_start = i
                   current_token += c
                   
             elif c in Tokenizer.INTEGERS and current_token == '':
                 constant_mod = True
+                token_start = i
                 current_token += c
             
             else:
+                if current_token == '':
+                    token_start = i
                 current_token += c
 
+        # Flush the token ending the line.
+        if constant_mod:
+            emit('    <integerConstant> ' + current_token + ' </integerConstant>\n', token_start)
+        elif not string_mod and current_token in Tokenizer.KEYWORDS:
+            emit('    <keyword> ' + current_token + ' </keyword>\n', token_start)
+        elif not string_mod and current_token != '':
+            emit('    <identifier> ' + current_token + ' </identifier>\n', token_start)
+
 
 def tokenize(file_name):
     import os
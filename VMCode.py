@@ -0,0 +1,370 @@
+# An in-memory representation of VM code.
+#
+# The commands of a function are kept in FunctionCode as parallel array
+# columns: the opcode, two int operands and the jack source line. Label
+# and function names are interned in a per-function name table, operands
+# of commands naming something hold the index of the name. VMWriter builds
+# a FunctionCode per function and hands it, once finished, to a sink:
+# TextSink writes the usual .vm text, BinarySink a compact binary form,
+# MemorySink keeps the functions and NullSink only counts them.
+#
+# The VMOptimizer passes are not ported to the columns: when optimizing,
+# VMWriter converts each function to text and back around them.
+
+import struct
+import sys
+from array import array
+from enum import IntEnum
+
+
+class Op(IntEnum):
+    PUSH = 0
+    POP = 1
+    ADD = 2
+    SUB = 3
+    NEG = 4
+    EQ = 5
+    GT = 6
+    LT = 7
+    AND = 8
+    OR = 9
+    NOT = 10
+    LABEL = 11
+    GOTO = 12
+    IF_GOTO = 13
+    FUNCTION = 14
+    CALL = 15
+    RETURN = 16
+
+
+class Segment(IntEnum):
+    CONSTANT = 0
+    LOCAL = 1
+    ARGUMENT = 2
+    THIS = 3
+    THAT = 4
+    POINTER = 5
+    TEMP = 6
+    STATIC = 7
+
+
+# VM text of the opcodes and segments, indexed by value.
+OP_NAMES = ['push', 'pop', 'add', 'sub', 'neg', 'eq', 'gt', 'lt', 'and', 'or', 'not',
+            'label', 'goto', 'if-goto', 'function', 'call', 'return']
+SEGMENT_NAMES = ['constant', 'local', 'argument', 'this', 'that', 'pointer', 'temp', 'static']
+
+OPS = dict((name, Op(i)) for i, name in enumerate(OP_NAMES))
+SEGMENTS = dict((name, Segment(i)) for i, name in enumerate(SEGMENT_NAMES))
+
+# Commands whose first operand is a name.
+NAMED = frozenset([Op.LABEL, Op.GOTO, Op.IF_GOTO, Op.FUNCTION, Op.CALL])
+
+MAGIC = b'JVM1'
+
+
+class FunctionCode(object):
+    """
+    The commands of a function, in array columns.
+    """
+
+    def __init__(self):
+
+        self.ops = array('B')
+        self.a = array('i')
+        self.b = array('i')
+        self.lines = array('i')
+        self.names = []
+        self._name_ids = {}
+
+    def __len__(self):
+
+        return len(self.ops)
+
+    def name_id(self, name):
+        """
+        :param name: String. A label or function name.
+        :return: Int. Its index in self.names, added if new.
+        """
+
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = self._name_ids[name] = len(self.names)
+            self.names.append(name)
+
+        return name_id
+
+    def append(self, op, a=0, b=0, line=0):
+        """
+        :param op: Op.
+        :param a: Int. Segment, or name index of named commands.
+        :param b: Int. Index, number of locals or of arguments.
+        :param line: Int. The jack source line.
+        :return:
+        """
+
+        self.ops.append(op)
+        self.a.append(a)
+        self.b.append(b)
+        self.lines.append(line)
+
+        return
+
+    def append_text(self, command, line=0):
+        """
+        :param command: String. A VM command.
+        :param line: Int. The jack source line.
+        :return:
+        """
+
+        parts = command.split()
+        try:
+            op = OPS[parts[0]]
+            if op in NAMED:
+                self.append(op, self.name_id(parts[1]), int(parts[2]) if len(parts) > 2 else 0, line)
+            elif op == Op.PUSH or op == Op.POP:
+                self.append(op, SEGMENTS[parts[1]], int(parts[2]), line)
+            else:
+                self.append(op, 0, 0, line)
+        except (KeyError, IndexError, ValueError):
+            raise ValueError('Unknown VM command {0}'.format(command))
+
+        return
+
+    @classmethod
+    def from_text(cls, commands, lines=None):
+        """
+        :param commands: List of strings, VM commands.
+        :param lines: List of ints, their source lines.
+        :return: FunctionCode.
+        """
+
+        code = cls()
+        for i, command in enumerate(commands):
+            code.append_text(command, lines[i] if lines is not None else 0)
+
+        return code
+
+    def command(self, i):
+        """
+        :return: String. The VM text of the i-th command.
+        """
+
+        op = self.ops[i]
+        if op <= Op.POP:
+            return '{0} {1} {2}'.format(OP_NAMES[op], SEGMENT_NAMES[self.a[i]], self.b[i])
+        if op == Op.FUNCTION or op == Op.CALL:
+            return '{0} {1} {2}'.format(OP_NAMES[op], self.names[self.a[i]], self.b[i])
+        if op in NAMED:
+            return '{0} {1}'.format(OP_NAMES[op], self.names[self.a[i]])
+
+        return OP_NAMES[op]
+
+    def text(self):
+        """
+        :return: List of strings, the VM commands.
+        """
+
+        return [self.command(i) for i in range(len(self.ops))]
+
+    def cut(self, mark):
+        """
+        Take off the commands from a position on.
+
+        :param mark: Int. Position of the first command taken.
+        :return: FunctionCode of the commands taken.
+        """
+
+        tail = FunctionCode()
+        tail.extend(self, mark)
+        del self.ops[mark:]
+        del self.a[mark:]
+        del self.b[mark:]
+        del self.lines[mark:]
+
+        return tail
+
+    def extend(self, other, start=0):
+        """
+        Append the commands of another FunctionCode, from a position on.
+
+        :param other: FunctionCode.
+        :param start: Int.
+        :return:
+        """
+
+        for i in range(start, len(other.ops)):
+            op = other.ops[i]
+            a = other.a[i]
+            if op in NAMED:
+                a = self.name_id(other.names[a])
+            self.append(op, a, other.b[i], other.lines[i])
+
+        return
+
+    def to_bytes(self):
+        """
+        :return: Bytes. The binary form of the function, see from_bytes().
+        """
+
+        names = [name.encode('utf-8') for name in self.names]
+        parts = [struct.pack('<II', len(names), len(self.ops))]
+        for name in names:
+            parts.append(struct.pack('<H', len(name)))
+            parts.append(name)
+        parts.append(self.ops.tobytes())
+        for column in (self.a, self.b, self.lines):
+            # Operands and lines are stored on 2 bytes when they fit.
+            typecode = 'H' if not column or 0 <= min(column) and max(column) < 1 << 16 else 'i'
+            parts.append(typecode.encode('ascii'))
+            parts.append(_little_endian(array(typecode, column)).tobytes())
+
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data, offset=0):
+        """
+        :param data: Bytes.
+        :param offset: Int. Where the function starts in data.
+        :return: Tuple (FunctionCode, offset right after it).
+        """
+
+        code = cls()
+        n_names, n_commands = struct.unpack_from('<II', data, offset)
+        offset += 8
+        for _ in range(n_names):
+            length, = struct.unpack_from('<H', data, offset)
+            offset += 2
+            code.name_id(data[offset:offset + length].decode('utf-8'))
+            offset += length
+        code.ops.frombytes(data[offset:offset + n_commands])
+        offset += n_commands
+        for column in (code.a, code.b, code.lines):
+            stored = array(data[offset:offset + 1].decode('ascii'))
+            offset += 1
+            size = n_commands * stored.itemsize
+            stored.frombytes(data[offset:offset + size])
+            offset += size
+            if sys.byteorder == 'big':
+                stored.byteswap()
+            column.extend(stored.tolist())
+
+        return code, offset
+
+
+def _little_endian(column):
+
+    if sys.byteorder == 'big':
+        column.byteswap()
+
+    return column
+
+
+def read_binary(data):
+    """
+    :param data: Bytes written by a BinarySink.
+    :return: List of FunctionCode.
+    """
+
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('Not binary VM code')
+    functions = []
+    offset = len(MAGIC)
+    while offset < len(data):
+        code, offset = FunctionCode.from_bytes(data, offset)
+        functions.append(code)
+
+    return functions
+
+
+class TextSink(object):
+    """
+    Write functions as VM text.
+    """
+
+    def __init__(self, file, owns_file=False):
+        """
+        :param file: File object.
+        :param owns_file: Bool. Whether to close the file when done,
+                          otherwise it is only flushed.
+        """
+
+        self.file = file
+        self.owns_file = owns_file
+
+    def write_function(self, code):
+
+        self.file.write(''.join(command + '\n' for command in code.text()))
+
+        return
+
+    def close(self):
+
+        if self.owns_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+        return
+
+
+class BinarySink(TextSink):
+    """
+    Write functions in binary form, see read_binary().
+    """
+
+    def __init__(self, file, owns_file=False):
+        """
+        :param file: File object opened in binary mode.
+        :param owns_file: Bool. See TextSink.
+        """
+
+        super(BinarySink, self).__init__(file, owns_file)
+        self.file.write(MAGIC)
+
+    def write_function(self, code):
+
+        self.file.write(code.to_bytes())
+
+        return
+
+
+class MemorySink(object):
+    """
+    Keep the functions, e.g. to inspect or transform them.
+    """
+
+    def __init__(self):
+
+        self.functions = []
+
+    def write_function(self, code):
+
+        self.functions.append(code)
+
+        return
+
+    def close(self):
+
+        return
+
+
+class NullSink(object):
+    """
+    Drop the functions, counting them, e.g. to time code generation alone.
+    """
+
+    def __init__(self):
+
+        self.n_functions = 0
+        self.n_commands = 0
+
+    def write_function(self, code):
+
+        self.n_functions += 1
+        self.n_commands += len(code)
+
+        return
+
+    def close(self):
+
+        return
@@ -0,0 +1,730 @@
+# A headless emulator of the VM the jack compiler targets, with an
+# instruction-level profiler.
+#
+# The VM code is decoded once into a flat list of (opcode, operand,
+# operand) triples, labels resolved to program counters and segments to
+# dedicated opcodes, and then run on a 32K word array('h') RAM laid out
+# like the Hack platform's. The OS classes are provided as minimal Python
+# implementations, unless the loaded code defines them itself.
+
+import os
+import sys
+from array import array
+
+from SourceMap import read_map
+
+
+SP, LCL, ARG, THIS, THAT = 0, 1, 2, 3, 4
+TEMP_BASE = 5
+STATIC_BASE = 16
+STACK_BASE = 256
+HEAP_BASE = 2048
+HEAP_END = 16384
+SCREEN = 16384
+KEYBOARD = 24576
+RAM_SIZE = 32768
+
+# Return address of the entry function's frame, stops the machine.
+HALT = -1
+
+# Decoded opcodes.
+(PUSH_CONSTANT, PUSH_LOCAL, PUSH_ARGUMENT, PUSH_THIS, PUSH_THAT, PUSH_RAM,
+ POP_LOCAL, POP_ARGUMENT, POP_THIS, POP_THAT, POP_RAM,
+ ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT,
+ GOTO, IF_GOTO, CALL, CALL_OS, FUNCTION, RETURN) = range(26)
+
+_ARITHMETIC = {'add': ADD, 'sub': SUB, 'neg': NEG, 'eq': EQ, 'gt': GT,
+               'lt': LT, 'and': AND, 'or': OR, 'not': NOT}
+_PUSH = {'local': PUSH_LOCAL, 'argument': PUSH_ARGUMENT, 'this': PUSH_THIS, 'that': PUSH_THAT}
+_POP = {'local': POP_LOCAL, 'argument': POP_ARGUMENT, 'this': POP_THIS, 'that': POP_THAT}
+
+
+class VMError(Exception):
+    """
+    Raised when the emulated program fails: bad code, Sys.error,
+    stack overflow or too many steps.
+    """
+    pass
+
+
+def _wrap(value):
+    """
+    :return: Int. The value as a 16-bit two's complement number.
+    """
+
+    return ((value + 32768) & 0xFFFF) - 32768
+
+
+class VMEmulator(object):
+    """
+    Load VM code, run it and profile the run.
+    """
+
+    def __init__(self, os_classes=None):
+        """
+        :param os_classes: Dict of 'Class.function' to Python function
+                           taking the emulator and the arguments. The
+                           builtin OS is used if None.
+        """
+
+        self.os_classes = dict(OS if os_classes is None else os_classes)
+        self.functions = {}
+        self.sources = {}
+        self.ram = array('h', bytes(2 * RAM_SIZE))
+        self.output = []
+        self.input = []
+        self.halted = False
+        self._free = {}
+        self._heap_top = HEAP_BASE
+        self.code = None
+
+    def load_vm(self, vm_code, source_map=None):
+        """
+        Load the VM code of one or more functions.
+
+        :param vm_code: String.
+        :param source_map: Tuple (source, lines) of the code, see SourceMap.read_map().
+        :return:
+        """
+
+        function = None
+        n = 0
+        for line in vm_code.splitlines():
+            line = line.split('//')[0].strip()
+            if not line:
+                continue
+            command = line.split()
+            if command[0] == 'function':
+                function = command[1]
+                if function in self.functions:
+                    raise VMError('Function {0} defined twice'.format(function))
+                self.functions[function] = []
+                self.sources[function] = []
+            elif function is None:
+                raise VMError('Command outside a function: {0}'.format(line))
+            self.functions[function].append(command)
+            if source_map is not None and n < len(source_map[1]):
+                self.sources[function].append('{0}:{1}'.format(source_map[0], source_map[1][n]))
+            else:
+                self.sources[function].append(None)
+            n += 1
+        self.code = None
+
+        return
+
+    def load_file(self, path):
+        """
+        :param path: String. A .vm file or a directory of them.
+        :return:
+        """
+
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith('.vm'):
+                    self.load_file(os.path.join(path, name))
+            return
+
+        with open(path) as f:
+            self.load_vm(f.read(), read_map(path))
+
+        return
+
+    def _decode(self):
+        """
+        Link the loaded functions into a single decoded program.
+        """
+
+        code = []
+        names = []
+        sources = []
+        starts = {}
+        owners = []
+        statics = {}
+        next_static = STATIC_BASE
+        pending = []
+
+        # Static segments are allocated per class, like per .vm file.
+        for function in sorted(self.functions):
+            class_name = function.split('.')[0]
+            n = 1 + max([int(c[2]) for c in self.functions[function]
+                         if len(c) == 3 and c[1] == 'static'] or [-1])
+            statics[class_name] = max(statics.get(class_name, 0), n)
+        bases = {}
+        for class_name in sorted(statics):
+            bases[class_name] = next_static
+            next_static += statics[class_name]
+        if next_static > STACK_BASE:
+            raise VMError('Too many static variables')
+
+        for function, commands in self.functions.items():
+            class_name = function.split('.')[0]
+            labels = {}
+            jumps = []
+            starts[function] = len(code)
+            for command, source in zip(commands, self.sources[function]):
+                op = command[0]
+                if op == 'label':
+                    labels[command[1]] = len(code)
+                    continue
+                names.append(op)
+                owners.append(function)
+                sources.append(source)
+                if op in ('push', 'pop'):
+                    segment, index = command[1], int(command[2])
+                    if op == 'push' and segment == 'constant':
+                        code.append((PUSH_CONSTANT, _wrap(index), 0))
+                        continue
+                    if segment in _PUSH:
+                        code.append(((_PUSH if op == 'push' else _POP)[segment], index, 0))
+                        continue
+                    if segment == 'temp':
+                        address = TEMP_BASE + index
+                    elif segment == 'pointer':
+                        address = THIS + index
+                    elif segment == 'static':
+                        address = bases[class_name] + index
+                    else:
+                        raise VMError('Unknown segment {0} in {1}'.format(segment, function))
+                    code.append((PUSH_RAM if op == 'push' else POP_RAM, address, 0))
+                elif op in _ARITHMETIC:
+                    code.append((_ARITHMETIC[op], 0, 0))
+                elif op in ('goto', 'if-goto'):
+                    jumps.append((len(code), command[1]))
+                    code.append((GOTO if op == 'goto' else IF_GOTO, command[1], 0))
+                elif op == 'call':
+                    pending.append(len(code))
+                    code.append((CALL, command[1], int(command[2])))
+                elif op == 'function':
+                    code.append((FUNCTION, int(command[2]), 0))
+                elif op == 'return':
+                    code.append((RETURN, 0, 0))
+                else:
+                    raise VMError('Unknown command {0} in {1}'.format(op, function))
+            for pc, label in jumps:
+                if label not in labels:
+                    raise VMError('Unknown label {0} in {1}'.format(label, function))
+                code[pc] = (code[pc][0], labels[label], 0)
+
+        for pc in pending:
+            _, target, n_args = code[pc]
+            if target in starts:
+                code[pc] = (CALL, starts[target], n_args)
+            elif target in self.os_classes:
+                code[pc] = (CALL_OS, target, n_args)
+            else:
+                raise VMError('Unknown function {0}'.format(target))
+
+        self.code = code
+        self._names = names
+        self._owners = owners
+        self._sources = sources
+        self._starts = starts
+
+        return
+
+    def run(self, entry=None, max_steps=None):
+        """
+        Run the program until its entry function returns or Sys.halt is called.
+
+        :param entry: String. Function to start with, Sys.init if it is
+                      defined, Main.main otherwise.
+        :param max_steps: Int. Raise VMError after executing that many commands.
+        :return: Int. The value returned by the entry function, None if halted.
+        """
+
+        if self.code is None:
+            self._decode()
+        if entry is None:
+            entry = 'Sys.init' if 'Sys.init' in self.functions else 'Main.main'
+        if entry not in self._starts:
+            raise VMError('No entry function {0}'.format(entry))
+
+        code = self.code
+        ram = self.ram
+        hits = array('q', bytes(8 * len(code)))
+        calls = {}
+        os_classes = self.os_classes
+        limit = max_steps if max_steps is not None else sys.maxsize
+
+        # Frame of the entry function.
+        sp = STACK_BASE
+        for value in (HALT, 0, 0, 0, 0):
+            ram[sp] = value
+            sp += 1
+        lcl = sp
+        arg = STACK_BASE
+        max_sp = sp
+        pc = self._starts[entry]
+        calls[entry] = 1
+        steps = 0
+        result = None
+        self.halted = False
+
+        try:
+            while True:
+                if steps >= limit:
+                    raise VMError('Step limit of {0} reached'.format(max_steps))
+                op, a, b = code[pc]
+                hits[pc] += 1
+                steps += 1
+                pc += 1
+
+                if op == PUSH_CONSTANT:
+                    ram[sp] = a
+                    sp += 1
+                    if sp > max_sp:
+                        max_sp = sp
+                        if sp >= HEAP_BASE:
+                            raise VMError('Stack overflow')
+                elif op == PUSH_LOCAL:
+                    ram[sp] = ram[lcl + a]
+                    sp += 1
+                    if sp > max_sp:
+                        max_sp = sp
+                        if sp >= HEAP_BASE:
+                            raise VMError('Stack overflow')
+                elif op == POP_LOCAL:
+                    sp -= 1
+                    ram[lcl + a] = ram[sp]
+                elif op == PUSH_ARGUMENT:
+                    ram[sp] = ram[arg + a]
+                    sp += 1
+                    if sp > max_sp:
+                        max_sp = sp
+                        if sp >= HEAP_BASE:
+                            raise VMError('Stack overflow')
+                elif op == ADD:
+                    sp -= 1
+                    ram[sp - 1] = _wrap(ram[sp - 1] + ram[sp])
+                elif op == PUSH_RAM:
+                    ram[sp] = ram[a]
+                    sp += 1
+                    if sp > max_sp:
+                        max_sp = sp
+                        if sp >= HEAP_BASE:
+                            raise VMError('Stack overflow')
+                elif op == POP_RAM:
+                    sp -= 1
+                    ram[a] = ram[sp]
+                elif op == PUSH_THAT:
+                    ram[sp] = ram[ram[THAT] + a]
+                    sp += 1
+                    if sp > max_sp:
+                        max_sp = sp
+                        if sp >= HEAP_BASE:
+                            raise VMError('Stack overflow')
+                elif op == POP_THAT:
+                    sp -= 1
+                    ram[ram[THAT] + a] = ram[sp]
+                elif op == PUSH_THIS:
+                    ram[sp] = ram[ram[THIS] + a]
+                    sp += 1
+                    if sp > max_sp:
+                        max_sp = sp
+                        if sp >= HEAP_BASE:
+                            raise VMError('Stack overflow')
+                elif op == POP_THIS:
+                    sp -= 1
+                    ram[ram[THIS] + a] = ram[sp]
+                elif op == IF_GOTO:
+                    sp -= 1
+                    if ram[sp]:
+                        pc = a
+                elif op == GOTO:
+                    pc = a
+                elif op == SUB:
+                    sp -= 1
+                    ram[sp - 1] = _wrap(ram[sp - 1] - ram[sp])
+                elif op == LT:
+                    sp -= 1
+                    ram[sp - 1] = -1 if ram[sp - 1] < ram[sp] else 0
+                elif op == GT:
+                    sp -= 1
+                    ram[sp - 1] = -1 if ram[sp - 1] > ram[sp] else 0
+                elif op == EQ:
+                    sp -= 1
+                    ram[sp - 1] = -1 if ram[sp - 1] == ram[sp] else 0
+                elif op == NOT:
+                    ram[sp - 1] = ~ram[sp - 1]
+                elif op == NEG:
+                    ram[sp - 1] = _wrap(-ram[sp - 1])
+                elif op == AND:
+                    sp -= 1
+                    ram[sp - 1] = ram[sp - 1] & ram[sp]
+                elif op == OR:
+                    sp -= 1
+                    ram[sp - 1] = ram[sp - 1] | ram[sp]
+                elif op == POP_ARGUMENT:
+                    sp -= 1
+                    ram[arg + a] = ram[sp]
+                elif op == CALL:
+                    if sp + 5 >= HEAP_BASE:
+                        raise VMError('Stack overflow')
+                    ram[sp] = pc
+                    ram[sp + 1] = lcl
+                    ram[sp + 2] = arg
+                    ram[sp + 3] = ram[THIS]
+                    ram[sp + 4] = ram[THAT]
+                    arg = sp - b
+                    sp += 5
+                    if sp > max_sp:
+                        max_sp = sp
+                    lcl = sp
+                    pc = a
+                    name = self._owners[a]
+                    calls[name] = calls.get(name, 0) + 1
+                elif op == FUNCTION:
+                    for _ in range(a):
+                        ram[sp] = 0
+                        sp += 1
+                    if sp > max_sp:
+                        max_sp = sp
+                        if sp >= HEAP_BASE:
+                            raise VMError('Stack overflow')
+                elif op == RETURN:
+                    frame = lcl
+                    return_address = ram[frame - 5]
+                    ram[arg] = ram[sp - 1]
+                    sp = arg + 1
+                    ram[THAT] = ram[frame - 1]
+                    ram[THIS] = ram[frame - 2]
+                    arg = ram[frame - 3]
+                    lcl = ram[frame - 4]
+                    if return_address == HALT:
+                        result = ram[sp - 1]
+                        break
+                    pc = return_address
+                elif op == CALL_OS:
+                    calls[a] = calls.get(a, 0) + 1
+                    sp -= b
+                    args = ram[sp:sp + b].tolist()
+                    ram[SP], ram[LCL], ram[ARG] = sp, lcl, arg
+                    value = os_classes[a](self, *args)
+                    if self.halted:
+                        break
+                    ram[sp] = _wrap(value or 0)
+                    sp += 1
+                    if sp > max_sp:
+                        max_sp = sp
+                        if sp >= HEAP_BASE:
+                            raise VMError('Stack overflow')
+                else:
+                    raise VMError('Bad opcode {0}'.format(op))
+        except IndexError:
+            raise VMError('Memory access out of range at {0}'.format(self._owners[pc - 1]))
+        except OverflowError:
+            raise VMError('Value out of 16-bit range at {0}'.format(self._owners[pc - 1]))
+        finally:
+            ram[SP], ram[LCL], ram[ARG] = sp, lcl, arg
+            self.steps = steps
+            self._hits = hits
+            self._calls = calls
+            self.max_stack_depth = max_sp - STACK_BASE
+
+        return result
+
+    def profile(self):
+        """
+        :return: Dict. Profile of the last run: executed commands in total,
+                 per function and per opcode (labels cost nothing and
+                 are not counted), per jack source line ('File.jack:line')
+                 for the code loaded with a source map, calls per
+                 function, OS ones included, and the maximal stack depth
+                 in words.
+        """
+
+        per_function = {}
+        per_opcode = {}
+        per_line = {}
+        for pc, count in enumerate(self._hits):
+            if not count:
+                continue
+            owner = self._owners[pc]
+            per_function[owner] = per_function.get(owner, 0) + count
+            name = self._names[pc]
+            per_opcode[name] = per_opcode.get(name, 0) + count
+            source = self._sources[pc]
+            if source is not None:
+                per_line[source] = per_line.get(source, 0) + count
+
+        return {'steps': self.steps, 'functions': per_function, 'opcodes': per_opcode,
+                'lines': per_line, 'calls': dict(self._calls),
+                'max_stack_depth': self.max_stack_depth}
+
+    def format_profile(self, top=20):
+        """
+        :param top: Int. Number of functions and of source lines listed.
+        :return: String. The profile as text.
+        """
+
+        profile = self.profile()
+        lines = ['executed commands: {0}, max stack depth: {1}'.format(
+            profile['steps'], profile['max_stack_depth'])]
+        lines.append('{0:<32} {1:>12} {2:>10}'.format('function', 'commands', 'calls'))
+        ranked = sorted(profile['functions'].items(), key=lambda item: -item[1])
+        for name, count in ranked[:top]:
+            lines.append('{0:<32} {1:>12} {2:>10}'.format(name, count, profile['calls'].get(name, 0)))
+        os_calls = [(name, count) for name, count in profile['calls'].items()
+                    if name not in profile['functions']]
+        for name, count in sorted(os_calls, key=lambda item: -item[1]):
+            lines.append('{0:<32} {1:>12} {2:>10}'.format(name + ' (OS)', '-', count))
+        lines.append('{0:<32} {1:>12}'.format('opcode', 'commands'))
+        for name, count in sorted(profile['opcodes'].items(), key=lambda item: -item[1]):
+            lines.append('{0:<32} {1:>12}'.format(name, count))
+        if profile['lines']:
+            lines.append('{0:<32} {1:>12}'.format('source line', 'commands'))
+            ranked = sorted(profile['lines'].items(), key=lambda item: -item[1])
+            for source, count in ranked[:top]:
+                lines.append('{0:<32} {1:>12}'.format(source, count))
+
+        return '\n'.join(lines)
+
+    # Helpers of the OS implementation.
+
+    def alloc(self, size):
+        """
+        :return: Int. Base address of a free heap block of the given size.
+        """
+
+        size = max(size, 1)
+        blocks = self._free.get(size)
+        if blocks:
+            return blocks.pop()
+        if self._heap_top + size + 1 > HEAP_END:
+            raise VMError('Heap overflow')
+        self.ram[self._heap_top] = size
+        address = self._heap_top + 1
+        self._heap_top += size + 1
+
+        return address
+
+    def de_alloc(self, address):
+
+        self._free.setdefault(self.ram[address - 1], []).append(address)
+
+        return
+
+    def new_string(self, text):
+        """
+        :return: Int. Address of a new String object holding text.
+        """
+
+        address = _string_new(self, len(text))
+        for c in text:
+            _string_append_char(self, address, ord(c))
+
+        return address
+
+    def string_value(self, address):
+        """
+        :return: String. The text of a String object.
+        """
+
+        length = self.ram[address + 1]
+        return ''.join(chr(c) for c in self.ram[address + 2:address + 2 + length])
+
+    def output_text(self):
+        """
+        :return: String. What the program printed.
+        """
+
+        return ''.join(self.output)
+
+
+# The OS, String objects are laid out as [capacity, length, characters...].
+
+def _math_divide(vm, x, y):
+    if y == 0:
+        raise VMError('Sys.error 3: division by zero')
+    q = abs(x) // abs(y)
+    return q if (x < 0) == (y < 0) else -q
+
+
+def _math_sqrt(vm, x):
+    if x < 0:
+        raise VMError('Sys.error 4: square root of a negative number')
+    y = 0
+    while (y + 1) * (y + 1) <= x:
+        y += 1
+    return y
+
+
+def _string_new(vm, capacity):
+    if capacity < 0:
+        raise VMError('Sys.error 14: negative string length')
+    address = vm.alloc(capacity + 2)
+    vm.ram[address] = capacity
+    vm.ram[address + 1] = 0
+    return address
+
+
+def _string_append_char(vm, this, c):
+    length = vm.ram[this + 1]
+    if length >= vm.ram[this]:
+        raise VMError('Sys.error 17: string is full')
+    vm.ram[this + 2 + length] = c
+    vm.ram[this + 1] = length + 1
+    return this
+
+
+def _string_int_value(vm, this):
+    text = vm.string_value(this)
+    digits = ''
+    for i, c in enumerate(text):
+        if c.isdigit() or (i == 0 and c == '-'):
+            digits += c
+        else:
+            break
+    return int(digits) if digits not in ('', '-') else 0
+
+
+def _string_set_int(vm, this, value):
+    text = str(value)
+    if len(text) > vm.ram[this]:
+        raise VMError('Sys.error 19: string too short')
+    vm.ram[this + 1] = 0
+    for c in text:
+        _string_append_char(vm, this, ord(c))
+    return 0
+
+
+def _output_char(vm, c):
+    if c == 128:
+        vm.output.append('\n')
+    elif c == 129:
+        if vm.output:
+            vm.output.pop()
+    else:
+        vm.output.append(chr(c))
+    return 0
+
+
+def _read_line(vm, message):
+    vm.output.append(vm.string_value(message))
+    line = vm.input.pop(0) if vm.input else ''
+    vm.output.append(line + '\n')
+    return line
+
+
+def _draw_pixel(vm, x, y):
+    if not (0 <= x < 512 and 0 <= y < 256):
+        raise VMError('Sys.error 7: pixel out of the screen')
+    address = SCREEN + y * 32 + x // 16
+    mask = 1 << (x % 16)
+    word = vm.ram[address] & 0xFFFF
+    word = word | mask if vm.screen_color else word & ~mask
+    vm.ram[address] = _wrap(word)
+    return 0
+
+
+def _draw_rectangle(vm, x1, y1, x2, y2):
+    for y in range(y1, y2 + 1):
+        for x in range(x1, x2 + 1):
+            _draw_pixel(vm, x, y)
+    return 0
+
+
+def _draw_line(vm, x1, y1, x2, y2):
+    n = max(abs(x2 - x1), abs(y2 - y1))
+    for i in range(n + 1):
+        _draw_pixel(vm, x1 + (x2 - x1) * i // max(n, 1), y1 + (y2 - y1) * i // max(n, 1))
+    return 0
+
+
+def _draw_circle(vm, x, y, r):
+    for dy in range(-r, r + 1):
+        dx = _math_sqrt(vm, r * r - dy * dy)
+        _draw_rectangle(vm, x - dx, y + dy, x + dx, y + dy)
+    return 0
+
+
+def _clear_screen(vm):
+    for address in range(SCREEN, KEYBOARD):
+        vm.ram[address] = 0
+    return 0
+
+
+def _set_color(vm, color):
+    vm.screen_color = color != 0
+    return 0
+
+
+def _sys_halt(vm):
+    vm.halted = True
+    return 0
+
+
+def _sys_error(vm, code):
+    raise VMError('Sys.error {0}'.format(code))
+
+
+VMEmulator.screen_color = True
+
+OS = {
+    'Math.init': lambda vm: 0,
+    'Math.multiply': lambda vm, x, y: x * y,
+    'Math.divide': _math_divide,
+    'Math.sqrt': _math_sqrt,
+    'Math.abs': lambda vm, x: abs(x),
+    'Math.min': lambda vm, x, y: min(x, y),
+    'Math.max': lambda vm, x, y: max(x, y),
+    'Memory.init': lambda vm: 0,
+    'Memory.peek': lambda vm, address: vm.ram[address],
+    'Memory.poke': lambda vm, address, value: vm.ram.__setitem__(address, value),
+    'Memory.alloc': lambda vm, size: vm.alloc(size),
+    'Memory.deAlloc': lambda vm, address: vm.de_alloc(address),
+    'Array.new': lambda vm, size: vm.alloc(size),
+    'Array.dispose': lambda vm, this: vm.de_alloc(this),
+    'String.new': _string_new,
+    'String.dispose': lambda vm, this: vm.de_alloc(this),
+    'String.length': lambda vm, this: vm.ram[this + 1],
+    'String.charAt': lambda vm, this, i: vm.ram[this + 2 + i],
+    'String.setCharAt': lambda vm, this, i, c: vm.ram.__setitem__(this + 2 + i, c),
+    'String.appendChar': _string_append_char,
+    'String.eraseLastChar': lambda vm, this: vm.ram.__setitem__(this + 1, max(vm.ram[this + 1] - 1, 0)),
+    'String.intValue': _string_int_value,
+    'String.setInt': _string_set_int,
+    'String.newLine': lambda vm: 128,
+    'String.backSpace': lambda vm: 129,
+    'String.doubleQuote': lambda vm: 34,
+    'Output.init': lambda vm: 0,
+    'Output.moveCursor': lambda vm, i, j: 0,
+    'Output.printChar': _output_char,
+    'Output.printString': lambda vm, s: vm.output.append(vm.string_value(s)),
+    'Output.printInt': lambda vm, i: vm.output.append(str(i)),
+    'Output.println': lambda vm: vm.output.append('\n'),
+    'Output.backSpace': lambda vm: _output_char(vm, 129),
+    'Screen.init': lambda vm: 0,
+    'Screen.clearScreen': _clear_screen,
+    'Screen.setColor': _set_color,
+    'Screen.drawPixel': _draw_pixel,
+    'Screen.drawLine': _draw_line,
+    'Screen.drawRectangle': _draw_rectangle,
+    'Screen.drawCircle': _draw_circle,
+    'Keyboard.init': lambda vm: 0,
+    'Keyboard.keyPressed': lambda vm: 0,
+    'Keyboard.readChar': lambda vm: ord((vm.input.pop(0) or '\n')[0]) if vm.input else 128,
+    'Keyboard.readLine': lambda vm, message: vm.new_string(_read_line(vm, message)),
+    'Keyboard.readInt': lambda vm, message: int(_read_line(vm, message) or 0),
+    'Sys.init': lambda vm: 0,
+    'Sys.halt': _sys_halt,
+    'Sys.error': _sys_error,
+    'Sys.wait': lambda vm, duration: 0,
+}
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Run and profile VM code.')
+    parser.add_argument('paths', nargs='+', help='.vm files or directories')
+    parser.add_argument('--entry', default=None, help='function to start with')
+    parser.add_argument('--max-steps', type=int, default=None, help='abort after that many commands')
+    parser.add_argument('--top', type=int, default=20, help='number of functions in the profile')
+    args = parser.parse_args()
+
+    emulator = VMEmulator()
+    for vm_path in args.paths:
+        emulator.load_file(vm_path)
+    emulator.run(args.entry, args.max_steps)
+    print(emulator.output_text())
+    print(emulator.format_profile(args.top))
@@ -0,0 +1,825 @@
+# Optimization passes over the VM code of a single function.
+#
+# A pass gets the commands of one function, the 'function F n' command
+# first, as a list of strings without line breaks, and returns the
+# optimized list. Each pass keeps counters of what it did in self.stats.
+
+
+ARITHMETIC = {'add': (2, 1), 'sub': (2, 1), 'and': (2, 1), 'or': (2, 1),
+              'eq': (2, 1), 'gt': (2, 1), 'lt': (2, 1), 'neg': (1, 1), 'not': (1, 1)}
+
+
+def stack_effect(command):
+    """
+    :param command: List of strings, a split VM command.
+    :return: Tuple (values popped, values pushed), None if the command
+             is not a pure stack operation (calls, pops, control flow).
+    """
+
+    op = command[0]
+    if op == 'push':
+        return 0, 1
+    return ARITHMETIC.get(op)
+
+
+def backward_expression(commands, end):
+    """
+    Find the pure commands computing the single value on top of
+    the stack right before commands[end].
+
+    :param commands: List of split VM commands.
+    :param end: Int. Index of the command consuming the value.
+    :return: Int. Index of the first command of the expression,
+             None if the value is not computed by pure commands.
+    """
+
+    needed = 1
+    i = end - 1
+    while i >= 0:
+        effect = stack_effect(commands[i])
+        if effect is None:
+            return None
+        needed += effect[0] - effect[1]
+        if needed == 0:
+            return i
+        i -= 1
+
+    return None
+
+
+def successors(commands):
+    """
+    :param commands: List of split VM commands of a function.
+    :return: List, the indices of the commands that may follow each command.
+    """
+
+    labels = {}
+    for i, command in enumerate(commands):
+        if command[0] == 'label':
+            labels[command[1]] = i
+
+    result = []
+    last = len(commands) - 1
+    for i, command in enumerate(commands):
+        op = command[0]
+        if op == 'goto':
+            result.append([labels[command[1]]])
+        elif op == 'if-goto':
+            result.append([labels[command[1]]] + ([i + 1] if i < last else []))
+        elif op == 'return' or i == last:
+            result.append([])
+        else:
+            result.append([i + 1])
+
+    return result
+
+
+def stack_depth(commands):
+    """
+    :param commands: List of split VM commands of a function.
+    :return: Int. The maximal number of values the function keeps on
+             its working stack, not counting its locals and the frames
+             of the functions it calls.
+    """
+
+    following = successors(commands)
+    depths = [None] * len(commands)
+    deepest = 0
+    todo = [0] if commands else []
+    if todo:
+        depths[0] = 0
+    while todo:
+        i = todo.pop()
+        command = commands[i]
+        op = command[0]
+        if op == 'push':
+            depth = depths[i] + 1
+        elif op in ARITHMETIC:
+            depth = depths[i] + ARITHMETIC[op][1] - ARITHMETIC[op][0]
+        elif op == 'call':
+            depth = depths[i] + 1 - int(command[2])
+        elif op in ('pop', 'if-goto', 'return'):
+            depth = depths[i] - 1
+        else:
+            depth = depths[i]
+        deepest = max(deepest, depth)
+        for j in following[i]:
+            if depths[j] is None:
+                depths[j] = depth
+                todo.append(j)
+
+    return deepest
+
+
+def local_liveness(commands):
+    """
+    Backward liveness analysis of the local variables.
+
+    :param commands: List of split VM commands of a function.
+    :return: List of ints, bit i of the n-th entry is set if local i
+             is live right after the n-th command.
+    """
+
+    n = len(commands)
+    succ = successors(commands)
+    uses = [0] * n
+    defs = [0] * n
+    for i, command in enumerate(commands):
+        if len(command) == 3 and command[1] == 'local':
+            if command[0] == 'push':
+                uses[i] = 1 << int(command[2])
+            else:
+                defs[i] = 1 << int(command[2])
+
+    live_in = [0] * n
+    live_out = [0] * n
+    changed = True
+    while changed:
+        changed = False
+        for i in range(n - 1, -1, -1):
+            out = 0
+            for s in succ[i]:
+                out |= live_in[s]
+            new_in = uses[i] | (out & ~defs[i])
+            if out != live_out[i] or new_in != live_in[i]:
+                live_out[i] = out
+                live_in[i] = new_in
+                changed = True
+
+    return live_out
+
+
+class LivenessPass(object):
+    """
+    Remove dead stores to locals and pack the locals with disjoint
+    lifetimes into shared slots, shrinking the function's frame.
+
+    A store nobody reads is deleted together with its right-hand side if
+    that is made of pure commands only, otherwise the value is dropped
+    into a scratch temp instead of occupying a local slot.
+    """
+
+    name = 'liveness'
+
+    # Scratch register receiving values of dead stores with side effects.
+    SCRATCH = ('temp', 7)
+
+    def __init__(self):
+
+        self.stats = {'locals_declared': 0, 'locals_allocated': 0,
+                      'dead_stores_removed': 0, 'dead_stores_dropped': 0}
+
+    def run(self, code):
+        """
+        :param code: List of strings, the commands of a function.
+        :return: List of strings, the optimized commands.
+        """
+
+        commands = [line.split() for line in code]
+        commands = self._remove_dead_stores(commands)
+        commands = self._allocate(commands)
+
+        return [' '.join(command) for command in commands]
+
+    def _remove_dead_stores(self, commands):
+
+        while True:
+            live_out = local_liveness(commands)
+            dead = []
+            for i, command in enumerate(commands):
+                if command[0] == 'pop' and command[1] == 'local':
+                    if not (live_out[i] >> int(command[2])) & 1:
+                        dead.append(i)
+            if not dead:
+                return commands
+
+            removed = set()
+            for i in dead:
+                start = backward_expression(commands, i)
+                if start is None:
+                    commands[i] = ['pop', self.SCRATCH[0], str(self.SCRATCH[1])]
+                    self.stats['dead_stores_dropped'] += 1
+                else:
+                    removed.update(range(start, i + 1))
+                    self.stats['dead_stores_removed'] += 1
+            if not removed:
+                return commands
+            commands = [command for i, command in enumerate(commands) if i not in removed]
+
+    def _allocate(self, commands):
+
+        live_out = local_liveness(commands)
+        n_declared = int(commands[0][2])
+        referenced = set()
+        interference = {}
+        for i, command in enumerate(commands):
+            if len(command) == 3 and command[1] == 'local':
+                variable = int(command[2])
+                referenced.add(variable)
+                interference.setdefault(variable, set())
+
+        def interfere(a, b):
+            interference.setdefault(a, set()).add(b)
+            interference.setdefault(b, set()).add(a)
+
+        # A store interferes with every other local live after it.
+        for i, command in enumerate(commands):
+            if command[0] == 'pop' and command[1] == 'local':
+                variable = int(command[2])
+                live = live_out[i] & ~(1 << variable)
+                for other in referenced:
+                    if (live >> other) & 1:
+                        interfere(variable, other)
+
+        # Locals read before written rely on the zero the frame is
+        # set up with, they all need a slot of their own.
+        at_entry = [v for v in referenced if (live_out[0] >> v) & 1]
+        for a in at_entry:
+            for b in at_entry:
+                if a != b:
+                    interfere(a, b)
+
+        slots = {}
+        for variable in sorted(referenced):
+            taken = set(slots[other] for other in interference[variable] if other in slots)
+            slot = 0
+            while slot in taken:
+                slot += 1
+            slots[variable] = slot
+
+        n_slots = max(slots.values()) + 1 if slots else 0
+        self.stats['locals_declared'] += n_declared
+        self.stats['locals_allocated'] += n_slots
+
+        result = [['function', commands[0][1], str(n_slots)]]
+        for command in commands[1:]:
+            if len(command) == 3 and command[1] == 'local':
+                command = [command[0], 'local', str(slots[int(command[2])])]
+            result.append(command)
+
+        return result
+
+
+class LoopInvariantPass(object):
+    """
+    Hoist pure computations whose operands do not change inside a loop
+    into fresh locals computed once before the loop.
+
+    Loops are found through their back edges. Only loops entered through
+    their header (or through a single jump right before it) are touched.
+    Calls, except the side-effect free PURE_CALLS, are never hoisted and
+    make static and field reads variant, as do array writes.
+    """
+
+    name = 'loop invariants'
+
+    # Calls without side effects which can be safely executed ahead of time.
+    PURE_CALLS = {'Math.multiply': 2}
+
+    # Minimal number of commands of a hoisted expression.
+    MIN_LENGTH = 3
+
+    def __init__(self):
+
+        self.stats = {'loops': 0, 'expressions_hoisted': 0}
+        self.details = []
+
+    def run(self, code):
+        """
+        :param code: List of strings, the commands of a function.
+        :return: List of strings, the optimized commands.
+        """
+
+        commands = [line.split() for line in code]
+        done = set()
+        while True:
+            loops = self._find_loops(commands)
+            todo = [loop for loop in loops if loop[1] not in done]
+            if not todo:
+                break
+            # Innermost loops first, their hoisted code may be
+            # hoisted again out of the enclosing loop.
+            _, header, start, end = min(todo)
+            done.add(header)
+            self.stats['loops'] += 1
+            commands = self._hoist(commands, start, end)
+
+        return [' '.join(command) for command in commands]
+
+    @staticmethod
+    def _find_loops(commands):
+        """
+        :return: List of (size, header label, header index, back edge index).
+        """
+
+        labels = {}
+        for i, command in enumerate(commands):
+            if command[0] == 'label':
+                labels[command[1]] = i
+
+        back_edges = {}
+        for i, command in enumerate(commands):
+            if command[0] in ('goto', 'if-goto') and labels[command[1]] < i:
+                back_edges[command[1]] = i
+
+        return [(end - labels[label], label, labels[label], end)
+                for label, end in back_edges.items()]
+
+    def _effect(self, command):
+        """
+        :return: (values popped, values pushed) of a pure command, else None.
+        """
+
+        if command[0] == 'call' and self.PURE_CALLS.get(command[1]) == int(command[2]):
+            return int(command[2]), 1
+        return stack_effect(command)
+
+    @staticmethod
+    def _preheader(commands, start, end):
+        """
+        :return: Int. Where code executed once before the loop is inserted,
+                 None if the loop has other entries.
+        """
+
+        inside = set(command[1] for command in commands[start:end + 1] if command[0] == 'label')
+        entries = [i for i, command in enumerate(commands)
+                   if (i < start or i > end) and command[0] in ('goto', 'if-goto') and
+                   command[1] in inside]
+        falls_through = commands[start - 1][0] not in ('goto', 'return')
+        if not entries and falls_through:
+            return start
+        if entries == [start - 1] and commands[start - 1][0] == 'goto':
+            return start - 1
+
+        return None
+
+    def _hoist(self, commands, start, end):
+
+        position = self._preheader(commands, start, end)
+        if position is None:
+            return commands
+
+        # What the loop may modify.
+        killed = set()
+        has_call = False
+        for command in commands[start:end + 1]:
+            if command[0] == 'pop':
+                killed.add((command[1], command[2]))
+            elif command[0] == 'call' and command[1] not in self.PURE_CALLS:
+                has_call = True
+        writes_memory = has_call or any(segment == 'that' for segment, _ in killed)
+
+        def invariant(command):
+            segment = command[1]
+            if segment == 'constant':
+                return True
+            if segment in ('local', 'argument'):
+                return (segment, command[2]) not in killed
+            if segment == 'pointer':
+                return command[2] == '0' and ('pointer', '0') not in killed
+            if segment in ('static', 'this'):
+                if writes_memory or (segment, command[2]) in killed:
+                    return False
+                return segment == 'static' or ('pointer', '0') not in killed
+            return False
+
+        # Symbolic stack of (first command, last command, invariant).
+        candidates = []
+        stack = []
+
+        def settle(entries):
+            for entry in entries:
+                if entry[2] and entry[1] - entry[0] + 1 >= self.MIN_LENGTH:
+                    candidates.append(entry)
+
+        for i in range(start, end + 1):
+            command = commands[i]
+            op = command[0]
+            effect = self._effect(command)
+            if op == 'push':
+                stack.append((i, i, invariant(command)))
+            elif effect is not None and len(stack) >= effect[0]:
+                operands = stack[len(stack) - effect[0]:]
+                del stack[len(stack) - effect[0]:]
+                is_invariant = all(operand[2] for operand in operands)
+                if not is_invariant:
+                    settle(operands)
+                stack.append((operands[0][0], i, is_invariant))
+            else:
+                if op == 'call':
+                    n_popped = int(command[2])
+                elif op in ('pop', 'if-goto') or effect is not None:
+                    n_popped = effect[0] if effect is not None else 1
+                else:
+                    n_popped = 0
+                n_popped = min(n_popped, len(stack))
+                settle(stack[len(stack) - n_popped:])
+                del stack[len(stack) - n_popped:]
+                if op == 'call' or effect is not None:
+                    stack.append((None, i, False))
+                if op in ('label', 'goto', 'return'):
+                    # Control flow joins here, forget what is on the stack.
+                    settle(stack)
+                    stack = [(None, i, False) for _ in stack]
+        settle(stack)
+
+        # Keep the expressions really made of consecutive pure commands.
+        hoisted = {}
+        replaced = {}
+        n_locals = int(commands[0][2])
+        for first, last, _ in candidates:
+            needed = 1
+            for i in range(last, first - 1, -1):
+                effect = self._effect(commands[i])
+                if effect is None:
+                    break
+                needed += effect[0] - effect[1]
+            if needed != 0:
+                continue
+            text = tuple(' '.join(command) for command in commands[first:last + 1])
+            if text not in hoisted:
+                hoisted[text] = n_locals + len(hoisted)
+                self.details.append('{0}: {1}'.format(commands[0][1], '; '.join(text)))
+            replaced[first] = (last, hoisted[text])
+
+        if not hoisted:
+            return commands
+        self.stats['expressions_hoisted'] += len(hoisted)
+
+        result = [['function', commands[0][1], str(n_locals + len(hoisted))]]
+        result += commands[1:position]
+        for text, local in sorted(hoisted.items(), key=lambda item: item[1]):
+            result += [line.split() for line in text]
+            result.append(['pop', 'local', str(local)])
+        i = position
+        while i < len(commands):
+            if i in replaced:
+                last, local = replaced[i]
+                result.append(['push', 'local', str(local)])
+                i = last + 1
+            else:
+                result.append(commands[i])
+                i += 1
+
+        return result
+
+
+class JumpThreadingPass(object):
+    """
+    Clean up the control flow: merge adjacent labels, thread jumps
+    through blocks made of a single goto, drop gotos to the very next
+    label and code nothing can reach, and delete unused labels.
+    """
+
+    name = 'jump threading'
+
+    def __init__(self):
+
+        self.stats = {'jumps_threaded': 0, 'gotos_removed': 0,
+                      'labels_removed': 0, 'unreachable_removed': 0}
+
+    def run(self, code):
+        """
+        :param code: List of strings, the commands of a function.
+        :return: List of strings, the optimized commands.
+        """
+
+        commands = [line.split() for line in code]
+        while True:
+            n_commands = len(commands)
+            commands = self._merge_labels(commands)
+            commands = self._thread(commands)
+            commands = self._remove_dead_code(commands)
+            if len(commands) == n_commands:
+                break
+
+        return [' '.join(command) for command in commands]
+
+    def _merge_labels(self, commands):
+        """
+        Rename every label of a run of adjacent labels to the first one.
+        """
+
+        alias = {}
+        result = []
+        for command in commands:
+            if command[0] == 'label' and result and result[-1][0] == 'label':
+                alias[command[1]] = result[-1][1]
+                self.stats['labels_removed'] += 1
+                continue
+            result.append(command)
+
+        if not alias:
+            return result
+
+        return [[command[0], alias[command[1]]] if command[0] in ('goto', 'if-goto') and
+                command[1] in alias else command for command in result]
+
+    def _thread(self, commands):
+        """
+        Retarget jumps to labels followed by a goto.
+        """
+
+        forward = {}
+        for i, command in enumerate(commands[:-1]):
+            following = commands[i + 1]
+            if command[0] == 'label' and following[0] == 'goto' and following[1] != command[1]:
+                forward[command[1]] = following[1]
+
+        result = []
+        for command in commands:
+            if command[0] in ('goto', 'if-goto') and command[1] in forward:
+                target = command[1]
+                seen = set([target])
+                while target in forward and forward[target] not in seen:
+                    target = forward[target]
+                    seen.add(target)
+                if target != command[1]:
+                    command = [command[0], target]
+                    self.stats['jumps_threaded'] += 1
+            result.append(command)
+
+        return result
+
+    def _remove_dead_code(self, commands):
+        """
+        Drop gotos to the next command, unreachable commands
+        and labels nobody jumps to.
+        """
+
+        result = []
+        reachable = True
+        for i, command in enumerate(commands):
+            if command[0] == 'label':
+                reachable = True
+            elif not reachable:
+                self.stats['unreachable_removed'] += 1
+                continue
+            if command[0] == 'goto' and i + 1 < len(commands) and commands[i + 1] == ['label', command[1]]:
+                self.stats['gotos_removed'] += 1
+                continue
+            result.append(command)
+            if command[0] in ('goto', 'return'):
+                reachable = False
+
+        used = set(command[1] for command in result if command[0] in ('goto', 'if-goto'))
+        n_commands = len(result)
+        result = [command for command in result if command[0] != 'label' or command[1] in used]
+        self.stats['labels_removed'] += n_commands - len(result)
+
+        return result
+
+
+class ArrayAddressPass(object):
+    """
+    Drop array address computations whose address is already in the
+    'that' pointer, in straight-line code.
+
+    'pointer 1' is set by 'E; add; pop pointer 1' with a pure address
+    expression E. When the same E is popped into 'pointer 1' again and
+    neither 'pointer 1' nor an operand of E changed meanwhile, the
+    recomputation is dropped. An array store whose address was just
+    read, as in 'let a[i] = a[i] + 1', becomes a plain 'pop that 0'.
+
+    Labels, jumps and calls forget the address. Pops forget it when
+    they write one of its operands, array writes and 'pointer 0' when
+    it reads static variables or fields.
+    """
+
+    name = 'array addresses'
+
+    # Segments an address expression may read.
+    OPERANDS = ('constant', 'local', 'argument', 'static', 'this', 'pointer')
+
+    def __init__(self):
+
+        self.stats = {'addresses_reused': 0, 'stores_simplified': 0}
+        self.details = []
+
+    def run(self, code):
+        """
+        :param code: List of strings, the commands of a function.
+        :return: List of strings, the optimized commands.
+        """
+
+        commands = [line.split() for line in code]
+        dropped = set()
+        address = None
+        for i, command in enumerate(commands):
+            op = command[0]
+            if op == 'pop' and command[1:] == ['pointer', '1']:
+                store = self._store(commands, i)
+                if store is not None:
+                    start, value_start, key = store
+                    if key is not None and key == address:
+                        # The value read the element it is stored into.
+                        dropped.update(range(start, value_start))
+                        dropped.update(range(i - 3, i + 2))
+                        self._record(commands, key, 'stores_simplified')
+                    address = key
+                    continue
+                start = backward_expression(commands, i)
+                key = self._key(commands, start, i) if start is not None else None
+                if key is not None and key == address:
+                    dropped.update(range(start, i + 1))
+                    self._record(commands, key, 'addresses_reused')
+                address = key
+            elif address is None:
+                continue
+            elif op == 'pop':
+                if command[1] != 'temp' and self._clobbers(command, address):
+                    address = None
+            elif op not in ARITHMETIC and op != 'push':
+                address = None
+
+        return [' '.join(command) for i, command in enumerate(commands) if i not in dropped]
+
+    def _key(self, commands, start, end):
+        """
+        :return: Tuple of the commands start to end, if they make
+                 an address expression ending by an add, else None.
+        """
+
+        if commands[end - 1] != ['add']:
+            return None
+        for command in commands[start:end]:
+            if command[0] == 'push' and (command[1] not in self.OPERANDS or command[1:] == ['pointer', '1']):
+                return None
+
+        return tuple(tuple(command) for command in commands[start:end])
+
+    def _store(self, commands, i):
+        """
+        Match the array store 'I; V; pop temp 0; push a; add; pop pointer 1;
+        push temp 0; pop that 0' around the 'pop pointer 1' at i.
+
+        :return: Tuple (index of I, index of V, address key or None if
+                 it cannot be known after V), None if it is no store.
+        """
+
+        if i < 3 or commands[i - 3] != ['pop', 'temp', '0'] or commands[i - 2][0] != 'push' or \
+                commands[i - 1] != ['add'] or commands[i + 1:i + 3] != [['push', 'temp', '0'], ['pop', 'that', '0']]:
+            return None
+
+        # Walk back over the value V to the index I below it. I is pure,
+        # so a pop right before still belongs to V.
+        needed = 1
+        value_start = i - 3
+        while needed or value_start > 0 and commands[value_start - 1][0] == 'pop':
+            value_start -= 1
+            if value_start < 0:
+                return None
+            command = commands[value_start]
+            if command[0] == 'call':
+                effect = int(command[2]), 1
+            elif command[0] == 'pop':
+                effect = 1, 0
+            else:
+                effect = stack_effect(command)
+            if effect is None:
+                return None
+            needed += effect[0] - effect[1]
+
+        start = backward_expression(commands, value_start)
+        if start is None:
+            return None
+        # V must leave the operands of I alone.
+        for command in commands[value_start:i - 3]:
+            if command[0] == 'call' or command[0] == 'pop' and command[1:] != ['pointer', '1'] \
+                    and command[1] != 'temp':
+                return start, value_start, None
+
+        key = self._key(commands[start:value_start] + commands[i - 2:i], 0, value_start - start + 2)
+
+        return start, value_start, key
+
+    def _clobbers(self, command, address):
+        """
+        :param command: List of strings, a pop.
+        :param address: Tuple, the address key.
+        :return: Bool. Whether the pop may change the value of the address.
+        """
+
+        segment = command[1]
+        if segment == 'that':
+            return any(operand[1] in ('static', 'this') for operand in address if operand[0] == 'push')
+        if segment == 'pointer':
+            return any(operand[1] in ('static', 'this', 'pointer') for operand in address if operand[0] == 'push')
+
+        return ('push', segment, command[2]) in address
+
+    def _record(self, commands, key, stat):
+
+        self.stats[stat] += 1
+        self.details.append('{0}: {1}'.format(commands[0][1], '; '.join(' '.join(operand) for operand in key)))
+
+        return
+
+
+class OperandOrderPass(object):
+    """
+    Evaluate the deeper operand of commutative operators first.
+
+    Computing A then B needs max(depth(A), 1 + depth(B)) stack slots, so
+    when both operands of an add, and, or or eq are pure, the operand
+    needing more slots is moved first. Pure operands only read, their
+    order does not change the result.
+    """
+
+    name = 'operand order'
+
+    COMMUTATIVE = ('add', 'and', 'or', 'eq')
+
+    def __init__(self):
+
+        self.stats = {'operands_swapped': 0, 'stack_slots_saved': 0}
+        self.details = []
+
+    def run(self, code):
+        """
+        :param code: List of strings, the commands of a function.
+        :return: List of strings, the optimized commands.
+        """
+
+        commands = [line.split() for line in code]
+        before = stack_depth(commands)
+        # Inner operators come first, their operands are ordered
+        # before the operands of the enclosing operators are measured.
+        for i, command in enumerate(commands):
+            if command[0] not in self.COMMUTATIVE:
+                continue
+            second = backward_expression(commands, i)
+            if second is None:
+                continue
+            first = backward_expression(commands, second)
+            if first is None:
+                continue
+            first_depth = self._depth(commands[first:second])
+            second_depth = self._depth(commands[second:i])
+            if max(second_depth, first_depth + 1) < max(first_depth, second_depth + 1):
+                commands[first:i] = commands[second:i] + commands[first:second]
+                self.stats['operands_swapped'] += 1
+
+        saved = before - stack_depth(commands)
+        if saved:
+            self.stats['stack_slots_saved'] += saved
+            self.details.append('{0}: {1} -> {2}'.format(commands[0][1], before, before - saved))
+
+        return [' '.join(command) for command in commands]
+
+    @staticmethod
+    def _depth(commands):
+        """
+        :param commands: List of split pure commands.
+        :return: Int. Stack slots needed to run them.
+        """
+
+        depth = deepest = 0
+        for command in commands:
+            popped, pushed = stack_effect(command)
+            depth += pushed - popped
+            deepest = max(deepest, depth)
+
+        return deepest
+
+
+def default_passes():
+    """
+    :return: List of passes run on every function when optimizing.
+    """
+
+    return [JumpThreadingPass(), ArrayAddressPass(), LoopInvariantPass(), LivenessPass(),
+            OperandOrderPass()]
+
+
+def optimize(code, passes):
+    """
+    Run passes over the VM code of a function.
+
+    :param code: List of strings, the commands of a function.
+    :param passes: List of passes.
+    :return: List of strings.
+    """
+
+    for the_pass in passes:
+        code = the_pass.run(code)
+
+    return code
+
+
+def report(passes):
+    """
+    :param passes: List of passes.
+    :return: String. A line of statistics per pass, followed
+             by the details the pass recorded, if any.
+    """
+
+    lines = []
+    for the_pass in passes:
+        stats = ', '.join('{0} {1}'.format(key.replace('_', ' '), value)
+                          for key, value in sorted(the_pass.stats.items()))
+        lines.append('{0}: {1}'.format(the_pass.name, stats))
+        for detail in getattr(the_pass, 'details', []):
+            lines.append('    ' + detail)
+
+    return '\n'.join(lines)
@@ -1,11 +1,47 @@
 # The VMWriter for the jack compiler
 
+from VMCode import FunctionCode, Op, OPS, SEGMENTS, TextSink
+
 
 class VMWriter(object):
 
-    def __init__(self, path):
+    def __init__(self, path, passes=None, track_lines=True):
+        """
+        :param path: Name of the .vm file, an open file object the code
+                     is written into, or a sink of VMCode the finished
+                     functions are handed to, e.g. a NullSink.
+        :param passes: List of VMOptimizer passes the code of each
+                       function is run through before being written.
+        :param track_lines: Whether the source lines are carried through
+                            the passes, e.g. for a source map. They are
+                            all 0 in the optimized code otherwise.
+        """
 
-        self.vm_file = open(path, 'w')
+        # Only close the files opened here.
+        self._owns_file = isinstance(path, str)
+        if self._owns_file:
+            self.vm_file = open(path, 'w')
+            self.sink = TextSink(self.vm_file, owns_file=True)
+        elif hasattr(path, 'write_function'):
+            self.vm_file = None
+            self.sink = path
+        else:
+            self.vm_file = path
+            self.sink = TextSink(self.vm_file)
+
+        # Number of VM commands written so far.
+        self.n_commands = 0
+
+        # The code of the current function is buffered until the
+        # next function starts, so that it can be rearranged.
+        self.passes = passes
+        self._code = FunctionCode()
+
+        # The jack source line the commands are written for, and the
+        # line of every command written so far, for the source map.
+        self.line = 0
+        self.source_lines = []
+        self.track_lines = track_lines
 
     def write_push(self, segment, index):
         """
@@ -16,10 +52,9 @@ class VMWriter(object):
         :return:
         """
 
-        if segment == 'VAR':
-            raise ValueError('No VAR please!')
-        code = 'push {segment} {index}\n'.format(segment=segment, index=index)
-        self.vm_file.write(code)
+        if segment not in SEGMENTS:
+            raise ValueError('No {0} please!'.format(segment))
+        self._code.append(Op.PUSH, SEGMENTS[segment], int(index), self.line)
 
         return
 
@@ -32,8 +67,9 @@ class VMWriter(object):
         :return:
         """
 
-        code = 'pop {segment} {index}\n'.format(segment=segment, index=index)
-        self.vm_file.write(code)
+        if segment not in SEGMENTS:
+            raise ValueError('No {0} please!'.format(segment))
+        self._code.append(Op.POP, SEGMENTS[segment], int(index), self.line)
 
         return
 
@@ -43,8 +79,9 @@ class VMWriter(object):
         :return:
         """
 
-        code = '{command}\n'.format(command=command)
-        self.vm_file.write(code)
+        if command not in OPS:
+            raise ValueError('Unknown VM command {0}'.format(command))
+        self._code.append(OPS[command], 0, 0, self.line)
 
         return
 
@@ -55,8 +92,7 @@ class VMWriter(object):
         :param label: String. The label name.
         :return:
         """
-        code = 'label {label}\n'.format(label=label)
-        self.vm_file.write(code)
+        self._code.append(Op.LABEL, self._code.name_id(label), 0, self.line)
 
         return
 
@@ -67,8 +103,7 @@ class VMWriter(object):
         :return:
         """
 
-        code = 'goto {label}\n'.format(label=label)
-        self.vm_file.write(code)
+        self._code.append(Op.GOTO, self._code.name_id(label), 0, self.line)
 
         return
 
@@ -78,8 +113,7 @@ class VMWriter(object):
         :return:
         """
 
-        code = 'if-goto {label}\n'.format(label=label)
-        self.vm_file.write(code)
+        self._code.append(Op.IF_GOTO, self._code.name_id(label), 0, self.line)
 
         return
 
@@ -92,8 +126,7 @@ class VMWriter(object):
         :return:
         """
 
-        code = 'call {func_name} {n_args}\n'.format(func_name=name, n_args=n_args)
-        self.vm_file.write(code)
+        self._code.append(Op.CALL, self._code.name_id(name), int(n_args), self.line)
 
         return
 
@@ -105,8 +138,8 @@ class VMWriter(object):
         :return:
         """
 
-        code = 'function {func_name} {n_locals}\n'.format(func_name=name, n_locals=n_locals)
-        self.vm_file.write(code)
+        self._flush_function()
+        self._code.append(Op.FUNCTION, self._code.name_id(name), int(n_locals), self.line)
 
         return
 
@@ -116,18 +149,133 @@ class VMWriter(object):
         :return:
         """
 
-        code = 'return\n'
-        self.vm_file.write(code)
+        self._code.append(Op.RETURN, 0, 0, self.line)
+
+        return
+
+    def _write(self, code):
+        """
+        Append a single VM command to the buffer
+        of the current function.
+
+        :param code: String. The formatted command.
+        :return:
+        """
+
+        self._code.append_text(code, self.line)
+
+        return
+
+    def _flush_function(self):
+        """
+        Optimize and write the buffered function.
+        :return:
+        """
+
+        if not len(self._code):
+            return
+
+        code = self._code
+        if self.passes:
+            # The passes work on text, the function makes a round trip.
+            # Matching the commands up again to carry their source lines
+            # over costs a diff, only paid when the lines are wanted.
+            from VMOptimizer import optimize
+            text = code.text()
+            optimized = optimize(text, self.passes)
+            lines = None
+            if self.track_lines:
+                from SourceMap import realign
+                lines = realign(text, optimized, code.lines)
+            code = FunctionCode.from_text(optimized, lines)
+        self._code = FunctionCode()
+        self.source_lines.extend(code.lines)
+        self._emit(code)
+        self.n_commands += len(code)
+
+        return
+
+    def write_function_code(self, code, lines):
+        """
+        Write the final code of a whole function, e.g. generated
+        and optimized by another writer.
+
+        :param code: List of strings, the VM commands.
+        :param lines: List of ints, their source lines.
+        :return:
+        """
+
+        self._flush_function()
+        code = FunctionCode.from_text(code, lines)
+        self.source_lines.extend(code.lines)
+        self._emit(code)
+        self.n_commands += len(code)
+
+        return
+
+    def _emit(self, code):
+        """
+        Hand the code of a function over to the sink.
+
+        :param code: FunctionCode.
+        :return:
+        """
+
+        self.sink.write_function(code)
+
+        return
+
+    def mark(self):
+        """
+        :return: A position in the code of the current function,
+                 to be handed to cut().
+        """
+
+        return len(self._code)
+
+    def cut(self, mark):
+        """
+        Take back the commands written since a mark,
+        so that they can be pasted somewhere else.
+
+        :param mark: Position returned by mark().
+        :return: FunctionCode of the commands.
+        """
+
+        return self._code.cut(mark)
+
+    def paste(self, code):
+        """
+        Write commands returned by cut(), they keep their source lines.
+
+        :param code: FunctionCode returned by cut().
+        :return:
+        """
+
+        self._code.extend(code)
 
         return
 
+    def last_command(self):
+        """
+        :return: String. The last command written in the current function,
+                 None if there is none.
+        """
+
+        if not len(self._code):
+            return None
+
+        return self._code.command(len(self._code) - 1)
+
     def close(self):
         """
-        Close the output file.
+        Write the last function and close the sink, a file
+        object handed over by the caller is only flushed.
         :return:
         """
 
-        self.vm_file.close()
+        self._flush_function()
+        self.sink.close()
 
         return
 
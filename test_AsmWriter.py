@@ -0,0 +1,173 @@
+# Tests of the Hack assembly backend: the generated program is run on a
+# minimal Hack CPU and must leave the same memory as the VM code does in
+# the VM emulator.
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from JackCompiler import compile_asm, compile_source
+from VMEmulator import VMEmulator
+
+# The programs poke their results at RESULTS, which needs no OS with
+# the Memory.poke intrinsic.
+RESULTS = 8000
+
+SYS = '\n'.join([
+    'class Sys {',
+    '    function void init() {',
+    '        do Main.main();',
+    '        return;',
+    '    }',
+    '}',
+])
+
+MAIN = '\n'.join([
+    'class Main {',
+    '    function int gcd(int a, int b) {',
+    '        while (~(b = 0)) {',
+    '            if (a > b) {',
+    '                let a = a - b;',
+    '            } else {',
+    '                let b = b - a;',
+    '            }',
+    '        }',
+    '        return a;',
+    '    }',
+    '    function void main() {',
+    '        var int i, flag, sum;',
+    '        do Memory.poke(8000, Main.gcd(84, 36));',
+    '        while (i < 10) {',
+    '            if ((i & 1) = 0) {',
+    '                let sum = sum + i;',
+    '            }',
+    '            let i = i + 1;',
+    '        }',
+    '        do Memory.poke(8001, sum);',
+    '        let flag = 5;',
+    '        if (flag) {',
+    '            do Memory.poke(8002, 1);',
+    '        } else {',
+    '            do Memory.poke(8002, 2);',
+    '        }',
+    '        let flag = -1;',
+    '        if (flag) {',
+    '            do Memory.poke(8003, 1);',
+    '        } else {',
+    '            do Memory.poke(8003, 2);',
+    '        }',
+    '        do Memory.poke(8004, (-7 < 3) | (300 > 2000));',
+    '        do Memory.poke(8005, -(32767 - 5) - 9);',
+    '        return;',
+    '    }',
+    '}',
+])
+
+
+def _run_hack(asm, max_steps=1000000):
+    """
+    Assemble and run a Hack program until it reaches the halt loop
+    of the bootstrap.
+
+    :param asm: String. The Hack assembly.
+    :return: List of Int. The RAM.
+    """
+
+    symbols = {'SP': 0, 'LCL': 1, 'ARG': 2, 'THIS': 3, 'THAT': 4,
+               'SCREEN': 16384, 'KBD': 24576}
+    symbols.update(('R{0}'.format(i), i) for i in range(16))
+    lines = [line.split('//')[0].strip() for line in asm.splitlines()]
+    program = []
+    for line in lines:
+        if line.startswith('('):
+            symbols[line[1:-1]] = len(program)
+        elif line:
+            program.append(line)
+
+    variable = 16
+    code = []
+    for line in program:
+        if line.startswith('@'):
+            value = line[1:]
+            if not value.isdigit():
+                if value not in symbols:
+                    symbols[value] = variable
+                    variable += 1
+                value = symbols[value]
+            code.append((int(value), None, None))
+            continue
+        dest, comp, jump = '', line, ''
+        if '=' in comp:
+            dest, comp = comp.split('=', 1)
+        if ';' in comp:
+            comp, jump = comp.split(';')
+        code.append((dest, compile(comp.replace('!', '~'), comp, 'eval'), jump))
+
+    ram = [0] * 32768
+    a = d = pc = 0
+    halt = symbols['$$HALT']
+    for _ in range(max_steps):
+        if pc == halt:
+            return ram
+        dest, comp, jump = code[pc]
+        if comp is None:
+            a = dest
+            pc += 1
+            continue
+        value = eval(comp, {}, {'A': a, 'D': d, 'M': ram[a & 0x7FFF]})
+        value = ((value + 32768) & 0xFFFF) - 32768
+        if 'M' in dest:
+            ram[a & 0x7FFF] = value
+        if 'A' in dest:
+            a = value
+        if 'D' in dest:
+            d = value
+        taken = {'': False, 'JMP': True, 'JEQ': value == 0, 'JNE': value != 0,
+                 'JGT': value > 0, 'JLT': value < 0, 'JGE': value >= 0,
+                 'JLE': value <= 0}[jump]
+        pc = a if taken else pc + 1
+
+    raise RuntimeError('The program did not halt')
+
+
+class AsmWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.program = os.path.join(self.directory, 'Program')
+        os.makedirs(self.program)
+        for name, source in [('Sys', SYS), ('Main', MAIN)]:
+            with open(os.path.join(self.program, name + '.jack'), 'w') as f:
+                f.write(source)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _compare(self, optimize):
+        emulator = VMEmulator()
+        for name, source in [('Sys', SYS), ('Main', MAIN)]:
+            emulator.load_vm(compile_source(source, name, optimize=optimize))
+        emulator.run(max_steps=100000)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            diagnostics = compile_asm(self.program, self.directory, optimize=optimize)
+        self.assertEqual(diagnostics, [])
+        with open(os.path.join(self.directory, 'Program.asm')) as f:
+            ram = _run_hack(f.read())
+
+        expected = [12, 20, 2, 1, -1, 32765]
+        self.assertEqual(list(emulator.ram[RESULTS:RESULTS + 6]), expected)
+        self.assertEqual(ram[RESULTS:RESULTS + 6], expected)
+
+    def test_same_memory_as_vm(self):
+        self._compare(optimize=False)
+
+    def test_same_memory_as_optimized_vm(self):
+        self._compare(optimize=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+# Tests of the asyncio entry points.
+
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+from AsyncCompiler import AsyncCompiler, compile_project
+from JackCompiler import compile_source
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'samples')
+
+BROKEN = '\n'.join([
+    'class Broken {',
+    '    function void main() {',
+    '        let x = ;',
+    '        return;',
+    '    }',
+    '}',
+])
+
+
+class AsyncCompilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.sources = {}
+        for name in ['List', 'Main']:
+            with open(os.path.join(SAMPLES, 'List', name + '.jack')) as f:
+                self.sources[name] = f.read()
+        self.sources['Broken'] = BROKEN
+        for name, source in self.sources.items():
+            with open(os.path.join(self.directory, name + '.jack'), 'w') as f:
+                f.write(source)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_project_streamed(self):
+        output_dir = os.path.join(self.directory, 'out')
+
+        async def collect():
+            return [result async for result in compile_project(self.directory, output_dir)]
+
+        results = {r['class_name']: r for r in asyncio.run(collect())}
+
+        self.assertEqual(sorted(results), ['Broken', 'List', 'Main'])
+        for name in ['List', 'Main']:
+            self.assertEqual(results[name]['status'], 'ok')
+            self.assertEqual(results[name]['vm_code'], compile_source(self.sources[name], name))
+            with open(os.path.join(output_dir, name + '.vm')) as f:
+                self.assertEqual(f.read(), results[name]['vm_code'])
+        self.assertEqual(results['Broken']['status'], 'error')
+        self.assertEqual([d.line for d in results['Broken']['diagnostics']], [3])
+        self.assertFalse(os.path.exists(os.path.join(output_dir, 'Broken.vm')))
+
+    def test_closing_stream_cancels_pending(self):
+
+        async def first():
+            stream = AsyncCompiler(max_in_flight=1).compile_project(self.directory)
+            result = await stream.__anext__()
+            await stream.aclose()
+            others = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            return result, others
+
+        result, others = asyncio.run(first())
+
+        self.assertIn(result['class_name'], self.sources)
+        self.assertEqual(others, [])
+
+    def test_compile_source(self):
+        vm_code = asyncio.run(AsyncCompiler().compile_source(self.sources['List'], 'List'))
+
+        self.assertEqual(vm_code, compile_source(self.sources['List'], 'List'))
+
+
+if __name__ == '__main__':
+    unittest.main()
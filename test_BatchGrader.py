@@ -0,0 +1,74 @@
+# Tests of the batch grading mode.
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from BatchGrader import BatchGrader, find_projects
+
+MAIN = '\n'.join([
+    'class Main {',
+    '    function void main() {',
+    '        do Output.printInt(1);',
+    '        return;',
+    '    }',
+    '}',
+])
+
+
+class ManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.output = os.path.join(self.root, 'out')
+        self.manifest = os.path.join(self.root, 'batch', 'manifest.txt')
+        for project in ['batch/p', 'batch/other/p', 'other/p']:
+            os.makedirs(os.path.join(self.root, project))
+            with open(os.path.join(self.root, project, 'Main.jack'), 'w') as f:
+                f.write(MAIN)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _write_manifest(self, lines):
+        with open(self.manifest, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def test_ids_stay_inside_output_tree(self):
+        self._write_manifest(['../other/p', 'other/p', 'p', './p'])
+
+        projects = find_projects(self.manifest)
+
+        self.assertEqual([project_id for project_id, _ in projects],
+                         ['other/p', 'other/p-2', 'p', 'p-2'])
+        self.assertEqual(projects[0][1], os.path.join(self.root, 'other', 'p'))
+
+    def test_outputs_written_under_output_root(self):
+        self._write_manifest(['../other/p', 'other/p'])
+        report = io.StringIO()
+
+        summary = BatchGrader(self.output, jobs=1).grade(find_projects(self.manifest), report)
+
+        self.assertEqual(summary, {'ok': 2})
+        self.assertTrue(os.path.isfile(os.path.join(self.output, 'other', 'p', 'Main.vm')))
+        self.assertTrue(os.path.isfile(os.path.join(self.output, 'other', 'p-2', 'Main.vm')))
+        # Nothing is written next to the sources.
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'other', 'p', 'Main.vm')))
+        records = [json.loads(line) for line in report.getvalue().splitlines()]
+        self.assertEqual(sorted(r['project'] for r in records), ['other/p', 'other/p-2'])
+
+    def test_symbolic_link_out_of_output_root_refused(self):
+        os.makedirs(self.output)
+        os.symlink(os.path.join(self.root, 'other'), os.path.join(self.output, 'other'))
+        self._write_manifest(['../other/p'])
+
+        with self.assertRaises(ValueError):
+            BatchGrader(self.output, jobs=1).grade(find_projects(self.manifest), io.StringIO())
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'other', 'p', 'Main.vm')))
+
+
+if __name__ == '__main__':
+    unittest.main()
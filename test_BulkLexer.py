@@ -0,0 +1,63 @@
+# Tests of the vectorized lexer against the scalar tokenizer.
+
+import io
+import os
+import unittest
+
+import BulkLexer
+from Tokenizer import Tokenizer
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'samples')
+
+UNICODE = '\n'.join([
+    'class Main {',
+    '    function void main() {',
+    '        do Output.printString("q é ñ"); let x = 12; // été',
+    '        /** 日本 */',
+    '        let s = "日本"; let y = x;',
+    '        return;',
+    '    }',
+    '}',
+])
+
+
+def _scalar(source):
+
+    output = io.StringIO()
+    positions = []
+    Tokenizer.tokenize_lines(source.splitlines(True), output, positions)
+
+    return output.getvalue(), positions
+
+
+def _bulk(source):
+
+    output = io.StringIO()
+    positions = []
+    BulkLexer.tokenize(source.encode('utf-8'), output, positions)
+
+    return output.getvalue(), positions
+
+
+@unittest.skipIf(not BulkLexer.available(), 'NumPy is not installed')
+class BulkLexerTest(unittest.TestCase):
+
+    def test_samples(self):
+        for root, _, names in os.walk(SAMPLES):
+            for name in sorted(names):
+                if name.endswith('.jack'):
+                    with open(os.path.join(root, name)) as f:
+                        source = f.read()
+                    self.assertEqual(_bulk(source), _scalar(source), name)
+
+    def test_columns_counted_in_characters(self):
+        tokens, positions = _bulk(UNICODE)
+
+        self.assertEqual((tokens, positions), _scalar(UNICODE))
+        # The 'let' after a string of 5 characters in 7 bytes.
+        self.assertIn((3, 41), positions)
+        self.assertIn('<stringConstant> 日本 </stringConstant>', tokens)
+
+
+if __name__ == '__main__':
+    unittest.main()
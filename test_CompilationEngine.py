@@ -0,0 +1,131 @@
+# Tests of the compilation engine: syntax error recovery and XML output.
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import CompilationEngine
+from CompilationEngine import XmlWriter
+from JackCompiler import check_source, parse_source, tokenize_source
+
+
+class RecoveryTest(unittest.TestCase):
+
+    def test_missing_brace_before_erroneous_subroutine(self):
+        source = '\n'.join([
+            'class Main {',
+            '    function void a() {',
+            '        if (true) {',
+            '            do Output.printInt(1);',
+            '        return;',
+            '    }',
+            '    function void b() {',
+            '        let x = ;',
+            '        return;',
+            '    }',
+            '}',
+        ])
+
+        lines = [diagnostic.line for diagnostic in check_source(source)]
+
+        # The missing '}' is found at 'function b', whose error is reported too.
+        self.assertEqual(lines, [7, 8])
+
+    def test_error_in_while_condition(self):
+        source = '\n'.join([
+            'class Main {',
+            '    function void a() {',
+            '        var int x, y, c;',
+            '        while (x + ) {',
+            '            let y = 1;',
+            '        }',
+            '        let c = ;',
+            '        return;',
+            '    }',
+            '}',
+        ])
+
+        diagnostics = [(d.line, d.column, d.message) for d in check_source(source)]
+
+        # The block is still parsed as the block of the loop, so the
+        # error after it is found and the class body is left alone.
+        self.assertEqual(diagnostics, [(4, 20, 'Expected a term, found )'),
+                                       (7, 17, 'Expected a term, found ;')])
+
+    def test_error_in_if_condition_with_else(self):
+        source = '\n'.join([
+            'class Main {',
+            '    function void a() {',
+            '        var int x, y;',
+            '        if ((x + 1) * ) {',
+            '            let y = 1;',
+            '        } else {',
+            '            let y = ;',
+            '        }',
+            '        return;',
+            '    }',
+            '}',
+        ])
+
+        lines = [diagnostic.line for diagnostic in check_source(source)]
+
+        self.assertEqual(lines, [4, 7])
+
+    def test_unterminated_class_reported_once(self):
+        source = 'class Main {\n function void a() {\n return;\n'
+
+        diagnostics = [(d.line, d.column, d.message) for d in check_source(source)]
+
+        self.assertEqual(diagnostics, [(3, 8, 'Unexpected end of file')])
+
+
+class XmlWriterTest(unittest.TestCase):
+
+    def test_written_as_rules_close(self):
+        output = io.StringIO()
+        writer = XmlWriter(output)
+
+        for line in ['<class>', '<keyword> class </keyword>', '<identifier> Main </identifier>',
+                     '<symbol> { </symbol>', '<classVarDec>', '<keyword> static </keyword>',
+                     '<keyword> int </keyword>', '<static int 0> n </static int 0>']:
+            writer.append(line)
+        self.assertEqual(output.getvalue(), '')
+        writer.append('</classVarDec>')
+
+        self.assertEqual(output.getvalue().splitlines(), [
+            '<class>',
+            '  <keyword> class </keyword>',
+            '  <identifier> Main </identifier>',
+            '  <symbol> { </symbol>',
+            '  <classVarDec>',
+            '    <keyword> static </keyword>',
+            '    <keyword> int </keyword>',
+            '    <identifier kind="static" type="int" index="0"> n </identifier>',
+            '  </classVarDec>',
+        ])
+        self.assertEqual(len(writer), 9)
+
+    def test_tree_written_next_to_tokens(self):
+        source = 'class Main {\n function void main() {\n return;\n }\n}\n'
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        token_path = os.path.join(directory, 'Main.xml')
+        with open(token_path, 'w') as f:
+            f.write(tokenize_source(source))
+
+        # A second run leaves the tree it wrote alone.
+        for _ in range(2):
+            CompilationEngine.compile_file(directory)
+
+        self.assertEqual(sorted(os.listdir(directory)), ['Main.tree.xml', 'Main.xml'])
+        with open(token_path) as f:
+            self.assertEqual(f.read(), tokenize_source(source))
+        with open(os.path.join(directory, 'Main.tree.xml')) as f:
+            self.assertEqual(f.read(), parse_source(source))
+        self.assertRaises(ValueError, CompilationEngine._compile_file, token_path, token_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
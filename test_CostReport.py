@@ -0,0 +1,85 @@
+# Tests of the static cost report.
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import JackCompiler
+from CostReport import CostReport
+
+MAIN = '\n'.join([
+    'class Main {',
+    '    function int square(int x) {',
+    '        return x * x;',
+    '    }',
+    '    function void main() {',
+    '        var int i, j;',
+    '        while (i < 3) {',
+    '            let j = 0;',
+    '            while (j < 3) {',
+    '                do Output.printInt(Main.square(j));',
+    '                let j = j + 1;',
+    '            }',
+    '            let i = i + 1;',
+    '        }',
+    '        do Output.printString("hi");',
+    '        return;',
+    '    }',
+    '}',
+])
+
+
+class CostReportTest(unittest.TestCase):
+
+    def test_hand_counted_function(self):
+        report = CostReport()
+        report.add_vm('\n'.join([
+            'function Main.f 1',
+            'push constant 1',
+            'pop local 0',
+            'push local 0',
+            'return',
+        ]))
+
+        row = report.rows()[0]
+
+        # 7 per local, 7 + 12 + 10 for the push and pops, 40 to return.
+        self.assertEqual(row['hack'], 7 + 7 + 12 + 10 + 40)
+        self.assertEqual(row['vm'], 5)
+        self.assertEqual(row['opcodes'], {'function': 1, 'push': 2, 'pop': 1, 'return': 1})
+        self.assertEqual(row['stack_depth'], 1)
+        self.assertEqual(row['source'], '-')
+
+    def test_compiled_class_with_source_map(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        file_path = os.path.join(directory, 'Main.jack')
+        with open(file_path, 'w') as f:
+            f.write(MAIN)
+        report = CostReport()
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            JackCompiler.compile(file_path, directory, cost_report=report, source_map=True,
+                                 verbose=False)
+
+        self.assertEqual(output.getvalue(), '')
+        rows = dict((row['function'], row) for row in report.rows())
+        main = rows['Main.main']
+        self.assertEqual(main['loop_depth'], 2)
+        self.assertEqual((main['strings'], main['string_chars']), (1, 2))
+        # printInt, printString, String.new and appendChar twice.
+        self.assertEqual((main['os_calls'], main['user_calls']), (5, 1))
+        self.assertEqual(main['source'], 'Main.jack:5')
+        self.assertEqual(rows['Main.square']['source'], 'Main.jack:2')
+        self.assertEqual(rows['Main.square']['loop_depth'], 0)
+        # The lines of the body are charged their own code.
+        self.assertGreater(main['lines'][10], main['lines'][8])
+        self.assertEqual(sum(main['lines'].values()), main['hack'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+# Tests of the cross-reference index.
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from CrossReference import CrossReference
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SAMPLES = os.path.join(HERE, 'samples')
+
+
+class CrossReferenceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.project = os.path.join(self.directory, 'List')
+        shutil.copytree(os.path.join(SAMPLES, 'List'), self.project)
+        self.db_path = os.path.join(self.directory, 'xref.sqlite')
+        self.list_path = os.path.join(self.project, 'List.jack')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _index(self):
+        index = CrossReference(self.db_path)
+        self.addCleanup(index.close)
+        index.update(self.project)
+
+        return index
+
+    def test_queries(self):
+        index = self._index()
+
+        self.assertEqual([(r['subroutine'], r['line']) for r in index.callers('List.getNext')],
+                         [('reverse', 29), ('print', 48)])
+        self.assertEqual([r['callee'] for r in index.callees('Main.main')][:3],
+                         ['List.new', 'List.new', 'List.print'])
+        self.assertEqual([(r['subroutine'], r['line']) for r in index.writes('List', 'next')],
+                         [('new', 8), ('setNext', 38)])
+        self.assertEqual([(r['kind'], r['n_args'], r['line']) for r in index.definitions('List.reverse')],
+                         [('method', 0, 24)])
+        self.assertEqual(index.errors(), [])
+
+    def test_only_changed_files_parsed_again(self):
+        self.assertEqual(self._index().stats['parsed'], 2)
+
+        with open(self.list_path) as f:
+            source = f.read()
+        with open(self.list_path, 'w') as f:
+            f.write(source.replace('getNext', 'tail'))
+        index = self._index()
+
+        self.assertEqual(index.stats, {'parsed': 1, 'unchanged': 1, 'removed': 0, 'errors': 0})
+        self.assertEqual(index.callers('List.getNext'), [])
+        self.assertEqual(len(index.callers('List.tail')), 2)
+        self.assertEqual(len(index.definitions('List.tail')), 1)
+
+    def test_subroutine_named_like_a_variable(self):
+        with open(self.list_path) as f:
+            source = f.read()
+        # 'following' is also a local of List.reverse, which calls it.
+        with open(self.list_path, 'w') as f:
+            f.write(source.replace('getNext', 'following'))
+        index = self._index()
+
+        self.assertEqual([r['subroutine'] for r in index.callers('List.following')],
+                         ['reverse', 'print'])
+        self.assertEqual([r['line'] for r in index.references('List', 'following')], [29, 32])
+
+    def test_removed_and_broken_files(self):
+        self._index()
+        os.remove(os.path.join(self.project, 'Main.jack'))
+        with open(self.list_path, 'a') as f:
+            f.write('}\n')
+
+        index = self._index()
+
+        self.assertEqual(index.stats, {'parsed': 1, 'unchanged': 0, 'removed': 1, 'errors': 1})
+        self.assertEqual(index.callees('Main.main'), [])
+        self.assertEqual([r['path'] for r in index.errors()], [self.list_path])
+
+
+    def test_command_line_rejects_unqualified_name(self):
+        for query in ['callers', 'callees', 'refs', 'writes']:
+            process = subprocess.run([sys.executable, os.path.join(HERE, 'CrossReference.py'),
+                                      self.project, query, 'List', '--db', self.db_path],
+                                     capture_output=True, text=True)
+
+            self.assertEqual(process.returncode, 2)
+            self.assertIn('needs a Class.name, not List', process.stderr)
+            self.assertNotIn('Traceback', process.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+# Tests of the incremental compilation at subroutine granularity.
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from IncrementalCompiler import IncrementalCompiler
+from JackCompiler import compile_source, tokenize_source
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'samples')
+
+with open(os.path.join(SAMPLES, 'List', 'List.jack')) as f:
+    LIST = f.read()
+
+# The class has a constructor and 7 methods.
+N_SUBROUTINES = 8
+
+
+def _tokens(source):
+
+    return tokenize_source(source).splitlines(True)[1:-1]
+
+
+class IncrementalTest(unittest.TestCase):
+
+    def test_edited_subroutine_reparsed_alone(self):
+        compiler = IncrementalCompiler()
+        edited = LIST.replace('return 1;', 'return 2;', 1)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            first = compiler.compile_tokens(_tokens(LIST), None, 'List')
+            second = compiler.compile_tokens(_tokens(edited), None, 'List')
+
+        self.assertEqual(first, compile_source(LIST, 'List'))
+        self.assertEqual(second, compile_source(edited, 'List'))
+        self.assertEqual(compiler.stats, {'reparsed': N_SUBROUTINES + 1,
+                                          'reused': N_SUBROUTINES - 1,
+                                          'class_vars_reparsed': 1})
+
+    def test_cache_persisted_per_compiler_options(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        cache_dir = os.path.join(directory, 'cache')
+        file_path = os.path.join(directory, 'List.jack')
+        with open(file_path, 'w') as f:
+            f.write(LIST)
+
+        runs = []
+        for optimize in [False, False, True]:
+            compiler = IncrementalCompiler(cache_dir, optimize=optimize)
+            with contextlib.redirect_stdout(io.StringIO()):
+                vm_code = compiler.compile_file(file_path, directory)
+            runs.append((compiler.stats['reused'], vm_code))
+
+        # A new compiler re-uses the cache of the same options only.
+        self.assertEqual([reused for reused, _ in runs], [0, N_SUBROUTINES, 0])
+        self.assertEqual(runs[1][1], compile_source(LIST, 'List'))
+        self.assertEqual(runs[2][1], compile_source(LIST, 'List', optimize=True))
+        with open(os.path.join(directory, 'List.vm')) as f:
+            self.assertEqual(f.read(), runs[2][1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,236 @@
+# Tests of the code generation of the jack compiler, run in the VM emulator.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import CompilationEngine
+import JackCompiler
+from JackCompiler import compile_source, parse_source, tokenize_source
+from VMEmulator import VMEmulator
+
+
+def _run(source, **options):
+    """
+    Compile source as class Main and run it.
+
+    :param options: Keyword arguments of compile_source().
+    :return: VMEmulator. The emulator, after running the code.
+    """
+
+    emulator = VMEmulator()
+    emulator.load_vm(compile_source(source, 'Main', **options))
+    emulator.run(max_steps=1000000)
+
+    return emulator
+
+
+class IntrinsicsTest(unittest.TestCase):
+
+    SOURCE = '\n'.join([
+        'class Main {',
+        '    static int n;',
+        '    function int next() {',
+        '        let n = n + 1;',
+        '        return n;',
+        '    }',
+        '    function void main() {',
+        '        var int x;',
+        '        do Memory.poke(8000, -7);',
+        '        let x = Memory.peek(8000);',
+        '        do Output.printInt(Math.abs(x));',
+        '        do Output.printInt(Math.min(x, 3));',
+        '        do Output.printInt(Math.max(x, 3));',
+        '        do Output.printInt(Math.abs(-32767));',
+        '        do Output.printInt(Math.max(Main.next(), Main.next()));',
+        '        do Output.printInt(n);',
+        '        return;',
+        '    }',
+        '}',
+    ])
+
+    def test_same_behaviour_as_calls(self):
+        expanded = _run(self.SOURCE, intrinsics=True)
+        called = _run(self.SOURCE, intrinsics=False)
+
+        self.assertEqual(called.output_text(), '7-733276722')
+        self.assertEqual(expanded.output_text(), called.output_text())
+        self.assertEqual(expanded.ram[8000], -7)
+
+    def test_calls_expanded(self):
+        calls = _run(self.SOURCE, intrinsics=True).profile()['calls']
+
+        for name in ['Memory.peek', 'Memory.poke', 'Math.abs', 'Math.min', 'Math.max']:
+            self.assertNotIn(name, calls)
+        # The arguments are still evaluated once each.
+        self.assertEqual(calls['Main.next'], 2)
+
+
+
+class BranchTest(unittest.TestCase):
+
+    def test_comparison_loop_rotated(self):
+        source = '\n'.join([
+            'class Main {',
+            '    function void main() {',
+            '        var int i, sum;',
+            '        while (i < 100) {',
+            '            if (i > 49) {',
+            '                let sum = sum + 1;',
+            '            } else {',
+            '                let sum = sum + 2;',
+            '            }',
+            '            let i = i + 1;',
+            '        }',
+            '        do Output.printInt(sum);',
+            '        return;',
+            '    }',
+            '}',
+        ])
+
+        emulator = _run(source)
+        opcodes = emulator.profile()['opcodes']
+
+        self.assertEqual(emulator.output_text(), '150')
+        # One jump into the loop, one test per iteration, one goto
+        # over the else branch per iteration through the then branch.
+        self.assertEqual(opcodes['if-goto'], 100 + 1 + 100)
+        self.assertEqual(opcodes['goto'], 1 + 50)
+        self.assertNotIn('not', opcodes)
+
+    def test_non_boolean_conditions(self):
+        source = '\n'.join([
+            'class Main {',
+            '    function void main() {',
+            '        var int n, flag;',
+            '        let n = 3;',
+            '        while (n) {',
+            '            let n = n - 1;',
+            '            do Output.printInt(9);',
+            '        }',
+            '        let flag = 2;',
+            '        if (flag) {',
+            '            do Output.printInt(1);',
+            '        } else {',
+            '            do Output.printInt(0);',
+            '        }',
+            '        let flag = true;',
+            '        while (flag) {',
+            '            let flag = false;',
+            '            do Output.printInt(8);',
+            '        }',
+            '        return;',
+            '    }',
+            '}',
+        ])
+
+        # Only -1 is true, as in 'not; if-goto' of the plain VM code.
+        self.assertEqual(_run(source).output_text(), '08')
+
+
+class SourceApiTest(unittest.TestCase):
+
+    SOURCE = '\n'.join([
+        'class Main {',
+        '    field int size;',
+        '    method boolean fits(int x) {',
+        '        do Output.printString("a < b & \'c\'");',
+        '        return (x < size) & (x > 0);',
+        '    }',
+        '}',
+    ])
+
+    def test_same_as_written_files(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        file_path = os.path.join(directory, 'Main.jack')
+        with open(file_path, 'w') as f:
+            f.write(self.SOURCE)
+
+        JackCompiler.compile(file_path, directory, verbose=False)
+        CompilationEngine.compile_file(directory)
+
+        with open(os.path.join(directory, 'Main.xml')) as f:
+            self.assertEqual(tokenize_source(self.SOURCE), f.read())
+        with open(os.path.join(directory, 'Main.tree.xml')) as f:
+            tree = f.read()
+        self.assertEqual(parse_source(self.SOURCE), tree)
+        self.assertIn('<identifier kind="field" type="int" index="0"> size </identifier>', tree)
+        self.assertIn('<stringConstant> a &lt; b &amp; \'c\' </stringConstant>', tree)
+        with open(os.path.join(directory, 'Main.vm')) as f:
+            self.assertEqual(compile_source(self.SOURCE, 'Main'), f.read())
+
+
+class ExpressionTest(unittest.TestCase):
+
+    DEPTH = 5000
+
+    def _main(self, *statements):
+
+        return '\n'.join(['class Main {', '    function void main() {', '        var int x;']
+                         + ['        ' + statement for statement in statements]
+                         + ['        return;', '    }', '}'])
+
+    def test_left_to_right(self):
+        source = self._main('do Output.printInt(2 + 3 * 4 - 5 / 1);',
+                            'do Output.printInt(1 - (2 - 3));')
+
+        self.assertEqual(_run(source).output_text(), '152')
+
+    def test_deep_nesting(self):
+        self.assertGreater(self.DEPTH, sys.getrecursionlimit())
+        left = '(' * self.DEPTH + '1' + ' + 1)' * self.DEPTH
+        unary = '-~' * self.DEPTH + '7'
+        source = self._main('let x = {0};'.format(left),
+                            'do Output.printInt(x);',
+                            'do Output.printInt({0});'.format(unary))
+
+        # -~x is x + 1.
+        self.assertEqual(_run(source).output_text(), '{0}{1}'.format(1 + self.DEPTH, 7 + self.DEPTH))
+        # Nested to the right, every level waits on the stack.
+        right = '(1 + ' * self.DEPTH + '1' + ')' * self.DEPTH
+        vm_code = compile_source(self._main('let x = {0};'.format(right)), 'Main')
+        self.assertEqual(vm_code.count('add'), self.DEPTH)
+
+
+class ParallelTest(unittest.TestCase):
+
+    def test_same_files_as_serial(self):
+        lines = ['class Main {', '    static int n;']
+        for i in range(24):
+            lines += [
+                '    function int f{0}(int x) {{'.format(i),
+                '        while (x > {0}) {{'.format(i),
+                '            if (x & 1) { let x = x - 1; } else { let n = n + x; }',
+                '            let x = x - 1;',
+                '        }',
+                '        return Main.f{0}(x);'.format(i - 1) if i else '        return x;',
+                '    }',
+            ]
+        lines.append('}')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        file_path = os.path.join(directory, 'Main.jack')
+        with open(file_path, 'w') as f:
+            f.write('\n'.join(lines))
+
+        outputs = []
+        for jobs in [1, 2]:
+            output_dir = os.path.join(directory, str(jobs))
+            os.mkdir(output_dir)
+            JackCompiler.compile(file_path, output_dir, source_map=True, jobs=jobs, verbose=False)
+            files = []
+            for name in ['Main.vm', 'Main.vm.map']:
+                with open(os.path.join(output_dir, name)) as f:
+                    files.append(f.read())
+            outputs.append(files)
+
+        self.assertEqual(outputs[1], outputs[0])
+        # The labels of every subroutine are numbered in its own namespace.
+        self.assertEqual(outputs[0][0].count('label Main_f23_'), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# Tests of the skeleton parse and the outlines of classes.
+
+import os
+import unittest
+
+import BulkLexer
+from JackCompiler import _parse_source
+from Outline import Outline, parse_skeleton
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'samples')
+LIST = os.path.join(SAMPLES, 'List')
+
+
+def _sources():
+
+    for root, _, names in os.walk(SAMPLES):
+        for name in sorted(names):
+            if name.endswith('.jack'):
+                with open(os.path.join(root, name)) as f:
+                    yield name, f.read()
+
+
+def _subroutines(result):
+    """
+    :return: List of the lines of every subroutine declaration in a parse.
+    """
+
+    subroutines = []
+    inside = False
+    for line in result:
+        if line == '<subroutineDec>':
+            subroutines.append([])
+            inside = True
+        if inside:
+            subroutines[-1].append(line)
+        if line == '</subroutineDec>':
+            inside = False
+
+    return subroutines
+
+
+class OutlineTest(unittest.TestCase):
+
+    def test_same_as_full_parse(self):
+        for bulk in [False, True]:
+            for name, source in _sources():
+                full = _parse_source(source)
+                skeleton = parse_skeleton(source, bulk)
+
+                self.assertEqual(skeleton.outline(), full.outline(), name)
+                parsed = [skeleton.parse_subroutine(subroutine['name'])
+                          for subroutine in skeleton.subroutines]
+                self.assertEqual(parsed, _subroutines(full.compilation_result), name)
+
+    @unittest.skipIf(not BulkLexer.available(), 'NumPy is not installed')
+    def test_positions_from_bulk_lexer(self):
+        for name, source in _sources():
+            self.assertEqual(parse_skeleton(source).positions,
+                             parse_skeleton(source, bulk=False).positions, name)
+
+    def test_format(self):
+        lines = Outline(LIST).format().splitlines()
+
+        self.assertEqual(lines[0], 'class List')
+        self.assertIn('    field int data', lines)
+        self.assertIn('    constructor List new(int car, List cdr)', lines)
+        self.assertIn('class Main', lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+# Tests of the differential parity harness.
+
+import os
+import unittest
+
+import Parity
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'samples')
+
+BROKEN = '\n'.join([
+    'class Broken {',
+    '    function void main() {',
+    '        let x = ;',
+    '        return;',
+    '    }',
+    '}',
+])
+
+
+class ParityTest(unittest.TestCase):
+
+    def test_paths_agree_with_files(self):
+        parity = Parity.Parity()
+        corpus = Parity.load_corpus([SAMPLES], n_generated=3)
+        corpus.append(('<broken>', 'Broken', BROKEN))
+
+        for name, class_name, source in corpus:
+            parity.check(name, class_name, source)
+
+        self.assertEqual(parity.n_classes, len(corpus))
+        self.assertEqual(parity.mismatches, [])
+
+    def test_legacy_reads_written_files(self):
+        with open(os.path.join(SAMPLES, 'List', 'List.jack')) as f:
+            outputs = Parity.legacy(f.read(), 'List')
+
+        self.assertTrue(outputs['tokens'].startswith('<tokens>'))
+        self.assertTrue(outputs['xml'].startswith('<class>\n  <keyword> class </keyword>'))
+        self.assertTrue(outputs['vm'].startswith('function List.new'))
+        self.assertEqual(Parity.legacy(BROKEN, 'Broken')['vm'],
+                         'error ParseError: Expected a term, found ;')
+
+    def test_mismatch_reported(self):
+        parity = Parity.Parity(['memory'])
+        source = 'class Main { function void main() { return; } }\n'
+        memory = Parity.PATHS['memory']
+        Parity.PATHS['memory'] = (lambda s, c: dict(memory[0](s, c), vm='return'), memory[1])
+        self.addCleanup(Parity.PATHS.__setitem__, 'memory', memory)
+
+        parity.check('<main>', 'Main', source)
+
+        self.assertEqual(parity.mismatches,
+                         [('memory', 'vm', '<main>', (1, 'function Main.main 0', 'return'))])
+
+
+if __name__ == '__main__':
+    unittest.main()
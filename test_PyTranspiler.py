@@ -0,0 +1,85 @@
+# Tests of the Python backend: transpiled programs must print what
+# their VM code prints in the VM emulator.
+
+import os
+import unittest
+
+from JackCompiler import compile_source
+from PyTranspiler import PyRuntime
+from VMEmulator import VMEmulator
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'samples')
+
+
+def _emulate(sources):
+    """
+    :param sources: List of (class name, jack source).
+    :return: String. What the program prints in the VM emulator.
+    """
+
+    emulator = VMEmulator()
+    for class_name, source in sources:
+        emulator.load_vm(compile_source(source, class_name))
+    emulator.run(max_steps=10000000)
+
+    return emulator.output_text()
+
+
+class PyRuntimeTest(unittest.TestCase):
+
+    def test_samples(self):
+        for name in sorted(os.listdir(SAMPLES)):
+            directory = os.path.join(SAMPLES, name)
+            sources = []
+            for file_name in sorted(os.listdir(directory)):
+                with open(os.path.join(directory, file_name)) as f:
+                    sources.append((file_name[:-5], f.read()))
+            runtime = PyRuntime()
+            runtime.load_file(directory)
+            runtime.run()
+
+            self.assertEqual(runtime.output_text(), _emulate(sources), name)
+
+    def test_vm_semantics(self):
+        source = '\n'.join([
+            'class Main {',
+            '    static int calls;',
+            '    function int next() {',
+            '        let calls = calls + 1;',
+            '        return calls;',
+            '    }',
+            '    function void main() {',
+            '        var Array a;',
+            '        var int flag;',
+            '        let a = Array.new(4);',
+            '        let a[Main.next()] = Main.next();',
+            '        do Output.printInt(a[1]);',
+            '        do Output.printInt(a[2]);',
+            '        let flag = 5;',
+            '        if (flag) {',
+            '            do Output.printInt(1);',
+            '        } else {',
+            '            do Output.printInt(2);',
+            '        }',
+            '        while (flag) {',
+            '            let flag = 0;',
+            '            do Output.printInt(3);',
+            '        }',
+            '        do Output.printInt(7 / -2);',
+            '        do Output.printInt(200 * 200);',
+            '        return;',
+            '    }',
+            '}',
+        ])
+        runtime = PyRuntime()
+        runtime.load_source(source, 'Main')
+        runtime.run()
+
+        # The index is evaluated before the value, only -1 is true
+        # and arithmetic wraps around at 16 bits.
+        self.assertEqual(runtime.output_text(), '202-3-25536')
+        self.assertEqual(runtime.output_text(), _emulate([('Main', source)]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+# Tests of the source maps of generated VM code.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import JackCompiler
+from SourceMap import encode, decode, read_map
+from VMEmulator import VMEmulator
+
+MAIN = '\n'.join([
+    'class Main {',
+    '    function void main() {',
+    '        var int i, unused;',
+    '        let unused = 7;',
+    '        while (i < 4) {',
+    '            do Output.printInt(i);',
+    '            let i = i + 1;',
+    '        }',
+    '        return;',
+    '    }',
+    '}',
+])
+
+
+class SourceMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.directory, 'Main.jack')
+        with open(self.file_path, 'w') as f:
+            f.write(MAIN)
+        self.vm_path = os.path.join(self.directory, 'Main.vm')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _compile(self, optimize):
+        JackCompiler.compile(self.file_path, self.directory, optimize=optimize,
+                             source_map=True, verbose=False)
+        with open(self.vm_path) as f:
+            commands = f.read().splitlines()
+        source, lines = read_map(self.vm_path)
+
+        self.assertEqual(source, 'Main.jack')
+        self.assertEqual(len(lines), len(commands))
+
+        return dict((command, line) for command, line in zip(commands, lines))
+
+    def test_encoding(self):
+        lines = [2, 2, 3, 1, 1, 1, 9]
+
+        self.assertEqual(encode(lines), '2:2,1:1,-2:3,8:1')
+        self.assertEqual(decode(encode(lines)), lines)
+        self.assertEqual(decode(encode([])), [])
+
+    def test_commands_mapped_to_their_lines(self):
+        for optimize in [False, True]:
+            lines = self._compile(optimize)
+
+            self.assertEqual(lines['function Main.main 2' if not optimize else
+                                   'function Main.main 1'], 2)
+            self.assertEqual(lines['push constant 4'], 5)
+            self.assertEqual(lines['call Output.printInt 1'], 6)
+            self.assertEqual(lines['return'], 9)
+
+    def test_profile_per_line(self):
+        self._compile(optimize=False)
+        emulator = VMEmulator()
+        emulator.load_file(self.directory)
+        emulator.run()
+
+        per_line = emulator.profile()['lines']
+
+        # The call, its argument and the dropped result, 4 times.
+        self.assertEqual(per_line['Main.jack:6'], 3 * 4)
+        self.assertEqual(per_line['Main.jack:4'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
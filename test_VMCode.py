@@ -0,0 +1,77 @@
+# Tests of the in-memory VM code and its sinks.
+
+import io
+import os
+import unittest
+
+from JackCompiler import compile_source, _compile_source
+from VMCode import BinarySink, FunctionCode, MemorySink, NullSink, TextSink, read_binary
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'samples')
+
+with open(os.path.join(SAMPLES, 'List', 'List.jack')) as f:
+    LIST = f.read()
+
+
+def _functions(source, class_name, optimize=False):
+
+    sink = MemorySink()
+    _compile_source(source, class_name, sink, optimize=optimize)
+
+    return sink.functions
+
+
+class FunctionCodeTest(unittest.TestCase):
+
+    def test_text_round_trip(self):
+        commands = ['function Main.f 2', 'push constant 40000', 'pop local 1',
+                    'label LOOP', 'if-goto LOOP', 'call Main.g 3', 'return']
+
+        code = FunctionCode.from_text(commands, [1, 2, 2, 3, 3, 4, 5])
+
+        self.assertEqual(code.text(), commands)
+        self.assertEqual(code.names, ['Main.f', 'LOOP', 'Main.g'])
+        self.assertEqual(code.lines.tolist(), [1, 2, 2, 3, 3, 4, 5])
+        self.assertRaises(ValueError, code.append_text, 'push nowhere 1')
+
+    def test_cut_and_extend(self):
+        code = FunctionCode.from_text(['function Main.f 0', 'goto END', 'label END', 'return'])
+
+        tail = code.cut(2)
+        code.extend(tail)
+
+        self.assertEqual(code.text(), ['function Main.f 0', 'goto END', 'label END', 'return'])
+        self.assertEqual(tail.text(), ['label END', 'return'])
+
+    def test_sinks_agree(self):
+        for optimize in [False, True]:
+            functions = _functions(LIST, 'List', optimize)
+            text = io.StringIO()
+            binary = io.BytesIO()
+            null = NullSink()
+            for sink in [TextSink(text), BinarySink(binary), null]:
+                for code in functions:
+                    sink.write_function(code)
+                sink.close()
+
+            self.assertEqual(text.getvalue(), compile_source(LIST, 'List', optimize=optimize))
+            read = read_binary(binary.getvalue())
+            self.assertEqual([code.text() for code in read], [code.text() for code in functions])
+            self.assertEqual([code.lines.tolist() for code in read],
+                             [code.lines.tolist() for code in functions])
+            self.assertEqual((null.n_functions, null.n_commands),
+                             (len(functions), sum(len(code) for code in functions)))
+
+    def test_wide_operands_stored(self):
+        code = FunctionCode.from_text(['function Main.f 0', 'push constant 7', 'return'],
+                                      [1, 70000, 2])
+
+        read, offset = FunctionCode.from_bytes(code.to_bytes())
+
+        self.assertEqual(read.lines.tolist(), [1, 70000, 2])
+        self.assertEqual(offset, len(code.to_bytes()))
+        self.assertRaises(ValueError, read_binary, b'nope')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# Tests of the VM emulator and its profiler.
+
+import unittest
+
+from VMEmulator import VMEmulator, VMError, HEAP_BASE
+
+ADD = '\n'.join([
+    'function Main.main 0',
+    'push constant 1',
+    'push constant 2',
+    'add',
+    'return',
+])
+
+# Stores 1234 into a heap block, then recurses forever.
+RECURSION = '\n'.join([
+    'function Main.main 0',
+    'push constant 1',
+    'call Array.new 1',
+    'pop pointer 1',
+    'push constant 1234',
+    'pop that 0',
+    'push constant 0',
+    'call Main.f 1',
+    'return',
+    'function Main.f 1',
+    'push argument 0',
+    'push constant 1',
+    'add',
+    'call Main.f 1',
+    'return',
+])
+
+
+def _load(vm_code):
+
+    emulator = VMEmulator()
+    emulator.load_vm(vm_code)
+
+    return emulator
+
+
+class RunTest(unittest.TestCase):
+
+    def test_result_and_profile(self):
+        emulator = _load(ADD)
+
+        self.assertEqual(emulator.run(), 3)
+        profile = emulator.profile()
+        self.assertEqual(profile['steps'], 5)
+        self.assertEqual(profile['functions'], {'Main.main': 5})
+        self.assertEqual(profile['opcodes'], {'function': 1, 'push': 2, 'add': 1, 'return': 1})
+        self.assertEqual(profile['calls'], {'Main.main': 1})
+        # The entry frame and the two constants.
+        self.assertEqual(profile['max_stack_depth'], 5 + 2)
+
+    def test_step_limit_is_exact(self):
+        self.assertEqual(_load(ADD).run(max_steps=5), 3)
+        with self.assertRaises(VMError):
+            _load(ADD).run(max_steps=4)
+
+    def test_stack_overflow_spares_heap(self):
+        emulator = _load(RECURSION)
+
+        with self.assertRaisesRegex(VMError, 'Stack overflow'):
+            emulator.run(max_steps=100000)
+        self.assertEqual(emulator.ram[HEAP_BASE + 1], 1234)
+        self.assertLessEqual(emulator.profile()['max_stack_depth'], HEAP_BASE - 256)
+
+
+if __name__ == '__main__':
+    unittest.main()
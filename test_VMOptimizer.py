@@ -0,0 +1,281 @@
+# Tests of the optimization passes: every pass alone must leave what a
+# program prints and the memory it leaves behind unchanged.
+
+import unittest
+
+from JackCompiler import compile_source
+from VMEmulator import VMEmulator, STATIC_BASE, STACK_BASE, HEAP_BASE, HEAP_END
+from VMOptimizer import (optimize, LivenessPass, LoopInvariantPass, JumpThreadingPass,
+                         ArrayAddressPass, OperandOrderPass, stack_depth)
+
+
+def _optimize(vm_code, the_pass):
+    """
+    :return: String. The VM code with the_pass run over each function alone.
+    """
+
+    functions = []
+    for line in vm_code.splitlines():
+        if line.startswith('function'):
+            functions.append([])
+        if line:
+            functions[-1].append(line)
+
+    return '\n'.join('\n'.join(optimize(code, [the_pass])) for code in functions)
+
+
+def _run(vm_code):
+    """
+    :return: VMEmulator. The emulator, after running the code.
+    """
+
+    emulator = VMEmulator()
+    emulator.load_vm(vm_code)
+    emulator.run(max_steps=1000000)
+
+    return emulator
+
+
+class PassTest(unittest.TestCase):
+
+    def assertSameBehaviour(self, source, the_pass):
+        """
+        Compile source as class Main, run it with and without the pass.
+
+        :return: Tuple (plain run, optimized run) of VMEmulator.
+        """
+
+        vm_code = compile_source(source, 'Main', optimize=False)
+        plain = _run(vm_code)
+        optimized = _run(_optimize(vm_code, the_pass))
+
+        self.assertEqual(plain.output_text(), optimized.output_text())
+        self.assertEqual(plain.ram[STATIC_BASE:STACK_BASE], optimized.ram[STATIC_BASE:STACK_BASE])
+        self.assertEqual(plain.ram[HEAP_BASE:HEAP_END], optimized.ram[HEAP_BASE:HEAP_END])
+
+        return plain, optimized
+
+
+class LivenessTest(PassTest):
+
+    def test_dead_store_and_packed_locals(self):
+        source = '\n'.join([
+            'class Main {',
+            '    static int total;',
+            '    function void main() {',
+            '        var int a, b, i, unused;',
+            '        let unused = 5;',
+            '        let a = 3;',
+            '        do Output.printInt(a * 2);',
+            '        let i = 0;',
+            '        let b = 0;',
+            '        while (i < 4) {',
+            '            let b = b + i;',
+            '            let i = i + 1;',
+            '        }',
+            '        let total = b;',
+            '        do Output.printInt(b);',
+            '        return;',
+            '    }',
+            '}',
+        ])
+        the_pass = LivenessPass()
+
+        plain, optimized = self.assertSameBehaviour(source, the_pass)
+
+        self.assertEqual(plain.output_text(), '66')
+        self.assertEqual(the_pass.stats['dead_stores_removed'], 1)
+        # 'a' is dead once printed, its slot is reused by the loop.
+        self.assertEqual(the_pass.stats['locals_declared'], 4)
+        self.assertEqual(the_pass.stats['locals_allocated'], 2)
+        self.assertLess(optimized.profile()['steps'], plain.profile()['steps'])
+
+
+
+class LoopInvariantTest(PassTest):
+
+    def test_invariant_product_hoisted(self):
+        source = '\n'.join([
+            'class Main {',
+            '    function void main() {',
+            '        var int i, k, sum;',
+            '        var Array a;',
+            '        let a = Array.new(5);',
+            '        let k = 3;',
+            '        while (i < 5) {',
+            '            let a[i] = (k * 7) + i;',
+            '            let sum = sum + (k * 7);',
+            '            let i = i + 1;',
+            '        }',
+            '        do Output.printInt(sum);',
+            '        do Output.printInt(a[4]);',
+            '        return;',
+            '    }',
+            '}',
+        ])
+        the_pass = LoopInvariantPass()
+
+        plain, optimized = self.assertSameBehaviour(source, the_pass)
+
+        self.assertEqual(plain.output_text(), '10525')
+        self.assertEqual(the_pass.stats, {'loops': 1, 'expressions_hoisted': 1})
+        self.assertEqual(optimized.profile()['calls']['Math.multiply'], 1)
+
+    def test_variant_product_kept(self):
+        source = '\n'.join([
+            'class Main {',
+            '    function void main() {',
+            '        var int i, k, sum;',
+            '        while (i < 5) {',
+            '            let sum = sum + (k * 7);',
+            '            let k = k + 1;',
+            '            let i = i + 1;',
+            '        }',
+            '        do Output.printInt(sum);',
+            '        return;',
+            '    }',
+            '}',
+        ])
+        the_pass = LoopInvariantPass()
+
+        plain, optimized = self.assertSameBehaviour(source, the_pass)
+
+        self.assertEqual(plain.output_text(), '70')
+        self.assertEqual(the_pass.stats['expressions_hoisted'], 0)
+
+
+
+class JumpThreadingTest(PassTest):
+
+    def test_nested_ifs_ending_in_return(self):
+        source = '\n'.join([
+            'class Main {',
+            '    function int sign(int x) {',
+            '        if (x < 0) {',
+            '            return -1;',
+            '        } else {',
+            '            if (x > 0) {',
+            '                return 1;',
+            '            }',
+            '        }',
+            '        return 0;',
+            '    }',
+            '    function void main() {',
+            '        var int i;',
+            '        while (i < 3) {',
+            '            if (i = 1) {',
+            '                do Output.printInt(Main.sign(-5));',
+            '            } else {',
+            '                do Output.printInt(Main.sign(i));',
+            '            }',
+            '            let i = i + 1;',
+            '        }',
+            '        return;',
+            '    }',
+            '}',
+        ])
+        the_pass = JumpThreadingPass()
+
+        plain, optimized = self.assertSameBehaviour(source, the_pass)
+
+        self.assertEqual(plain.output_text(), '0-11')
+        # The inner if jumps straight to 'return 0', the gotos
+        # after 'return 1' can never run.
+        self.assertEqual(the_pass.stats['jumps_threaded'], 2)
+        self.assertEqual(the_pass.stats['unreachable_removed'], 2)
+        self.assertEqual(the_pass.stats['labels_removed'], 2)
+        self.assertLess(optimized.profile()['steps'], plain.profile()['steps'])
+
+
+
+class ArrayAddressTest(PassTest):
+
+    def test_address_reused_by_read_and_store(self):
+        source = '\n'.join([
+            'class Main {',
+            '    function void main() {',
+            '        var Array a;',
+            '        var int i, s;',
+            '        let a = Array.new(4);',
+            '        while (i < 4) {',
+            '            let a[i] = i * i;',
+            '            let a[i] = a[i] + 1;',
+            '            let s = s + a[i];',
+            '            let i = i + 1;',
+            '        }',
+            '        do Output.printInt(s);',
+            '        return;',
+            '    }',
+            '}',
+        ])
+        the_pass = ArrayAddressPass()
+
+        plain, optimized = self.assertSameBehaviour(source, the_pass)
+
+        self.assertEqual(plain.output_text(), '18')
+        self.assertEqual(the_pass.stats, {'addresses_reused': 1, 'stores_simplified': 1})
+        self.assertLess(optimized.profile()['steps'], plain.profile()['steps'])
+
+    def test_address_forgotten_after_index_write(self):
+        source = '\n'.join([
+            'class Main {',
+            '    function void main() {',
+            '        var Array a;',
+            '        var int i;',
+            '        let a = Array.new(3);',
+            '        let a[0] = 5;',
+            '        let a[1] = 6;',
+            '        let i = a[0];',
+            '        let i = i + 1;',
+            '        let a[i - 5] = a[i - 5] + 1;',
+            '        do Output.printInt(a[0]);',
+            '        do Output.printInt(a[1]);',
+            '        return;',
+            '    }',
+            '}',
+        ])
+
+        plain, optimized = self.assertSameBehaviour(source, ArrayAddressPass())
+
+        self.assertEqual(plain.output_text(), '57')
+
+
+
+class OperandOrderTest(PassTest):
+
+    SOURCE = '\n'.join([
+        'class Main {',
+        '    function void main() {',
+        '        var int a, b, c;',
+        '        let a = 1;',
+        '        let b = 2;',
+        '        let c = 3;',
+        '        do Output.printInt(a + (b * (c + (a - b))));',
+        '        return;',
+        '    }',
+        '}',
+    ])
+
+    def test_stack_depth_matches_emulator(self):
+        vm_code = compile_source(self.SOURCE, 'Main', optimize=False)
+        emulator = _run(vm_code)
+
+        depth = stack_depth([line.split() for line in vm_code.splitlines() if line])
+
+        # The entry frame is 5 words, followed by the 3 locals.
+        self.assertEqual(depth, 5)
+        self.assertEqual(emulator.max_stack_depth, 5 + 3 + depth)
+
+    def test_deeper_operand_first(self):
+        the_pass = OperandOrderPass()
+
+        plain, optimized = self.assertSameBehaviour(self.SOURCE, the_pass)
+
+        self.assertEqual(plain.output_text(), '5')
+        # 'c + (a - b)' becomes '(a - b) + c'.
+        self.assertEqual(the_pass.stats, {'operands_swapped': 1, 'stack_slots_saved': 1})
+        self.assertEqual(optimized.max_stack_depth, plain.max_stack_depth - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()